@@ -1,15 +1,35 @@
 import discord
 from discord.ext import commands
 from discord import app_commands, ui
+import abc
 import asyncio
+import bisect
+import csv
+import functools
+import glob
+import gzip
+import heapq
+import io
+import json
 import os
+import queue
+import re
+import shutil
 import sqlite3
+import threading
 import uuid
-from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta, timezone
 from dotenv import load_dotenv
+import aiofiles
+import backoff
 import time
 import asyncio
 import pytz
+import pymysql
+import pymysql.cursors
 
 # Cargar variables de entorno
 load_dotenv()
@@ -17,69 +37,1938 @@ TOKEN = os.getenv('DISCORD_TOKEN')
 
 # Configuración para SQLite
 DB_PATH = os.getenv('DB_PATH', 'santiago_rp.db')
+DB_READ_WORKERS = int(os.getenv('DB_READ_WORKERS', 2))
+
+# Backend de almacenamiento: 'sqlite' (archivo local, por defecto) o 'mysql'
+DB_BACKEND = os.getenv('DB_BACKEND', 'sqlite').lower()
+MYSQL_HOST = os.getenv('MYSQL_HOST', 'localhost')
+MYSQL_PORT = int(os.getenv('MYSQL_PORT', 3306))
+MYSQL_USER = os.getenv('MYSQL_USER', 'santiago_rp')
+MYSQL_PASSWORD = os.getenv('MYSQL_PASSWORD', '')
+MYSQL_DATABASE = os.getenv('MYSQL_DATABASE', 'santiago_rp')
+MYSQL_POOL_TIMEOUT = float(os.getenv('MYSQL_POOL_TIMEOUT', 30))
+
+# Zona horaria usada para mostrar fechas (en la base se guardan como epoch UTC)
+SANTIAGO_TZ = pytz.timezone("America/Santiago")
 
 # Configuración del bot con intenciones
 intents = discord.Intents.all()
-bot = commands.Bot(command_prefix='!', intents=intents, help_command=None)
+
+class SantiagoBot(commands.Bot):
+    """Bot de Santiago RP con ganchos de arranque y cierre."""
+    async def close(self):
+        # Confirmar las escrituras diferidas, los logs y los DMs pendientes antes de desconectar
+        await flush_write_queues()
+        await flush_log_dispatchers()
+        await dm_outbox.drain()
+        action_scheduler.stop()
+        await super().close()
+
+bot = SantiagoBot(command_prefix='!', intents=intents, help_command=None)
 
 # =============================================
 # BASE DE DATOS
 # =============================================
-def get_db_connection():
-    """Obtener conexión a la base de datos SQLite."""
+# Pragmas aplicados a cada conexión del pool: WAL permite lecturas concurrentes con
+# un escritor, synchronous=NORMAL evita un fsync por transacción en modo WAL y el
+# cache_size negativo se expresa en KiB (~20 MB de caché de páginas por conexión).
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-20000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA busy_timeout=5000",
+)
+SQLITE_STATEMENT_CACHE = 256
+
+def to_epoch_ms(value: datetime) -> int:
+    """Convertir un datetime a epoch en milisegundos (los naive se interpretan en hora local)."""
+    return int(round(value.timestamp() * 1000))
+
+def from_epoch_ms(value: int) -> datetime:
+    """Convertir epoch en milisegundos a un datetime UTC con zona horaria."""
+    return datetime.fromtimestamp(value / 1000, tz=timezone.utc)
+
+def format_santiago(value: datetime) -> str:
+    """Formatear una fecha en hora de Santiago para mostrarla en embeds."""
+    return value.astimezone(SANTIAGO_TZ).strftime('%d/%m/%Y %H:%M')
+
+def week_key_for(value: datetime) -> int:
+    """Clave de semana ISO (año * 100 + semana) de una fecha en hora de Santiago."""
+    iso_year, iso_week, _ = value.astimezone(SANTIAGO_TZ).isocalendar()
+    return iso_year * 100 + iso_week
+
+def shift_week_key(week_key: int, weeks: int) -> int:
+    """Desplazar una clave de semana ISO en `weeks` semanas."""
+    monday = date.fromisocalendar(week_key // 100, week_key % 100, 1) + timedelta(weeks=weeks)
+    iso_year, iso_week, _ = monday.isocalendar()
+    return iso_year * 100 + iso_week
+
+def format_week_key(week_key: int) -> str:
+    """Formatear una clave de semana como 2025-W07."""
+    return f"{week_key // 100}-W{week_key % 100:02d}"
+
+# IDs compactos ordenados por tiempo (estilo snowflake): milisegundos desde ID_EPOCH_MS
+# desplazados ID_SEQUENCE_BITS bits más una secuencia. Caben en un INTEGER PRIMARY KEY,
+# por lo que las inserciones siempre van al final del árbol B.
+ID_EPOCH_MS = 1704067200000  # 2024-01-01 UTC
+ID_SEQUENCE_BITS = 12
+ID_SEQUENCE_MASK = (1 << ID_SEQUENCE_BITS) - 1
+CROCKFORD_ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+
+class RecordIdGenerator:
+    """Generador de IDs enteros únicos y crecientes para sanciones y calificaciones."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._last_ms = 0
+        self._sequence = 0
+
+    def next_id(self, at_ms: int = None) -> int:
+        """Generar un ID para el instante `at_ms` (por defecto, ahora)."""
+        with self._lock:
+            ms = max(int(time.time() * 1000) if at_ms is None else at_ms, ID_EPOCH_MS, self._last_ms)
+            if ms == self._last_ms:
+                self._sequence += 1
+                if self._sequence > ID_SEQUENCE_MASK:
+                    ms += 1
+                    self._sequence = 0
+            else:
+                self._sequence = 0
+            self._last_ms = ms
+            return ((ms - ID_EPOCH_MS) << ID_SEQUENCE_BITS) | self._sequence
+
+    def observe(self, record_id: int):
+        """Avanzar el generador para no repetir IDs ya presentes en la base."""
+        with self._lock:
+            ms = (record_id >> ID_SEQUENCE_BITS) + ID_EPOCH_MS
+            if (ms, record_id & ID_SEQUENCE_MASK) > (self._last_ms, self._sequence):
+                self._last_ms = ms
+                self._sequence = record_id & ID_SEQUENCE_MASK
+
+record_ids = RecordIdGenerator()
+
+def record_id_floor(value: datetime) -> int:
+    """Menor ID posible generado en el instante `value` (para filtrar por fecha vía ID)."""
+    return max(to_epoch_ms(value) - ID_EPOCH_MS, 0) << ID_SEQUENCE_BITS
+
+def format_public_id(record_id: int) -> str:
+    """Código público en base32 Crockford de un ID (el que se cita en apelaciones)."""
+    code = ""
+    while True:
+        record_id, remainder = divmod(record_id, 32)
+        code = CROCKFORD_ALPHABET[remainder] + code
+        if not record_id:
+            return code
+
+def parse_public_id(code: str) -> int:
+    """Convertir un código público a ID; tolera minúsculas, guiones y caracteres ambiguos."""
+    normalized = code.strip().upper().replace("-", "").translate(str.maketrans("OIL", "011"))
+    if not normalized:
+        raise ValueError("Código vacío")
+    record_id = 0
+    for char in normalized:
+        index = CROCKFORD_ALPHABET.find(char)
+        if index < 0:
+            raise ValueError(f"Carácter inválido en el código: {char}")
+        record_id = record_id * 32 + index
+    return record_id
+
+# Los datetime se guardan como enteros (columnas declaradas EPOCH_MS) y se
+# decodifican de vuelta al leer, así el orden y los rangos son numéricos.
+sqlite3.register_adapter(datetime, to_epoch_ms)
+sqlite3.register_converter("EPOCH_MS", lambda value: from_epoch_ms(int(value)))
+
+def get_db_connection(path: str = None):
+    """Abrir una nueva conexión SQLite configurada con los pragmas del bot.
+
+    `path` (por defecto DB_PATH) puede ser una URI `file:`; p. ej.
+    `file:pruebas?mode=memory&cache=shared` comparte una base en memoria entre las
+    conexiones del pool mientras alguna siga abierta.
+    """
+    path = path or DB_PATH
     try:
-        connection = sqlite3.connect(DB_PATH)
+        connection = sqlite3.connect(
+            path,
+            uri=path.startswith("file:"),
+            check_same_thread=False,
+            isolation_level=None,  # Autocommit: las transacciones se abren con unit_of_work()
+            cached_statements=SQLITE_STATEMENT_CACHE,
+            detect_types=sqlite3.PARSE_DECLTYPES
+        )
         connection.row_factory = sqlite3.Row
+        for pragma in SQLITE_PRAGMAS:
+            connection.execute(pragma)
+        connection.set_trace_callback(trace_statement)
         return connection
     except sqlite3.Error as e:
         print(f"Error al conectar a SQLite: {e}")
         raise
 
-def init_db():
-    """Inicializar la base de datos SQLite para sanciones y calificaciones."""
-    print("Inicializando base de datos SQLite...")
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        # Tabla de sanciones
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS sanciones (
-                sanction_id TEXT PRIMARY KEY,
-                user_id INTEGER,
-                username TEXT,
-                reason TEXT,
-                sanction_type TEXT,
-                proof_url TEXT,
-                admin_id INTEGER,
-                admin_name TEXT,
-                date TIMESTAMP,
-                active INTEGER
+class SQLiteConnectionPool:
+    """Pool de conexiones SQLite de larga duración compartido por los hilos de la base de datos."""
+    def __init__(self, size: int, path: str = None):
+        self.size = size
+        self.path = path or DB_PATH
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _acquire(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                connection = get_db_connection(self.path)
+                self._created += 1
+                return connection
+        return self._idle.get()
+
+    def _release(self, connection: sqlite3.Connection):
+        if connection.in_transaction:
+            # Nunca devolver al pool una conexión con una transacción abierta
+            connection.rollback()
+        self._idle.put(connection)
+
+    @contextmanager
+    def connection(self):
+        """Prestar una conexión del pool durante el bloque `with`."""
+        connection = self._acquire()
+        try:
+            yield connection
+        finally:
+            self._release(connection)
+
+    def close_all(self):
+        """Cerrar todas las conexiones inactivas del pool."""
+        while True:
+            try:
+                connection = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            connection.close()
+            with self._lock:
+                self._created -= 1
+
+# Una conexión por hilo lector más una para el hilo escritor
+db_pool = SQLiteConnectionPool(size=int(os.getenv('DB_POOL_SIZE', DB_READ_WORKERS + 1)))
+
+@contextmanager
+def unit_of_work():
+    """Ejecutar varias sentencias en una única transacción (BEGIN IMMEDIATE ... COMMIT)."""
+    with db_pool.connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+# =============================================
+# MÉTRICAS DE CONSULTAS
+# =============================================
+# Cada llamada al repositorio de almacenamiento se mide: latencia (histograma), filas y
+# errores por método. Las llamadas que superan DB_SLOW_QUERY_MS se registran en consola
+# junto con el plan de ejecución de las sentencias que ejecutaron. Las métricas se
+# publican en /metrics del servidor web.
+DB_SLOW_QUERY_MS = float(os.getenv('DB_SLOW_QUERY_MS', 200))
+SLOW_QUERY_MAX_STATEMENTS = 5
+QUERY_LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)  # segundos
+EXPLAINABLE_STATEMENTS = ("SELECT", "WITH", "UPDATE", "DELETE")
+# Control de transacciones y sentencias internas de sqlite3 (comentarios): no se registran
+UNTRACED_STATEMENTS = ("--", "BEGIN", "COMMIT", "ROLLBACK")
+
+_query_trace = threading.local()
+
+def trace_statement(statement: str):
+    """Guardar una sentencia ejecutada durante una llamada medida (callback de trazas)."""
+    statements = getattr(_query_trace, "statements", None)
+    if statements is None or len(statements) >= SLOW_QUERY_MAX_STATEMENTS:
+        return
+    if not statement.lstrip().upper().startswith(UNTRACED_STATEMENTS):
+        statements.append(statement)
+
+class QueryStats:
+    """Histogramas de latencia y contadores de filas por consulta, seguros entre hilos."""
+    def __init__(self, buckets: tuple = QUERY_LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._queries = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name: str, elapsed: float, rows: int, failed: bool = False, slow: bool = False):
+        """Registrar una llamada de `elapsed` segundos."""
+        with self._lock:
+            entry = self._queries.get(name)
+            if entry is None:
+                entry = self._queries[name] = {
+                    "count": 0, "errors": 0, "slow": 0, "rows": 0, "sum": 0.0, "max": 0.0,
+                    "buckets": [0] * (len(self.buckets) + 1),
+                }
+            entry["count"] += 1
+            entry["errors"] += int(failed)
+            entry["slow"] += int(slow)
+            entry["rows"] += rows
+            entry["sum"] += elapsed
+            entry["max"] = max(entry["max"], elapsed)
+            entry["buckets"][bisect.bisect_left(self.buckets, elapsed)] += 1
+
+    def snapshot(self) -> dict:
+        """Copia de los contadores actuales por consulta."""
+        with self._lock:
+            return {name: dict(entry, buckets=list(entry["buckets"])) for name, entry in self._queries.items()}
+
+    def render_prometheus(self) -> str:
+        """Métricas en el formato de texto de Prometheus (buckets acumulados)."""
+        lines = [
+            "# HELP santiago_db_query_duration_seconds Latencia de las llamadas a la base de datos.",
+            "# TYPE santiago_db_query_duration_seconds histogram",
+        ]
+        counters = {"rows": [], "errors": [], "slow": []}
+        for name, entry in sorted(self.snapshot().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), entry["buckets"]):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'santiago_db_query_duration_seconds_bucket{{query="{name}",le="{le}"}} {cumulative}')
+            lines.append(f'santiago_db_query_duration_seconds_sum{{query="{name}"}} {entry["sum"]:.6f}')
+            lines.append(f'santiago_db_query_duration_seconds_count{{query="{name}"}} {entry["count"]}')
+            for key in counters:
+                counters[key].append(f'{{query="{name}"}} {entry[key]}')
+        for key, help_text in (
+            ("rows", "Filas leídas o escritas."),
+            ("errors", "Llamadas que terminaron en error."),
+            ("slow", f"Llamadas más lentas que {DB_SLOW_QUERY_MS:g} ms."),
+        ):
+            metric = f"santiago_db_query_{key}_total"
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} counter")
+            lines.extend(f"{metric}{sample}" for sample in counters[key])
+        return "\n".join(lines) + "\n"
+
+query_stats = QueryStats()
+
+def count_result_rows(args: tuple, result) -> int:
+    """Filas afectadas por una llamada: las devueltas, el rowcount que devuelve o, en escrituras por lotes, las enviadas."""
+    if isinstance(result, list):
+        return len(result)
+    if isinstance(result, int):
+        return result
+    if args and isinstance(args[0], list):
+        return len(args[0])
+    return 0 if result is None else 1
+
+# =============================================
+# MIGRACIONES DE ESQUEMA
+# =============================================
+# Cada migración se registra con un número de versión y se aplica una sola vez, en
+# orden, dentro de su propia transacción. Las versiones aplicadas quedan registradas
+# en la tabla schema_migrations.
+MIGRATIONS = []
+
+def migration(version: int, description: str):
+    """Registrar una función como migración de esquema."""
+    def decorator(func):
+        MIGRATIONS.append((version, description, func))
+        return func
+    return decorator
+
+@migration(1, "Tablas de sanciones y calificaciones")
+def _migration_001_tablas(conn: sqlite3.Connection):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS sanciones (
+            sanction_id TEXT PRIMARY KEY,
+            user_id INTEGER,
+            username TEXT,
+            reason TEXT,
+            sanction_type TEXT,
+            proof_url TEXT,
+            admin_id INTEGER,
+            admin_name TEXT,
+            date TIMESTAMP,
+            active INTEGER
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS calificaciones (
+            rating_id TEXT PRIMARY KEY,
+            staff_id INTEGER,
+            staff_name TEXT,
+            rating INTEGER,
+            comment TEXT,
+            user_id INTEGER,
+            user_name TEXT,
+            date TIMESTAMP
+        )
+    ''')
+
+@migration(2, "Índices para consultas por usuario y por staff")
+def _migration_002_indices(conn: sqlite3.Connection):
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_sanciones_user_active_date ON sanciones(user_id, active, date)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_calificaciones_staff ON calificaciones(staff_id, rating)')
+
+def _legacy_timestamp_to_epoch_ms(value):
+    """Convertir un TIMESTAMP antiguo guardado como texto a epoch en milisegundos."""
+    if value is None or isinstance(value, int):
+        return value
+    return to_epoch_ms(datetime.fromisoformat(value))
+
+@migration(3, "Fechas como epoch en milisegundos")
+def _migration_003_fechas_epoch(conn: sqlite3.Connection):
+    conn.create_function("legacy_epoch_ms", 1, _legacy_timestamp_to_epoch_ms, deterministic=True)
+    conn.execute('''
+        CREATE TABLE sanciones_new (
+            sanction_id TEXT PRIMARY KEY,
+            user_id INTEGER,
+            username TEXT,
+            reason TEXT,
+            sanction_type TEXT,
+            proof_url TEXT,
+            admin_id INTEGER,
+            admin_name TEXT,
+            date EPOCH_MS,
+            active INTEGER
+        )
+    ''')
+    conn.execute('''
+        INSERT INTO sanciones_new
+        SELECT sanction_id, user_id, username, reason, sanction_type, proof_url, admin_id, admin_name,
+               legacy_epoch_ms(date), active
+        FROM sanciones
+    ''')
+    conn.execute('DROP TABLE sanciones')
+    conn.execute('ALTER TABLE sanciones_new RENAME TO sanciones')
+    conn.execute('CREATE INDEX idx_sanciones_user_active_date ON sanciones(user_id, active, date)')
+
+    conn.execute('''
+        CREATE TABLE calificaciones_new (
+            rating_id TEXT PRIMARY KEY,
+            staff_id INTEGER,
+            staff_name TEXT,
+            rating INTEGER,
+            comment TEXT,
+            user_id INTEGER,
+            user_name TEXT,
+            date EPOCH_MS
+        )
+    ''')
+    conn.execute('''
+        INSERT INTO calificaciones_new
+        SELECT rating_id, staff_id, staff_name, rating, comment, user_id, user_name, legacy_epoch_ms(date)
+        FROM calificaciones
+    ''')
+    conn.execute('DROP TABLE calificaciones')
+    conn.execute('ALTER TABLE calificaciones_new RENAME TO calificaciones')
+    conn.execute('CREATE INDEX idx_calificaciones_staff ON calificaciones(staff_id, rating)')
+
+    # El registro de migraciones también pasa a epoch
+    conn.execute('CREATE TABLE schema_migrations_new (version INTEGER PRIMARY KEY, description TEXT, applied_at EPOCH_MS)')
+    conn.execute('''
+        INSERT INTO schema_migrations_new
+        SELECT version, description, legacy_epoch_ms(applied_at) FROM schema_migrations
+    ''')
+    conn.execute('DROP TABLE schema_migrations')
+    conn.execute('ALTER TABLE schema_migrations_new RENAME TO schema_migrations')
+
+@migration(4, "Agregados de calificaciones por staff")
+def _migration_004_staff_rating_stats(conn: sqlite3.Connection):
+    conn.execute('''
+        CREATE TABLE staff_rating_stats (
+            staff_id INTEGER PRIMARY KEY,
+            staff_name TEXT,
+            rating_sum INTEGER NOT NULL DEFAULT 0,
+            rating_count INTEGER NOT NULL DEFAULT 0,
+            stars_1 INTEGER NOT NULL DEFAULT 0,
+            stars_2 INTEGER NOT NULL DEFAULT 0,
+            stars_3 INTEGER NOT NULL DEFAULT 0,
+            stars_4 INTEGER NOT NULL DEFAULT 0,
+            stars_5 INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    conn.execute('''
+        INSERT INTO staff_rating_stats
+        SELECT staff_id, MAX(staff_name), SUM(rating), COUNT(rating),
+               SUM(rating = 1), SUM(rating = 2), SUM(rating = 3), SUM(rating = 4), SUM(rating = 5)
+        FROM calificaciones
+        GROUP BY staff_id
+    ''')
+
+@migration(5, "Particiones semanales de calificaciones")
+def _migration_005_semanas_calificaciones(conn: sqlite3.Connection):
+    # Todas las calificaciones existentes pertenecen al periodo en curso: el reinicio
+    # semanal anterior las borraba.
+    current_week = week_key_for(datetime.now(timezone.utc))
+    conn.execute('ALTER TABLE calificaciones ADD COLUMN week_key INTEGER')
+    conn.execute('UPDATE calificaciones SET week_key = ?', (current_week,))
+    conn.execute('CREATE INDEX idx_calificaciones_week_staff ON calificaciones(week_key, staff_id)')
+
+    conn.execute('''
+        CREATE TABLE staff_rating_stats_new (
+            week_key INTEGER NOT NULL,
+            staff_id INTEGER NOT NULL,
+            staff_name TEXT,
+            rating_sum INTEGER NOT NULL DEFAULT 0,
+            rating_count INTEGER NOT NULL DEFAULT 0,
+            stars_1 INTEGER NOT NULL DEFAULT 0,
+            stars_2 INTEGER NOT NULL DEFAULT 0,
+            stars_3 INTEGER NOT NULL DEFAULT 0,
+            stars_4 INTEGER NOT NULL DEFAULT 0,
+            stars_5 INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (week_key, staff_id)
+        )
+    ''')
+    conn.execute('''
+        INSERT INTO staff_rating_stats_new
+        SELECT ?, staff_id, staff_name, rating_sum, rating_count, stars_1, stars_2, stars_3, stars_4, stars_5
+        FROM staff_rating_stats
+    ''', (current_week,))
+    conn.execute('DROP TABLE staff_rating_stats')
+    conn.execute('ALTER TABLE staff_rating_stats_new RENAME TO staff_rating_stats')
+    conn.execute('CREATE INDEX idx_staff_rating_stats_staff ON staff_rating_stats(staff_id, week_key)')
+
+    conn.execute('CREATE TABLE bot_state (key TEXT PRIMARY KEY, value)')
+    conn.execute("INSERT INTO bot_state (key, value) VALUES ('active_rating_week', ?)", (current_week,))
+
+@migration(6, "IDs enteros ordenados por tiempo")
+def _migration_006_ids_compactos(conn: sqlite3.Connection):
+    # Los UUID anteriores se conservan en legacy_id para poder seguir citándolos
+    generator = RecordIdGenerator()
+    conn.execute('''
+        CREATE TABLE sanciones_new (
+            sanction_id INTEGER PRIMARY KEY,
+            user_id INTEGER,
+            username TEXT,
+            reason TEXT,
+            sanction_type TEXT,
+            proof_url TEXT,
+            admin_id INTEGER,
+            admin_name TEXT,
+            date EPOCH_MS,
+            active INTEGER,
+            legacy_id TEXT
+        )
+    ''')
+    old_rows = conn.execute('''
+        SELECT sanction_id, user_id, username, reason, sanction_type, proof_url, admin_id, admin_name,
+               date + 0 AS date_ms, active
+        FROM sanciones
+        ORDER BY date, rowid
+    ''')
+    conn.executemany(
+        'INSERT INTO sanciones_new VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+        ((generator.next_id(r['date_ms']),) + tuple(r)[1:] + (r['sanction_id'],) for r in old_rows)
+    )
+    conn.execute('DROP TABLE sanciones')
+    conn.execute('ALTER TABLE sanciones_new RENAME TO sanciones')
+    conn.execute('CREATE INDEX idx_sanciones_user_active_date ON sanciones(user_id, active, date)')
+    conn.execute('CREATE UNIQUE INDEX idx_sanciones_legacy_id ON sanciones(legacy_id) WHERE legacy_id IS NOT NULL')
+
+    conn.execute('''
+        CREATE TABLE calificaciones_new (
+            rating_id INTEGER PRIMARY KEY,
+            staff_id INTEGER,
+            staff_name TEXT,
+            rating INTEGER,
+            comment TEXT,
+            user_id INTEGER,
+            user_name TEXT,
+            date EPOCH_MS,
+            week_key INTEGER,
+            legacy_id TEXT
+        )
+    ''')
+    old_rows = conn.execute('''
+        SELECT rating_id, staff_id, staff_name, rating, comment, user_id, user_name, date + 0 AS date_ms, week_key
+        FROM calificaciones
+        ORDER BY date, rowid
+    ''')
+    conn.executemany(
+        'INSERT INTO calificaciones_new VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+        ((generator.next_id(r['date_ms']),) + tuple(r)[1:] + (r['rating_id'],) for r in old_rows)
+    )
+    conn.execute('DROP TABLE calificaciones')
+    conn.execute('ALTER TABLE calificaciones_new RENAME TO calificaciones')
+    conn.execute('CREATE INDEX idx_calificaciones_staff ON calificaciones(staff_id, rating)')
+    conn.execute('CREATE INDEX idx_calificaciones_week_staff ON calificaciones(week_key, staff_id)')
+    conn.execute('CREATE UNIQUE INDEX idx_calificaciones_legacy_id ON calificaciones(legacy_id) WHERE legacy_id IS NOT NULL')
+
+@migration(7, "Índices de texto completo (FTS5)")
+def _migration_007_busqueda_texto(conn: sqlite3.Connection):
+    # Tablas FTS5 de contenido externo: el texto vive solo en las tablas originales y
+    # los triggers mantienen el índice invertido al insertar, editar o borrar filas.
+    conn.execute('''
+        CREATE VIRTUAL TABLE sanciones_fts USING fts5(
+            reason, sanction_type, username,
+            content='sanciones', content_rowid='sanction_id',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+    ''')
+    conn.execute('''
+        CREATE TRIGGER sanciones_fts_insert AFTER INSERT ON sanciones BEGIN
+            INSERT INTO sanciones_fts (rowid, reason, sanction_type, username)
+            VALUES (new.sanction_id, new.reason, new.sanction_type, new.username);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER sanciones_fts_delete AFTER DELETE ON sanciones BEGIN
+            INSERT INTO sanciones_fts (sanciones_fts, rowid, reason, sanction_type, username)
+            VALUES ('delete', old.sanction_id, old.reason, old.sanction_type, old.username);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER sanciones_fts_update AFTER UPDATE OF reason, sanction_type, username ON sanciones BEGIN
+            INSERT INTO sanciones_fts (sanciones_fts, rowid, reason, sanction_type, username)
+            VALUES ('delete', old.sanction_id, old.reason, old.sanction_type, old.username);
+            INSERT INTO sanciones_fts (rowid, reason, sanction_type, username)
+            VALUES (new.sanction_id, new.reason, new.sanction_type, new.username);
+        END
+    ''')
+    conn.execute("INSERT INTO sanciones_fts (sanciones_fts) VALUES ('rebuild')")
+
+    conn.execute('''
+        CREATE VIRTUAL TABLE calificaciones_fts USING fts5(
+            comment, staff_name,
+            content='calificaciones', content_rowid='rating_id',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+    ''')
+    conn.execute('''
+        CREATE TRIGGER calificaciones_fts_insert AFTER INSERT ON calificaciones BEGIN
+            INSERT INTO calificaciones_fts (rowid, comment, staff_name)
+            VALUES (new.rating_id, new.comment, new.staff_name);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER calificaciones_fts_delete AFTER DELETE ON calificaciones BEGIN
+            INSERT INTO calificaciones_fts (calificaciones_fts, rowid, comment, staff_name)
+            VALUES ('delete', old.rating_id, old.comment, old.staff_name);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER calificaciones_fts_update AFTER UPDATE OF comment, staff_name ON calificaciones BEGIN
+            INSERT INTO calificaciones_fts (calificaciones_fts, rowid, comment, staff_name)
+            VALUES ('delete', old.rating_id, old.comment, old.staff_name);
+            INSERT INTO calificaciones_fts (rowid, comment, staff_name)
+            VALUES (new.rating_id, new.comment, new.staff_name);
+        END
+    ''')
+    conn.execute("INSERT INTO calificaciones_fts (calificaciones_fts) VALUES ('rebuild')")
+
+@migration(8, "Tickets persistentes con numeración por categoría")
+def _migration_008_tickets(conn: sqlite3.Connection):
+    conn.execute('''
+        CREATE TABLE tickets (
+            ticket_id INTEGER PRIMARY KEY,
+            category TEXT NOT NULL,
+            number INTEGER NOT NULL,
+            opener_id INTEGER NOT NULL,
+            opener_name TEXT,
+            channel_id INTEGER,
+            status TEXT NOT NULL,
+            claimed_by INTEGER,
+            closed_by INTEGER,
+            close_reason TEXT,
+            participants TEXT NOT NULL DEFAULT '[]',
+            form_data TEXT,
+            created_at EPOCH_MS,
+            claimed_at EPOCH_MS,
+            closed_at EPOCH_MS,
+            UNIQUE (category, number)
+        )
+    ''')
+    conn.execute('CREATE UNIQUE INDEX idx_tickets_channel ON tickets(channel_id) WHERE channel_id IS NOT NULL')
+    conn.execute('CREATE TABLE ticket_counters (category TEXT PRIMARY KEY, last_number INTEGER NOT NULL)')
+
+@migration(9, "Advertencias verbales")
+def _migration_009_advertencias(conn: sqlite3.Connection):
+    conn.execute('''
+        CREATE TABLE advertencias (
+            warning_id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            username TEXT,
+            reason TEXT,
+            proof_url TEXT,
+            admin_id INTEGER,
+            admin_name TEXT,
+            date EPOCH_MS
+        )
+    ''')
+    conn.execute('CREATE INDEX idx_advertencias_user_date ON advertencias(user_id, date)')
+
+@migration(10, "Registro de auditoría de acciones del staff")
+def _migration_010_auditoria(conn: sqlite3.Connection):
+    conn.execute('''
+        CREATE TABLE audit_events (
+            event_id INTEGER PRIMARY KEY,
+            ts EPOCH_MS NOT NULL,
+            actor_id INTEGER NOT NULL,
+            target_id INTEGER,
+            action TEXT NOT NULL,
+            payload TEXT
+        )
+    ''')
+    conn.execute('CREATE INDEX idx_audit_events_actor_ts ON audit_events(actor_id, ts)')
+    conn.execute('CREATE INDEX idx_audit_events_target_ts ON audit_events(target_id, ts)')
+
+@migration(11, "Acciones programadas persistentes")
+def _migration_011_acciones_programadas(conn: sqlite3.Connection):
+    conn.execute('''
+        CREATE TABLE scheduled_actions (
+            action_id INTEGER PRIMARY KEY,
+            run_at EPOCH_MS NOT NULL,
+            action TEXT NOT NULL,
+            payload TEXT NOT NULL
+        )
+    ''')
+    conn.execute('CREATE INDEX idx_scheduled_actions_run_at ON scheduled_actions(run_at)')
+
+@migration(12, "Contadores de tickets desde los tickets registrados")
+def _migration_012_contadores_tickets(conn: sqlite3.Connection):
+    # open_ticket siempre numera a través de ticket_counters, así que en una base creada
+    # por el bot esto no cambia nada. Repara las bases cuya tabla tickets se restauró o
+    # editó a mano sin su contador, que volverían a repartir números ya usados.
+    # (WHERE true evita la ambigüedad de SELECT ... ON CONFLICT en SQLite)
+    conn.execute('''
+        INSERT INTO ticket_counters (category, last_number)
+        SELECT category, MAX(number) FROM tickets WHERE true GROUP BY category
+        ON CONFLICT(category) DO UPDATE SET last_number = MAX(last_number, excluded.last_number)
+    ''')
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    """Obtener la última versión de esquema aplicada (0 si la base está vacía)."""
+    result = conn.execute('SELECT MAX(version) AS version FROM schema_migrations').fetchone()
+    return result['version'] or 0
+
+def apply_migrations():
+    """Aplicar en orden las migraciones pendientes."""
+    with unit_of_work() as conn:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                description TEXT,
+                applied_at EPOCH_MS
             )
         ''')
-        # Tabla de calificaciones
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS calificaciones (
-                rating_id TEXT PRIMARY KEY,
-                staff_id INTEGER,
-                staff_name TEXT,
-                rating INTEGER,
-                comment TEXT,
-                user_id INTEGER,
-                user_name TEXT,
-                date TIMESTAMP
+        current_version = get_schema_version(conn)
+    for version, description, func in sorted(MIGRATIONS, key=lambda m: m[0]):
+        if version <= current_version:
+            continue
+        with unit_of_work() as conn:
+            func(conn)
+            conn.execute(
+                'INSERT INTO schema_migrations (version, description, applied_at) VALUES (?, ?, ?)',
+                (version, description, datetime.now(timezone.utc))
             )
-        ''')
-        conn.commit()
-        print("Tablas 'sanciones' y 'calificaciones' creadas o verificadas correctamente.")
-    except sqlite3.Error as e:
+        print(f"Migración {version:03d} aplicada: {description}")
+
+# Consultas frecuentes: deben resolverse con índices a medida que crece el historial
+SQL_USER_SANCTIONS = '''
+    SELECT sanction_id, reason, sanction_type, proof_url, admin_name, date
+    FROM sanciones
+    WHERE user_id = ? AND active = ?
+    ORDER BY date DESC
+'''
+SQL_TOP_STAFF = '''
+    SELECT staff_id, staff_name, rating_sum * 1.0 / rating_count as avg_rating, rating_count as count_rating
+    FROM staff_rating_stats
+    WHERE week_key = ? AND rating_count >= ?
+    ORDER BY avg_rating DESC, rating_count DESC
+    LIMIT ?
+'''
+# Paginación por conjunto de claves (date, sanction_id): cada página continúa desde la
+# última fila de la anterior sin OFFSET, así el costo no crece con el historial.
+SQL_USER_SANCTIONS_PAGE = '''
+    SELECT sanction_id, reason, sanction_type, proof_url, admin_name, date
+    FROM sanciones
+    WHERE user_id = ? AND active = ? AND (date, sanction_id) < (?, ?)
+    ORDER BY date DESC, sanction_id DESC
+    LIMIT ?
+'''
+SQL_INSERT_SANCTION = '''
+    INSERT INTO sanciones (sanction_id, user_id, username, reason, sanction_type, proof_url, admin_id, admin_name, date, active)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+SQL_INSERT_RATING = '''
+    INSERT INTO calificaciones (rating_id, staff_id, staff_name, rating, comment, user_id, user_name, date, week_key)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+SQL_UPSERT_STAFF_STATS = '''
+    INSERT INTO staff_rating_stats (week_key, staff_id, staff_name, rating_sum, rating_count, stars_1, stars_2, stars_3, stars_4, stars_5)
+    VALUES (?, ?, ?, ?, 1, ?, ?, ?, ?, ?)
+    ON CONFLICT(week_key, staff_id) DO UPDATE SET
+        staff_name = excluded.staff_name,
+        rating_sum = rating_sum + excluded.rating_sum,
+        rating_count = rating_count + 1,
+        stars_1 = stars_1 + excluded.stars_1,
+        stars_2 = stars_2 + excluded.stars_2,
+        stars_3 = stars_3 + excluded.stars_3,
+        stars_4 = stars_4 + excluded.stars_4,
+        stars_5 = stars_5 + excluded.stars_5
+'''
+
+SQL_INSERT_WARNING = '''
+    INSERT INTO advertencias (warning_id, user_id, username, reason, proof_url, admin_id, admin_name, date)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+'''
+SQL_COUNT_WARNINGS = 'SELECT COUNT(*) AS total FROM advertencias WHERE user_id = ?'
+# El contador por categoría se incrementa y se lee en la misma sentencia (atómico)
+SQL_NEXT_TICKET_NUMBER = '''
+    INSERT INTO ticket_counters (category, last_number) VALUES (?, 1)
+    ON CONFLICT(category) DO UPDATE SET last_number = last_number + 1
+    RETURNING last_number
+'''
+SQL_SEED_TICKET_COUNTER = '''
+    INSERT INTO ticket_counters (category, last_number) VALUES (?, ?)
+    ON CONFLICT(category) DO UPDATE SET last_number = MAX(last_number, excluded.last_number)
+'''
+SQL_INSERT_TICKET = '''
+    INSERT INTO tickets (ticket_id, category, number, opener_id, opener_name, status, form_data, created_at)
+    VALUES (?, ?, ?, ?, ?, 'open', ?, ?)
+'''
+SQL_CLAIM_TICKET = '''
+    UPDATE tickets SET status = 'claimed', claimed_by = ?, claimed_at = ?
+    WHERE channel_id = ? AND status = 'open'
+'''
+SQL_TICKET_BY_CHANNEL = 'SELECT * FROM tickets WHERE channel_id = ?'
+# El registro de auditoría solo admite inserciones; cada consulta es un rango sobre
+# (actor_id, ts) o (target_id, ts), recorrido del más reciente al más antiguo
+SQL_INSERT_AUDIT_EVENT = '''
+    INSERT INTO audit_events (event_id, ts, actor_id, target_id, action, payload)
+    VALUES (?, ?, ?, ?, ?, ?)
+'''
+SQL_AUDIT_BY_ACTOR = '''
+    SELECT event_id, ts, actor_id, target_id, action, payload
+    FROM audit_events
+    WHERE actor_id = ? AND ts >= ?
+    ORDER BY ts DESC, event_id DESC
+    LIMIT ?
+'''
+SQL_AUDIT_BY_TARGET = '''
+    SELECT event_id, ts, actor_id, target_id, action, payload
+    FROM audit_events
+    WHERE target_id = ? AND ts >= ?
+    ORDER BY ts DESC, event_id DESC
+    LIMIT ?
+'''
+# Las acciones programadas se borran al ejecutarse: la tabla solo guarda las pendientes
+SQL_INSERT_SCHEDULED_ACTION = 'INSERT INTO scheduled_actions (action_id, run_at, action, payload) VALUES (?, ?, ?, ?)'
+SQL_DELETE_SCHEDULED_ACTION = 'DELETE FROM scheduled_actions WHERE action_id = ?'
+SQL_PENDING_SCHEDULED_ACTIONS = 'SELECT action_id, run_at, action, payload FROM scheduled_actions ORDER BY run_at'
+# Búsqueda de texto completo ordenada por relevancia (bm25 pondera más el motivo o
+# comentario). Solo se puntúan las coincidencias más recientes (LIMIT interno, recorrido
+# por rowid descendente) para que un término muy común no obligue a puntuar todo el
+# historial; como los IDs crecen con el tiempo, el filtro de fecha es un rango de rowid.
+SQL_SEARCH_SANCTIONS = '''
+    SELECT s.sanction_id, s.username, s.reason, s.sanction_type, s.admin_name, s.date, s.active
+    FROM (
+        SELECT rowid, bm25(sanciones_fts, 10.0, 2.0, 1.0) AS score
+        FROM sanciones_fts
+        WHERE sanciones_fts MATCH ? AND rowid >= ?
+        ORDER BY rowid DESC
+        LIMIT ?
+    ) AS candidates
+    JOIN sanciones s ON s.sanction_id = candidates.rowid
+    ORDER BY candidates.score, candidates.rowid DESC
+    LIMIT ? OFFSET ?
+'''
+SQL_SEARCH_RATINGS = '''
+    SELECT c.rating_id, c.staff_name, c.comment, c.rating, c.user_name, c.date
+    FROM (
+        SELECT rowid, bm25(calificaciones_fts, 10.0, 1.0) AS score
+        FROM calificaciones_fts
+        WHERE calificaciones_fts MATCH ? AND rowid >= ?
+        ORDER BY rowid DESC
+        LIMIT ?
+    ) AS candidates
+    JOIN calificaciones c ON c.rating_id = candidates.rowid
+    ORDER BY candidates.score, candidates.rowid DESC
+    LIMIT ? OFFSET ?
+'''
+HOT_QUERIES = {
+    "get_user_sanctions": (SQL_USER_SANCTIONS, (0, 1)),
+    "get_user_sanctions_page": (SQL_USER_SANCTIONS_PAGE, (0, 0, 0, 0, 5)),
+    "get_top_staff": (SQL_TOP_STAFF, (0, 3, 1)),
+    "search_sanctions": (SQL_SEARCH_SANCTIONS, ('"vdm"', 0, 1000, 6, 0)),
+    "search_ratings": (SQL_SEARCH_RATINGS, ('"vdm"', 0, 1000, 6, 0)),
+    "count_warnings": (SQL_COUNT_WARNINGS, (0,)),
+    "claim_ticket": (SQL_CLAIM_TICKET, (0, 0, 0)),
+    "get_ticket": (SQL_TICKET_BY_CHANNEL, (0,)),
+    "audit_by_actor": (SQL_AUDIT_BY_ACTOR, (0, 0, 25)),
+    "audit_by_target": (SQL_AUDIT_BY_TARGET, (0, 0, 25)),
+}
+# Tablas cuyo tamaño depende del número de staff y no del historial, y subconsultas
+# acotadas por LIMIT: recorrerlas es barato
+BOUNDED_SCAN_TABLES = {"staff_rating_stats", "candidates"}
+
+def check_query_plans(conn: sqlite3.Connection) -> list:
+    """Revisar con EXPLAIN QUERY PLAN que las consultas frecuentes no recorran tablas completas.
+
+    Devuelve una lista de (consulta, detalle del plan) con los recorridos sin índice.
+    """
+    problems = []
+    for name, (sql, params) in HOT_QUERIES.items():
+        for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}', params):
+            detail = row['detail']
+            if not detail.startswith('SCAN') or 'INDEX' in detail:
+                continue
+            if detail.split()[1] in BOUNDED_SCAN_TABLES:
+                continue
+            problems.append((name, detail))
+    return problems
+
+def assert_query_plans():
+    """Fallar si alguna consulta frecuente no usa índices."""
+    with db_pool.connection() as conn:
+        problems = check_query_plans(conn)
+    assert not problems, f"Consultas sin índice: {problems}"
+
+def init_db():
+    """Inicializar la base de datos (migraciones o esquema según el backend)."""
+    print(f"Inicializando base de datos ({DB_BACKEND})...")
+    try:
+        storage.initialize()
+        load_active_rating_week()
+        # Los IDs nuevos deben ser mayores que cualquier ID ya guardado
+        for table, column in (("sanciones", "sanction_id"), ("calificaciones", "rating_id"), ("tickets", "ticket_id"), ("advertencias", "warning_id"), ("audit_events", "event_id"), ("scheduled_actions", "action_id")):
+            max_id = storage.max_record_id(table, column)
+            if max_id is not None:
+                record_ids.observe(max_id)
+    except DB_ERRORS as e:
         print(f"Error al inicializar la base de datos: {e}")
-    finally:
-        if conn:
+        raise
+
+# =============================================
+# REPOSITORIO DE ALMACENAMIENTO
+# =============================================
+# Las funciones de sanciones y calificaciones no hablan directamente con un motor de
+# base de datos: llaman al repositorio activo (`storage`), elegido con DB_BACKEND.
+# SQLite es el backend por defecto; MySQL permite compartir la base entre instancias.
+DB_ERRORS = (sqlite3.Error, pymysql.MySQLError)
+
+def staff_stats_row(week_key: int, staff_id: int, staff_name: str, rating: int) -> tuple:
+    """Fila para sumar una calificación a los agregados semanales de un staff."""
+    return (week_key, staff_id, staff_name, rating) + tuple(int(rating == stars) for stars in range(1, 6))
+
+class StorageRepository(abc.ABC):
+    """Interfaz común de almacenamiento de sanciones, calificaciones y estado del bot.
+
+    Las filas de sanciones y calificaciones usan el mismo orden de columnas que las
+    tablas y las fechas se intercambian siempre como datetime con zona horaria. Todos
+    los métodos son abstractos: un backend incompleto falla al instanciarse.
+    """
+    @abc.abstractmethod
+    def initialize(self):
+        """Crear o migrar el esquema."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def close(self):
+        """Cerrar las conexiones abiertas."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def max_record_id(self, table: str, column: str):
+        """Mayor ID guardado en una tabla (None si está vacía)."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def explain(self, statement: str) -> list:
+        """Plan de ejecución de una sentencia ya expandida, una línea por paso."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_state(self, key: str):
+        """Leer un valor de bot_state."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def set_state(self, key: str, value):
+        """Guardar un valor en bot_state."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def compare_and_set_state(self, key: str, expected, value) -> bool:
+        """Cambiar un valor de bot_state solo si aún vale `expected`; False si no cambió."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def insert_sanctions(self, rows: list):
+        """Insertar un lote de sanciones en una transacción."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def load_active_sanctions(self, user_id: int) -> list:
+        """Sanciones activas de un usuario como (id, motivo, tipo, pruebas, admin, fecha)."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def deactivate_sanctions(self, user_id: int) -> int:
+        """Marcar como inactivas las sanciones de un usuario y devolver cuántas eran."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def sanctions_page(self, user_id: int, active: bool, before: tuple, limit: int) -> list:
+        """Hasta `limit` sanciones anteriores al cursor (fecha en ms, id), de la más nueva a la más antigua."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def find_sanction(self, sanction_id: int = None, legacy_id: str = None):
+        """Buscar una sanción por ID o por UUID antiguo."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def insert_warning(self, row: tuple):
+        """Registrar una advertencia verbal."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def count_warnings(self, user_id: int) -> int:
+        """Número de advertencias verbales de un usuario."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def insert_ratings(self, rows: list):
+        """Insertar un lote de calificaciones y sumar sus agregados en la misma transacción."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def top_staff(self, week_key: int, min_ratings: int, limit: int) -> list:
+        """(staff_id, nombre, promedio, total) de los mejores staff de una semana."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def staff_stats(self, week_key: int, staff_id: int):
+        """Fila de agregados de un staff en una semana."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def staff_trend(self, staff_id: int, from_week: int) -> list:
+        """(semana, promedio, total) de un staff desde `from_week`."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def purge_ratings_before(self, week_key: int) -> int:
+        """Eliminar calificaciones y agregados anteriores a una semana."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def search(self, table: str, text: str, min_id: int, candidates: int, limit: int, offset: int) -> list:
+        """Búsqueda de texto ordenada por relevancia entre las coincidencias más recientes."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def iter_table_batches(self, table: str, columns: tuple, batch_size: int):
+        """Generador de lotes de filas de una tabla en orden de ID."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def insert_missing_rows(self, table: str, columns: tuple, rows: list) -> list:
+        """Insertar las filas cuyo ID o legacy_id no existen y devolverlas."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def open_ticket(self, ticket_id: int, category: str, opener_id: int, opener_name: str, form_data: str, created_at: datetime) -> int:
+        """Reservar el siguiente número de la categoría y registrar el ticket; devuelve el número."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def set_ticket_channel(self, ticket_id: int, channel_id: int):
+        """Asociar el canal creado a un ticket."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_ticket(self, channel_id: int):
+        """Ticket asociado a un canal (None si no está registrado)."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def claim_ticket(self, channel_id: int, staff_id: int, claimed_at: datetime) -> bool:
+        """Marcar un ticket abierto como atendido; False si ya estaba atendido o no existe."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def close_ticket(self, ticket_id: int, status: str, closed_by: int, reason: str, closed_at: datetime):
+        """Cerrar un ticket (o marcarlo como fallido si no llegó a crearse el canal)."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def add_ticket_participant(self, channel_id: int, user_id: int):
+        """Agregar un usuario a la lista de participantes de un ticket."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def seed_ticket_counters(self, numbers: dict):
+        """Subir el contador de cada categoría al menos hasta el número dado (nunca lo baja)."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def insert_audit_events(self, rows: list):
+        """Agregar un lote de eventos al registro de auditoría en una transacción."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def audit_events(self, role: str, user_id: int, since: datetime, limit: int) -> list:
+        """Eventos desde `since` donde el usuario es autor (`actor`) u objetivo (`target`), del más nuevo al más antiguo."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def insert_scheduled_actions(self, rows: list):
+        """Guardar un lote de acciones (action_id, run_at, action, payload) en una transacción."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def delete_scheduled_action(self, action_id: int):
+        """Quitar una acción programada ya ejecutada."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def pending_scheduled_actions(self) -> list:
+        """Todas las acciones programadas pendientes, de la más próxima a la más lejana."""
+        raise NotImplementedError
+
+class SQLiteRepository(StorageRepository):
+    """Repositorio sobre el archivo SQLite local (pool de conexiones y migraciones)."""
+    def initialize(self):
+        apply_migrations()
+        with db_pool.connection() as conn:
+            print(f"Esquema de base de datos en la versión {get_schema_version(conn)}.")
+            for name, detail in check_query_plans(conn):
+                print(f"⚠️ La consulta '{name}' no usa índices: {detail}")
+
+    def close(self):
+        db_pool.close_all()
+
+    def max_record_id(self, table: str, column: str):
+        with db_pool.connection() as conn:
+            return conn.execute(f'SELECT MAX({column}) AS max_id FROM {table}').fetchone()['max_id']
+
+    def explain(self, statement: str) -> list:
+        with db_pool.connection() as conn:
+            return [row['detail'] for row in conn.execute(f'EXPLAIN QUERY PLAN {statement}')]
+
+    def get_state(self, key: str):
+        with db_pool.connection() as conn:
+            result = conn.execute('SELECT value FROM bot_state WHERE key = ?', (key,)).fetchone()
+        return result['value'] if result else None
+
+    def set_state(self, key: str, value):
+        with unit_of_work() as conn:
+            conn.execute('INSERT OR REPLACE INTO bot_state (key, value) VALUES (?, ?)', (key, value))
+
+    def compare_and_set_state(self, key: str, expected, value) -> bool:
+        with unit_of_work() as conn:
+            cursor = conn.execute('UPDATE bot_state SET value = ? WHERE key = ? AND value = ?', (value, key, expected))
+            return cursor.rowcount == 1
+
+    def insert_sanctions(self, rows: list):
+        with unit_of_work() as conn:
+            conn.executemany(SQL_INSERT_SANCTION, rows)
+
+    def load_active_sanctions(self, user_id: int) -> list:
+        with db_pool.connection() as conn:
+            sanctions = conn.execute(SQL_USER_SANCTIONS, (user_id, 1)).fetchall()
+        return [tuple(s) for s in sanctions]
+
+    def deactivate_sanctions(self, user_id: int) -> int:
+        with unit_of_work() as conn:
+            return conn.execute('UPDATE sanciones SET active = ? WHERE user_id = ? AND active = ?', (0, user_id, 1)).rowcount
+
+    def sanctions_page(self, user_id: int, active: bool, before: tuple, limit: int) -> list:
+        with db_pool.connection() as conn:
+            rows = conn.execute(SQL_USER_SANCTIONS_PAGE, (user_id, int(active), before[0], before[1], limit)).fetchall()
+        return [tuple(r) for r in rows]
+
+    def find_sanction(self, sanction_id: int = None, legacy_id: str = None):
+        with db_pool.connection() as conn:
+            if legacy_id is not None:
+                return conn.execute('SELECT * FROM sanciones WHERE legacy_id = ?', (legacy_id,)).fetchone()
+            return conn.execute('SELECT * FROM sanciones WHERE sanction_id = ?', (sanction_id,)).fetchone()
+
+    def insert_warning(self, row: tuple):
+        with unit_of_work() as conn:
+            conn.execute(SQL_INSERT_WARNING, row)
+
+    def count_warnings(self, user_id: int) -> int:
+        with db_pool.connection() as conn:
+            return conn.execute(SQL_COUNT_WARNINGS, (user_id,)).fetchone()['total']
+
+    def insert_ratings(self, rows: list):
+        with unit_of_work() as conn:
+            conn.executemany(SQL_INSERT_RATING, rows)
+            conn.executemany(SQL_UPSERT_STAFF_STATS, [
+                staff_stats_row(week_key, staff_id, staff_name, rating)
+                for _, staff_id, staff_name, rating, _, _, _, _, week_key in rows
+            ])
+
+    def top_staff(self, week_key: int, min_ratings: int, limit: int) -> list:
+        with db_pool.connection() as conn:
+            return [tuple(r) for r in conn.execute(SQL_TOP_STAFF, (week_key, min_ratings, limit))]
+
+    def staff_stats(self, week_key: int, staff_id: int):
+        with db_pool.connection() as conn:
+            return conn.execute(
+                'SELECT * FROM staff_rating_stats WHERE week_key = ? AND staff_id = ?',
+                (week_key, staff_id)
+            ).fetchone()
+
+    def staff_trend(self, staff_id: int, from_week: int) -> list:
+        with db_pool.connection() as conn:
+            return [tuple(r) for r in conn.execute('''
+                SELECT week_key, rating_sum * 1.0 / rating_count as avg_rating, rating_count
+                FROM staff_rating_stats
+                WHERE staff_id = ? AND week_key >= ?
+                ORDER BY week_key
+            ''', (staff_id, from_week))]
+
+    def purge_ratings_before(self, week_key: int) -> int:
+        with unit_of_work() as conn:
+            deleted = conn.execute('DELETE FROM calificaciones WHERE week_key < ?', (week_key,)).rowcount
+            conn.execute('DELETE FROM staff_rating_stats WHERE week_key < ?', (week_key,))
+        return deleted
+
+    def search(self, table: str, text: str, min_id: int, candidates: int, limit: int, offset: int) -> list:
+        sql = SQL_SEARCH_SANCTIONS if table == "sanciones" else SQL_SEARCH_RATINGS
+        with db_pool.connection() as conn:
+            return conn.execute(sql, (build_fts_query(text), min_id, candidates, limit, offset)).fetchall()
+
+    def iter_table_batches(self, table: str, columns: tuple, batch_size: int):
+        # Conexión propia para no ocupar una del pool durante todo el volcado
+        conn = get_db_connection(db_pool.path)
+        try:
+            cursor = conn.execute(f"SELECT {', '.join(columns)} FROM {table} ORDER BY {columns[0]}")
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    return
+                yield rows
+        finally:
             conn.close()
-            print("Conexión a la base de datos cerrada.")
 
-# Inicializar base de datos al inicio
-init_db()
+    def insert_missing_rows(self, table: str, columns: tuple, rows: list) -> list:
+        ids = [row[0] for row in rows]
+        legacy_ids = [row[-1] for row in rows if row[-1] is not None]
+        with unit_of_work() as conn:
+            existing = {r[0] for r in conn.execute(
+                f"SELECT {columns[0]} FROM {table} WHERE {columns[0]} IN ({', '.join('?' * len(ids))})", ids
+            )}
+            if legacy_ids:
+                existing.update(r[0] for r in conn.execute(
+                    f"SELECT legacy_id FROM {table} WHERE legacy_id IN ({', '.join('?' * len(legacy_ids))})", legacy_ids
+                ))
+            new_rows = [row for row in rows if row[0] not in existing and row[-1] not in existing]
+            conn.executemany(
+                f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                new_rows
+            )
+            if table == "calificaciones":
+                conn.executemany(SQL_UPSERT_STAFF_STATS, [
+                    staff_stats_row(week_key, staff_id, staff_name, rating)
+                    for _, staff_id, staff_name, rating, _, _, _, _, week_key, _ in new_rows
+                ])
+        return new_rows
+
+    def open_ticket(self, ticket_id: int, category: str, opener_id: int, opener_name: str, form_data: str, created_at: datetime) -> int:
+        with unit_of_work() as conn:
+            number = conn.execute(SQL_NEXT_TICKET_NUMBER, (category,)).fetchall()[0][0]
+            conn.execute(SQL_INSERT_TICKET, (ticket_id, category, number, opener_id, opener_name, form_data, created_at))
+        return number
+
+    def set_ticket_channel(self, ticket_id: int, channel_id: int):
+        with unit_of_work() as conn:
+            conn.execute('UPDATE tickets SET channel_id = ? WHERE ticket_id = ?', (channel_id, ticket_id))
+
+    def get_ticket(self, channel_id: int):
+        with db_pool.connection() as conn:
+            return conn.execute(SQL_TICKET_BY_CHANNEL, (channel_id,)).fetchone()
+
+    def claim_ticket(self, channel_id: int, staff_id: int, claimed_at: datetime) -> bool:
+        with unit_of_work() as conn:
+            return conn.execute(SQL_CLAIM_TICKET, (staff_id, claimed_at, channel_id)).rowcount == 1
+
+    def close_ticket(self, ticket_id: int, status: str, closed_by: int, reason: str, closed_at: datetime):
+        with unit_of_work() as conn:
+            conn.execute(
+                'UPDATE tickets SET status = ?, closed_by = ?, close_reason = ?, closed_at = ? WHERE ticket_id = ?',
+                (status, closed_by, reason, closed_at, ticket_id)
+            )
+
+    def add_ticket_participant(self, channel_id: int, user_id: int):
+        with unit_of_work() as conn:
+            conn.execute('''
+                UPDATE tickets SET participants = json_insert(participants, '$[#]', ?)
+                WHERE channel_id = ? AND NOT EXISTS (SELECT 1 FROM json_each(participants) WHERE value = ?)
+            ''', (user_id, channel_id, user_id))
+
+    def seed_ticket_counters(self, numbers: dict):
+        with unit_of_work() as conn:
+            conn.executemany(SQL_SEED_TICKET_COUNTER, numbers.items())
+
+    def insert_audit_events(self, rows: list):
+        with unit_of_work() as conn:
+            conn.executemany(SQL_INSERT_AUDIT_EVENT, rows)
+
+    def audit_events(self, role: str, user_id: int, since: datetime, limit: int) -> list:
+        sql = SQL_AUDIT_BY_ACTOR if role == "actor" else SQL_AUDIT_BY_TARGET
+        with db_pool.connection() as conn:
+            return [tuple(r) for r in conn.execute(sql, (user_id, since, limit))]
+
+    def insert_scheduled_actions(self, rows: list):
+        with unit_of_work() as conn:
+            conn.executemany(SQL_INSERT_SCHEDULED_ACTION, rows)
+
+    def delete_scheduled_action(self, action_id: int):
+        with unit_of_work() as conn:
+            conn.execute(SQL_DELETE_SCHEDULED_ACTION, (action_id,))
+
+    def pending_scheduled_actions(self) -> list:
+        with db_pool.connection() as conn:
+            return [tuple(r) for r in conn.execute(SQL_PENDING_SCHEDULED_ACTIONS)]
+
+class TracedDictCursor(pymysql.cursors.DictCursor):
+    """DictCursor que informa sus sentencias a las métricas mientras se mide una llamada."""
+    def execute(self, query, args=None):
+        if getattr(_query_trace, "statements", None) is not None:
+            trace_statement(self.mogrify(query, args))
+        return super().execute(query, args)
+
+class MySQLConnectionPool:
+    """Pool de conexiones pymysql reutilizadas entre los hilos de la base de datos."""
+    def __init__(self, size: int, acquire_timeout: float = MYSQL_POOL_TIMEOUT, **connect_args):
+        self.size = size
+        self.acquire_timeout = acquire_timeout
+        self.connect_args = connect_args
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _checked(self, connection):
+        """Reabrir la conexión si el servidor la cerró por inactividad; si no se puede, liberar su cupo."""
+        try:
+            connection.ping(reconnect=True)
+        except Exception:
+            try:
+                connection.close()
+            except Exception:
+                pass  # Ya estaba cerrada
+            with self._lock:
+                self._created -= 1
+            raise
+        return connection
+
+    def _acquire(self):
+        try:
+            return self._checked(self._idle.get_nowait())
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                connection = pymysql.connect(
+                    autocommit=True,  # Las transacciones se abren con MySQLRepository.transaction()
+                    charset='utf8mb4',
+                    cursorclass=TracedDictCursor,
+                    **self.connect_args
+                )
+                self._created += 1
+                return connection
+        try:
+            connection = self._idle.get(timeout=self.acquire_timeout)
+        except queue.Empty:
+            raise pymysql.err.OperationalError(
+                f"No hay conexiones MySQL libres tras {self.acquire_timeout:g} s (pool de {self.size})"
+            ) from None
+        return self._checked(connection)
+
+    @contextmanager
+    def connection(self):
+        """Prestar una conexión del pool durante el bloque `with`."""
+        connection = self._acquire()
+        try:
+            yield connection
+        finally:
+            self._idle.put(connection)
+
+    def close_all(self):
+        """Cerrar todas las conexiones inactivas del pool."""
+        while True:
+            try:
+                connection = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            connection.close()
+            with self._lock:
+                self._created -= 1
+
+class MySQLRepository(StorageRepository):
+    """Repositorio sobre MySQL/MariaDB (InnoDB) con un pool de conexiones pymysql.
+
+    Todas las consultas van parametrizadas; las fechas se guardan como BIGINT en epoch
+    milisegundos, igual que en SQLite, y la búsqueda usa índices FULLTEXT.
+    """
+    SCHEMA = (
+        '''
+        CREATE TABLE IF NOT EXISTS sanciones (
+            sanction_id BIGINT PRIMARY KEY,
+            user_id BIGINT,
+            username VARCHAR(255),
+            reason TEXT,
+            sanction_type VARCHAR(100),
+            proof_url TEXT,
+            admin_id BIGINT,
+            admin_name VARCHAR(255),
+            date BIGINT,
+            active TINYINT,
+            legacy_id VARCHAR(36) NULL,
+            UNIQUE KEY idx_sanciones_legacy_id (legacy_id),
+            KEY idx_sanciones_user_active_date (user_id, active, date),
+            FULLTEXT KEY ft_sanciones (reason, sanction_type, username)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS calificaciones (
+            rating_id BIGINT PRIMARY KEY,
+            staff_id BIGINT,
+            staff_name VARCHAR(255),
+            rating TINYINT,
+            comment TEXT,
+            user_id BIGINT,
+            user_name VARCHAR(255),
+            date BIGINT,
+            week_key INT,
+            legacy_id VARCHAR(36) NULL,
+            UNIQUE KEY idx_calificaciones_legacy_id (legacy_id),
+            KEY idx_calificaciones_staff (staff_id, rating),
+            KEY idx_calificaciones_week_staff (week_key, staff_id),
+            FULLTEXT KEY ft_calificaciones (comment, staff_name)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS staff_rating_stats (
+            week_key INT NOT NULL,
+            staff_id BIGINT NOT NULL,
+            staff_name VARCHAR(255),
+            rating_sum INT NOT NULL DEFAULT 0,
+            rating_count INT NOT NULL DEFAULT 0,
+            stars_1 INT NOT NULL DEFAULT 0,
+            stars_2 INT NOT NULL DEFAULT 0,
+            stars_3 INT NOT NULL DEFAULT 0,
+            stars_4 INT NOT NULL DEFAULT 0,
+            stars_5 INT NOT NULL DEFAULT 0,
+            PRIMARY KEY (week_key, staff_id),
+            KEY idx_staff_rating_stats_staff (staff_id, week_key)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS bot_state (
+            `key` VARCHAR(64) PRIMARY KEY,
+            value BIGINT
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS advertencias (
+            warning_id BIGINT PRIMARY KEY,
+            user_id BIGINT NOT NULL,
+            username VARCHAR(255),
+            reason TEXT,
+            proof_url TEXT,
+            admin_id BIGINT,
+            admin_name VARCHAR(255),
+            date BIGINT,
+            KEY idx_advertencias_user_date (user_id, date)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS tickets (
+            ticket_id BIGINT PRIMARY KEY,
+            category VARCHAR(64) NOT NULL,
+            number INT NOT NULL,
+            opener_id BIGINT NOT NULL,
+            opener_name VARCHAR(255),
+            channel_id BIGINT NULL,
+            status VARCHAR(16) NOT NULL,
+            claimed_by BIGINT,
+            closed_by BIGINT,
+            close_reason TEXT,
+            participants JSON NOT NULL,
+            form_data JSON,
+            created_at BIGINT,
+            claimed_at BIGINT,
+            closed_at BIGINT,
+            UNIQUE KEY idx_tickets_category_number (category, number),
+            UNIQUE KEY idx_tickets_channel (channel_id)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS ticket_counters (
+            category VARCHAR(64) PRIMARY KEY,
+            last_number INT NOT NULL
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS audit_events (
+            event_id BIGINT PRIMARY KEY,
+            ts BIGINT NOT NULL,
+            actor_id BIGINT NOT NULL,
+            target_id BIGINT NULL,
+            action VARCHAR(64) NOT NULL,
+            payload TEXT,
+            KEY idx_audit_events_actor_ts (actor_id, ts),
+            KEY idx_audit_events_target_ts (target_id, ts)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS scheduled_actions (
+            action_id BIGINT PRIMARY KEY,
+            run_at BIGINT NOT NULL,
+            action VARCHAR(64) NOT NULL,
+            payload TEXT NOT NULL,
+            KEY idx_scheduled_actions_run_at (run_at)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        ''',
+    )
+    SQL_INSERT_SANCTION = '''
+        INSERT INTO sanciones (sanction_id, user_id, username, reason, sanction_type, proof_url, admin_id, admin_name, date, active)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    '''
+    SQL_INSERT_RATING = '''
+        INSERT INTO calificaciones (rating_id, staff_id, staff_name, rating, comment, user_id, user_name, date, week_key)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+    '''
+    SQL_UPSERT_STAFF_STATS = '''
+        INSERT INTO staff_rating_stats (week_key, staff_id, staff_name, rating_sum, rating_count, stars_1, stars_2, stars_3, stars_4, stars_5)
+        VALUES (%s, %s, %s, %s, 1, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            staff_name = VALUES(staff_name),
+            rating_sum = rating_sum + VALUES(rating_sum),
+            rating_count = rating_count + 1,
+            stars_1 = stars_1 + VALUES(stars_1),
+            stars_2 = stars_2 + VALUES(stars_2),
+            stars_3 = stars_3 + VALUES(stars_3),
+            stars_4 = stars_4 + VALUES(stars_4),
+            stars_5 = stars_5 + VALUES(stars_5)
+    '''
+    SQL_USER_SANCTIONS = '''
+        SELECT sanction_id, reason, sanction_type, proof_url, admin_name, date
+        FROM sanciones
+        WHERE user_id = %s AND active = %s
+        ORDER BY date DESC
+    '''
+    SQL_TOP_STAFF = '''
+        SELECT staff_id, staff_name, rating_sum / rating_count AS avg_rating, rating_count AS count_rating
+        FROM staff_rating_stats
+        WHERE week_key = %s AND rating_count >= %s
+        ORDER BY avg_rating DESC, rating_count DESC
+        LIMIT %s
+    '''
+    # MySQL no usa el índice con comparaciones de tuplas: el cursor se expande
+    SQL_USER_SANCTIONS_PAGE = '''
+        SELECT sanction_id, reason, sanction_type, proof_url, admin_name, date
+        FROM sanciones
+        WHERE user_id = %s AND active = %s AND (date < %s OR (date = %s AND sanction_id < %s))
+        ORDER BY date DESC, sanction_id DESC
+        LIMIT %s
+    '''
+    SQL_SEARCH_SANCTIONS = '''
+        SELECT s.sanction_id, s.username, s.reason, s.sanction_type, s.admin_name, s.date, s.active
+        FROM (
+            SELECT sanction_id, MATCH(reason, sanction_type, username) AGAINST (%s IN BOOLEAN MODE) AS score
+            FROM sanciones
+            WHERE MATCH(reason, sanction_type, username) AGAINST (%s IN BOOLEAN MODE) AND sanction_id >= %s
+            ORDER BY sanction_id DESC
+            LIMIT %s
+        ) AS candidates
+        JOIN sanciones s ON s.sanction_id = candidates.sanction_id
+        ORDER BY candidates.score DESC, candidates.sanction_id DESC
+        LIMIT %s OFFSET %s
+    '''
+    SQL_SEARCH_RATINGS = '''
+        SELECT c.rating_id, c.staff_name, c.comment, c.rating, c.user_name, c.date
+        FROM (
+            SELECT rating_id, MATCH(comment, staff_name) AGAINST (%s IN BOOLEAN MODE) AS score
+            FROM calificaciones
+            WHERE MATCH(comment, staff_name) AGAINST (%s IN BOOLEAN MODE) AND rating_id >= %s
+            ORDER BY rating_id DESC
+            LIMIT %s
+        ) AS candidates
+        JOIN calificaciones c ON c.rating_id = candidates.rating_id
+        ORDER BY candidates.score DESC, candidates.rating_id DESC
+        LIMIT %s OFFSET %s
+    '''
+
+    def __init__(self, pool: MySQLConnectionPool):
+        self.pool = pool
+
+    @contextmanager
+    def cursor(self):
+        """Cursor en modo autocommit para lecturas sueltas."""
+        with self.pool.connection() as conn:
+            with conn.cursor() as cursor:
+                yield cursor
+
+    @contextmanager
+    def transaction(self):
+        """Cursor dentro de una transacción (COMMIT al salir, ROLLBACK si hay error)."""
+        with self.pool.connection() as conn:
+            conn.begin()
+            try:
+                with conn.cursor() as cursor:
+                    yield cursor
+            except BaseException:
+                conn.rollback()
+                raise
+            conn.commit()
+
+    @staticmethod
+    def _encode(rows: list) -> list:
+        """Convertir los datetime de las filas a epoch en milisegundos."""
+        return [tuple(to_epoch_ms(v) if isinstance(v, datetime) else v for v in row) for row in rows]
+
+    @staticmethod
+    def _decode(row: dict) -> dict:
+        """Convertir la columna date de una fila leída a datetime."""
+        if row is not None and row.get('date') is not None:
+            row['date'] = from_epoch_ms(row['date'])
+        return row
+
+    def initialize(self):
+        with self.transaction() as cursor:
+            for statement in self.SCHEMA:
+                cursor.execute(statement)
+            # La rotación semanal es un compare-and-set: la fila debe existir desde el inicio
+            cursor.execute(
+                "INSERT IGNORE INTO bot_state (`key`, value) VALUES ('active_rating_week', %s)",
+                (week_key_for(datetime.now(timezone.utc)),)
+            )
+        print("Esquema MySQL verificado.")
+
+    def close(self):
+        self.pool.close_all()
+
+    def max_record_id(self, table: str, column: str):
+        with self.cursor() as cursor:
+            cursor.execute(f'SELECT MAX({column}) AS max_id FROM {table}')
+            return cursor.fetchone()['max_id']
+
+    def explain(self, statement: str) -> list:
+        with self.cursor() as cursor:
+            cursor.execute(f'EXPLAIN {statement}')
+            return [
+                f"{r['table']}: type={r['type']}, key={r['key']}, rows={r['rows']}" + (f", {r['Extra']}" if r.get('Extra') else "")
+                for r in cursor.fetchall()
+            ]
+
+    def get_state(self, key: str):
+        with self.cursor() as cursor:
+            cursor.execute('SELECT value FROM bot_state WHERE `key` = %s', (key,))
+            result = cursor.fetchone()
+        return result['value'] if result else None
+
+    def set_state(self, key: str, value):
+        with self.transaction() as cursor:
+            cursor.execute(
+                'INSERT INTO bot_state (`key`, value) VALUES (%s, %s) ON DUPLICATE KEY UPDATE value = VALUES(value)',
+                (key, value)
+            )
+
+    def compare_and_set_state(self, key: str, expected, value) -> bool:
+        with self.transaction() as cursor:
+            return cursor.execute('UPDATE bot_state SET value = %s WHERE `key` = %s AND value = %s', (value, key, expected)) == 1
+
+    def insert_sanctions(self, rows: list):
+        with self.transaction() as cursor:
+            cursor.executemany(self.SQL_INSERT_SANCTION, self._encode(rows))
+
+    def load_active_sanctions(self, user_id: int) -> list:
+        with self.cursor() as cursor:
+            cursor.execute(self.SQL_USER_SANCTIONS, (user_id, 1))
+            rows = cursor.fetchall()
+        return [
+            (r['sanction_id'], r['reason'], r['sanction_type'], r['proof_url'], r['admin_name'], from_epoch_ms(r['date']))
+            for r in rows
+        ]
+
+    def deactivate_sanctions(self, user_id: int) -> int:
+        with self.transaction() as cursor:
+            return cursor.execute('UPDATE sanciones SET active = %s WHERE user_id = %s AND active = %s', (0, user_id, 1))
+
+    def sanctions_page(self, user_id: int, active: bool, before: tuple, limit: int) -> list:
+        with self.cursor() as cursor:
+            cursor.execute(self.SQL_USER_SANCTIONS_PAGE, (user_id, int(active), before[0], before[0], before[1], limit))
+            rows = cursor.fetchall()
+        return [
+            (r['sanction_id'], r['reason'], r['sanction_type'], r['proof_url'], r['admin_name'], from_epoch_ms(r['date']))
+            for r in rows
+        ]
+
+    def find_sanction(self, sanction_id: int = None, legacy_id: str = None):
+        with self.cursor() as cursor:
+            if legacy_id is not None:
+                cursor.execute('SELECT * FROM sanciones WHERE legacy_id = %s', (legacy_id,))
+            else:
+                cursor.execute('SELECT * FROM sanciones WHERE sanction_id = %s', (sanction_id,))
+            return self._decode(cursor.fetchone())
+
+    def insert_warning(self, row: tuple):
+        with self.transaction() as cursor:
+            cursor.execute('''
+                INSERT INTO advertencias (warning_id, user_id, username, reason, proof_url, admin_id, admin_name, date)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+            ''', self._encode([row])[0])
+
+    def count_warnings(self, user_id: int) -> int:
+        with self.cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) AS total FROM advertencias WHERE user_id = %s', (user_id,))
+            return cursor.fetchone()['total']
+
+    def insert_ratings(self, rows: list):
+        with self.transaction() as cursor:
+            cursor.executemany(self.SQL_INSERT_RATING, self._encode(rows))
+            cursor.executemany(self.SQL_UPSERT_STAFF_STATS, [
+                staff_stats_row(week_key, staff_id, staff_name, rating)
+                for _, staff_id, staff_name, rating, _, _, _, _, week_key in rows
+            ])
+
+    def top_staff(self, week_key: int, min_ratings: int, limit: int) -> list:
+        with self.cursor() as cursor:
+            cursor.execute(self.SQL_TOP_STAFF, (week_key, min_ratings, limit))
+            rows = cursor.fetchall()
+        return [(r['staff_id'], r['staff_name'], float(r['avg_rating']), r['count_rating']) for r in rows]
+
+    def staff_stats(self, week_key: int, staff_id: int):
+        with self.cursor() as cursor:
+            cursor.execute('SELECT * FROM staff_rating_stats WHERE week_key = %s AND staff_id = %s', (week_key, staff_id))
+            return cursor.fetchone()
+
+    def staff_trend(self, staff_id: int, from_week: int) -> list:
+        with self.cursor() as cursor:
+            cursor.execute('''
+                SELECT week_key, rating_sum / rating_count AS avg_rating, rating_count
+                FROM staff_rating_stats
+                WHERE staff_id = %s AND week_key >= %s
+                ORDER BY week_key
+            ''', (staff_id, from_week))
+            rows = cursor.fetchall()
+        return [(r['week_key'], float(r['avg_rating']), r['rating_count']) for r in rows]
+
+    def purge_ratings_before(self, week_key: int) -> int:
+        with self.transaction() as cursor:
+            deleted = cursor.execute('DELETE FROM calificaciones WHERE week_key < %s', (week_key,))
+            cursor.execute('DELETE FROM staff_rating_stats WHERE week_key < %s', (week_key,))
+        return deleted
+
+    def search(self, table: str, text: str, min_id: int, candidates: int, limit: int, offset: int) -> list:
+        sql = self.SQL_SEARCH_SANCTIONS if table == "sanciones" else self.SQL_SEARCH_RATINGS
+        query = build_boolean_query(text)
+        with self.cursor() as cursor:
+            cursor.execute(sql, (query, query, min_id, candidates, limit, offset))
+            return [self._decode(row) for row in cursor.fetchall()]
+
+    def iter_table_batches(self, table: str, columns: tuple, batch_size: int):
+        # Cursor sin búfer en una conexión propia: el servidor envía las filas a medida que se leen
+        conn = pymysql.connect(charset='utf8mb4', cursorclass=pymysql.cursors.SSCursor, **self.pool.connect_args)
+        date_index = columns.index("date")
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(f"SELECT {', '.join(columns)} FROM {table} ORDER BY {columns[0]}")
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        return
+                    yield [row[:date_index] + (from_epoch_ms(row[date_index]),) + row[date_index + 1:] for row in rows]
+        finally:
+            conn.close()
+
+    def insert_missing_rows(self, table: str, columns: tuple, rows: list) -> list:
+        ids = [row[0] for row in rows]
+        legacy_ids = [row[-1] for row in rows if row[-1] is not None]
+        with self.transaction() as cursor:
+            cursor.execute(f"SELECT {columns[0]} AS id FROM {table} WHERE {columns[0]} IN ({', '.join(['%s'] * len(ids))})", ids)
+            existing = {r['id'] for r in cursor.fetchall()}
+            if legacy_ids:
+                cursor.execute(f"SELECT legacy_id FROM {table} WHERE legacy_id IN ({', '.join(['%s'] * len(legacy_ids))})", legacy_ids)
+                existing.update(r['legacy_id'] for r in cursor.fetchall())
+            new_rows = [row for row in rows if row[0] not in existing and row[-1] not in existing]
+            if new_rows:
+                cursor.executemany(
+                    f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))})",
+                    self._encode(new_rows)
+                )
+            if table == "calificaciones" and new_rows:
+                cursor.executemany(self.SQL_UPSERT_STAFF_STATS, [
+                    staff_stats_row(week_key, staff_id, staff_name, rating)
+                    for _, staff_id, staff_name, rating, _, _, _, _, week_key, _ in new_rows
+                ])
+        return new_rows
+
+    def open_ticket(self, ticket_id: int, category: str, opener_id: int, opener_name: str, form_data: str, created_at: datetime) -> int:
+        with self.transaction() as cursor:
+            # LAST_INSERT_ID(expr) deja el nuevo valor del contador disponible para esta conexión
+            cursor.execute('''
+                INSERT INTO ticket_counters (category, last_number) VALUES (%s, LAST_INSERT_ID(1))
+                ON DUPLICATE KEY UPDATE last_number = LAST_INSERT_ID(last_number + 1)
+            ''', (category,))
+            cursor.execute('SELECT LAST_INSERT_ID() AS number')
+            number = cursor.fetchone()['number']
+            cursor.execute('''
+                INSERT INTO tickets (ticket_id, category, number, opener_id, opener_name, status, participants, form_data, created_at)
+                VALUES (%s, %s, %s, %s, %s, 'open', JSON_ARRAY(), %s, %s)
+            ''', (ticket_id, category, number, opener_id, opener_name, form_data, to_epoch_ms(created_at)))
+        return number
+
+    def set_ticket_channel(self, ticket_id: int, channel_id: int):
+        with self.transaction() as cursor:
+            cursor.execute('UPDATE tickets SET channel_id = %s WHERE ticket_id = %s', (channel_id, ticket_id))
+
+    def get_ticket(self, channel_id: int):
+        with self.cursor() as cursor:
+            cursor.execute('SELECT * FROM tickets WHERE channel_id = %s', (channel_id,))
+            ticket = cursor.fetchone()
+        if ticket is not None:
+            for column in ('created_at', 'claimed_at', 'closed_at'):
+                if ticket[column] is not None:
+                    ticket[column] = from_epoch_ms(ticket[column])
+        return ticket
+
+    def claim_ticket(self, channel_id: int, staff_id: int, claimed_at: datetime) -> bool:
+        with self.transaction() as cursor:
+            return cursor.execute(
+                "UPDATE tickets SET status = 'claimed', claimed_by = %s, claimed_at = %s WHERE channel_id = %s AND status = 'open'",
+                (staff_id, to_epoch_ms(claimed_at), channel_id)
+            ) == 1
+
+    def close_ticket(self, ticket_id: int, status: str, closed_by: int, reason: str, closed_at: datetime):
+        with self.transaction() as cursor:
+            cursor.execute(
+                'UPDATE tickets SET status = %s, closed_by = %s, close_reason = %s, closed_at = %s WHERE ticket_id = %s',
+                (status, closed_by, reason, to_epoch_ms(closed_at), ticket_id)
+            )
+
+    def add_ticket_participant(self, channel_id: int, user_id: int):
+        with self.transaction() as cursor:
+            cursor.execute('''
+                UPDATE tickets SET participants = JSON_ARRAY_APPEND(participants, '$', %s)
+                WHERE channel_id = %s AND NOT JSON_CONTAINS(participants, CAST(%s AS JSON))
+            ''', (user_id, channel_id, user_id))
+
+    def seed_ticket_counters(self, numbers: dict):
+        with self.transaction() as cursor:
+            cursor.executemany('''
+                INSERT INTO ticket_counters (category, last_number) VALUES (%s, %s)
+                ON DUPLICATE KEY UPDATE last_number = GREATEST(last_number, VALUES(last_number))
+            ''', list(numbers.items()))
+
+    def insert_audit_events(self, rows: list):
+        with self.transaction() as cursor:
+            cursor.executemany('''
+                INSERT INTO audit_events (event_id, ts, actor_id, target_id, action, payload)
+                VALUES (%s, %s, %s, %s, %s, %s)
+            ''', self._encode(rows))
+
+    def audit_events(self, role: str, user_id: int, since: datetime, limit: int) -> list:
+        column = "actor_id" if role == "actor" else "target_id"
+        with self.cursor() as cursor:
+            cursor.execute(f'''
+                SELECT event_id, ts, actor_id, target_id, action, payload
+                FROM audit_events
+                WHERE {column} = %s AND ts >= %s
+                ORDER BY ts DESC, event_id DESC
+                LIMIT %s
+            ''', (user_id, to_epoch_ms(since), limit))
+            rows = cursor.fetchall()
+        return [
+            (r['event_id'], from_epoch_ms(r['ts']), r['actor_id'], r['target_id'], r['action'], r['payload'])
+            for r in rows
+        ]
+
+    def insert_scheduled_actions(self, rows: list):
+        with self.transaction() as cursor:
+            cursor.executemany(
+                'INSERT INTO scheduled_actions (action_id, run_at, action, payload) VALUES (%s, %s, %s, %s)',
+                self._encode(rows)
+            )
+
+    def delete_scheduled_action(self, action_id: int):
+        with self.transaction() as cursor:
+            cursor.execute('DELETE FROM scheduled_actions WHERE action_id = %s', (action_id,))
+
+    def pending_scheduled_actions(self) -> list:
+        with self.cursor() as cursor:
+            cursor.execute('SELECT action_id, run_at, action, payload FROM scheduled_actions ORDER BY run_at')
+            rows = cursor.fetchall()
+        return [(r['action_id'], from_epoch_ms(r['run_at']), r['action'], r['payload']) for r in rows]
+
+class InstrumentedRepository:
+    """Envoltura de un StorageRepository que mide cada llamada en `query_stats`.
+
+    Las llamadas más lentas que DB_SLOW_QUERY_MS se registran con el plan de ejecución
+    de sus primeras sentencias (capturadas por trace_statement en el mismo hilo).
+    """
+    UNTIMED = {"initialize", "close", "explain", "iter_table_batches"}
+
+    def __init__(self, repository: StorageRepository, stats: QueryStats):
+        self.repository = repository
+        self.stats = stats
+
+    def __getattr__(self, name: str):
+        attr = getattr(self.repository, name)
+        if name.startswith('_') or name in self.UNTIMED or not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        def timed(*args, **kwargs):
+            outer, _query_trace.statements = getattr(_query_trace, "statements", None), []
+            start = time.perf_counter()
+            result, failed = None, True
+            try:
+                result = attr(*args, **kwargs)
+                failed = False
+                return result
+            finally:
+                elapsed = time.perf_counter() - start
+                statements, _query_trace.statements = _query_trace.statements, None
+                rows = 0 if failed else count_result_rows(args, result)
+                slow = elapsed * 1000 >= DB_SLOW_QUERY_MS
+                self.stats.observe(name, elapsed, rows, failed=failed, slow=slow)
+                if slow:
+                    self.log_slow_call(name, elapsed, rows, statements)
+                _query_trace.statements = outer
+
+        # Guardar la envoltura para no recrearla en cada llamada
+        setattr(self, name, timed)
+        return timed
+
+    def log_slow_call(self, name: str, elapsed: float, rows: int, statements: list):
+        """Registrar una llamada lenta con el plan de cada sentencia de lectura o modificación."""
+        print(f"🐢 Consulta lenta '{name}': {elapsed * 1000:.1f} ms, {rows} filas")
+        for statement in dict.fromkeys(statements):
+            sql = ' '.join(statement.split())
+            print(f"   SQL: {sql[:300]}")
+            if not sql.upper().startswith(EXPLAINABLE_STATEMENTS):
+                continue
+            try:
+                for step in self.repository.explain(sql):
+                    print(f"     └ {step}")
+            except DB_ERRORS as e:
+                print(f"Error al obtener el plan de la consulta: {e}")
+
+def create_storage_repository() -> StorageRepository:
+    """Crear el repositorio indicado por DB_BACKEND, con métricas de consultas."""
+    if DB_BACKEND == 'sqlite':
+        return InstrumentedRepository(SQLiteRepository(), query_stats)
+    if DB_BACKEND == 'mysql':
+        return InstrumentedRepository(MySQLRepository(MySQLConnectionPool(
+            size=int(os.getenv('DB_POOL_SIZE', DB_READ_WORKERS + 1)),
+            host=MYSQL_HOST,
+            port=MYSQL_PORT,
+            user=MYSQL_USER,
+            password=MYSQL_PASSWORD,
+            database=MYSQL_DATABASE
+        )), query_stats)
+    raise ValueError(f"DB_BACKEND no soportado: {DB_BACKEND} (usa sqlite o mysql)")
+
+storage = create_storage_repository()
 
 # =============================================
 # CONSTANTES Y CONFIGURACIÓN
@@ -108,6 +1997,9 @@ class Channels:
     RATINGS = 1339386616405561398  
     JOB_APPLICATIONS = 1365153550816116797  # Channel where /postular-trabajo is used
     JOB_REVIEW = 1365158553412964433  # Channel where staff review applications
+    WARNING_LOGS = 1367389708597858314
+    JOB_LOGS = SANCTION_LOGS  # Las postulaciones se registran junto a las sanciones
+    MEMBER_COUNT = 1367394876479766580  # Canal cuyo nombre muestra el conteo de usuarios
 
 class Roles:
     STAFF = [1339386615247798362, 1346545514492985486, 1339386615222767662, 1347803116741066834, 1339386615235346439]
@@ -272,161 +2164,1534 @@ def create_embed(title: str, description: str, color: int, user: discord.Member
         embed.set_thumbnail(url=thumbnail)
     return embed
 
+# =============================================
+# CANALES DE LOGS
+# =============================================
+# Los logs no se envían uno por uno: cada canal tiene un despachador que junta los
+# embeds durante una breve espera y los publica en un solo mensaje (Discord acepta
+# hasta 10 embeds y 6000 caracteres por mensaje). Así los comandos no esperan al
+# límite de mensajes del canal en horas de mucha actividad.
+LOG_EMBEDS_PER_MESSAGE = 10
+LOG_MESSAGE_MAX_CHARS = 6000
+LOG_LINGER_SECONDS = float(os.getenv('LOG_LINGER_SECONDS', 0.5))
+
+class LogChannelDispatcher:
+    """Cola de embeds de un canal de logs enviada en segundo plano en mensajes agrupados."""
+    def __init__(self, channel_id: int, linger: float = LOG_LINGER_SECONDS):
+        self.channel_id = channel_id
+        self.linger = linger
+        self._pending = []
+        self._task = None
+
+    def submit(self, embed: discord.Embed):
+        """Encolar un embed sin esperar a que se envíe."""
+        self._pending.append(embed)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def _next_batch(self) -> list:
+        batch, size = [], 0
+        while self._pending and len(batch) < LOG_EMBEDS_PER_MESSAGE:
+            embed_size = len(self._pending[0])
+            if batch and size + embed_size > LOG_MESSAGE_MAX_CHARS:
+                break
+            batch.append(self._pending.pop(0))
+            size += embed_size
+        return batch
+
+    async def _run(self):
+        await asyncio.sleep(self.linger)
+        while self._pending:
+            batch = self._next_batch()
+            channel = bot.get_channel(self.channel_id)
+            if channel is None:
+                print(f"⚠️ Canal de logs {self.channel_id} no encontrado; se descartan {len(batch)} logs.")
+                continue
+            try:
+                await channel.send(embeds=batch)
+            except discord.HTTPException as e:
+                print(f"Error al enviar logs al canal {self.channel_id}: {e}")
+
+    async def flush(self):
+        """Esperar a que se envíen los embeds pendientes."""
+        if self._task is not None and not self._task.done():
+            await self._task
+
+log_dispatchers = {}
+
+def send_log(channel_id: int, embed: discord.Embed):
+    """Publicar un embed en un canal de logs sin bloquear al comando que lo genera."""
+    dispatcher = log_dispatchers.get(channel_id)
+    if dispatcher is None:
+        dispatcher = log_dispatchers[channel_id] = LogChannelDispatcher(channel_id)
+    dispatcher.submit(embed)
+
+async def flush_log_dispatchers():
+    """Enviar los logs pendientes de todos los canales (usado al apagar el bot)."""
+    await asyncio.gather(*(dispatcher.flush() for dispatcher in log_dispatchers.values()), return_exceptions=True)
+
+# =============================================
+# BANDEJA DE SALIDA DE MENSAJES DIRECTOS
+# =============================================
+# Los DMs de moderación se envían en segundo plano: el comando solo los encola. Los
+# errores 429/5xx se reintentan con espera exponencial y los usuarios con los DMs
+# cerrados (403) se recuerdan durante DM_CLOSED_TTL_HOURS para no volver a intentarlo.
+# Si un DM no se entrega, se avisa de forma efímera al staff que ejecutó el comando.
+DM_OUTBOX_WORKERS = 2
+DM_MAX_TRIES = 5
+DM_MAX_RETRY_SECONDS = 60
+DM_CLOSED_TTL_HOURS = float(os.getenv('DM_CLOSED_TTL_HOURS', 6))
+DM_DRAIN_TIMEOUT = 10
+
+DM_SENT, DM_CLOSED, DM_SKIPPED, DM_FAILED = "enviado", "dms_cerrados", "omitido", "fallido"
+
+class ClosedDMCache:
+    """Caché con vencimiento de los usuarios que rechazaron un DM."""
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._expires = OrderedDict()
+
+    def is_closed(self, user_id: int) -> bool:
+        """True si el usuario rechazó un DM hace menos de `ttl` segundos."""
+        expires = self._expires.get(user_id)
+        if expires is None:
+            return False
+        if expires <= time.monotonic():
+            del self._expires[user_id]
+            return False
+        return True
+
+    def mark_closed(self, user_id: int):
+        """Recordar que el usuario tiene los DMs cerrados."""
+        now = time.monotonic()
+        self._expires[user_id] = now + self.ttl
+        self._expires.move_to_end(user_id)
+        # Con un TTL fijo las entradas más antiguas vencen primero
+        while self._expires and next(iter(self._expires.values())) <= now:
+            self._expires.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._expires)
+
+def is_retryable_dm_error(error: Exception) -> bool:
+    """Límite de peticiones (429) o error del servidor de Discord (5xx)."""
+    return isinstance(error, discord.HTTPException) and (error.status == 429 or error.status >= 500)
+
+def describe_dm_error(error: Exception) -> str:
+    """Motivo breve de un DM no entregado para mostrarlo al staff."""
+    if isinstance(error, discord.HTTPException):
+        return f"error de Discord ({error.status})"
+    return str(error) or type(error).__name__
+
+@backoff.on_exception(
+    backoff.expo,
+    discord.HTTPException,
+    max_tries=DM_MAX_TRIES,
+    max_time=DM_MAX_RETRY_SECONDS,
+    giveup=lambda e: not is_retryable_dm_error(e)
+)
+async def send_dm_with_retry(user: discord.abc.User, **message):
+    """Enviar un DM reintentando los errores transitorios."""
+    await user.send(**message)
+
+class DMOutbox:
+    """Cola de DMs atendida por trabajadores en segundo plano."""
+    def __init__(self, closed_cache: ClosedDMCache, workers: int = DM_OUTBOX_WORKERS):
+        self.closed_cache = closed_cache
+        self.workers = workers
+        self.results = {DM_SENT: 0, DM_CLOSED: 0, DM_SKIPPED: 0, DM_FAILED: 0}
+        self._queue = None
+        self._tasks = []
+
+    def submit(self, user: discord.abc.User, report_to: discord.Webhook = None, **message) -> asyncio.Future:
+        """Encolar un DM y devolver un futuro con el resultado de la entrega.
+
+        Si se indica `report_to` (el followup de la interacción), el staff recibe un
+        aviso efímero cuando el DM no se entrega.
+        """
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((user, message, report_to, future))
+        return future
+
+    async def _worker(self):
+        while True:
+            user, message, report_to, future = await self._queue.get()
+            try:
+                result, error = await self._deliver(user, message)
+                self.results[result] += 1
+                if not future.done():
+                    future.set_result(result)
+                if report_to is not None and result != DM_SENT:
+                    await self._report(report_to, user, result, error)
+            except asyncio.CancelledError:
+                # Apagado a mitad de una entrega: avisar a quien espera el resultado
+                future.cancel()
+                raise
+            finally:
+                self._queue.task_done()
+
+    async def _deliver(self, user: discord.abc.User, message: dict) -> tuple:
+        if self.closed_cache.is_closed(user.id):
+            return DM_SKIPPED, None
+        try:
+            await send_dm_with_retry(user, **message)
+            return DM_SENT, None
+        except discord.Forbidden as e:
+            self.closed_cache.mark_closed(user.id)
+            return DM_CLOSED, e
+        except Exception as e:
+            print(f"Error al enviar DM a {user}: {e}")
+            return DM_FAILED, e
+
+    async def _report(self, followup: discord.Webhook, user: discord.abc.User, result: str, error: Exception):
+        if result == DM_FAILED:
+            detail = f"no se pudo entregar: {describe_dm_error(error)}."
+        elif result == DM_SKIPPED:
+            detail = "se omitió porque tenía los DMs cerrados en un intento reciente."
+        else:
+            detail = "no se entregó porque tiene los DMs cerrados."
+        try:
+            await followup.send(embed=create_embed(
+                title="📭 Mensaje Directo No Entregado",
+                description=f"El mensaje directo a {user.mention} {detail}",
+                color=Colors.WARNING
+            ), ephemeral=True)
+        except discord.HTTPException as e:
+            print(f"Error al informar la entrega de un DM: {e}")
+
+    def status(self) -> dict:
+        """DMs pendientes y resultados acumulados (para /health)."""
+        return {
+            "pending": self._queue.qsize() if self._queue is not None else 0,
+            "closed_cached": len(self.closed_cache),
+            **self.results,
+        }
+
+    async def drain(self, timeout: float = DM_DRAIN_TIMEOUT):
+        """Esperar a que se envíen los DMs en cola (usado al apagar el bot)."""
+        if self._queue is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            print(f"⚠️ Quedaron {self._queue.qsize()} DMs sin enviar al apagar el bot.")
+
+dm_outbox = DMOutbox(ClosedDMCache(ttl=DM_CLOSED_TTL_HOURS * 3600))
+
+def queue_dm(user: discord.abc.User, report_to: discord.Webhook = None, **message) -> asyncio.Future:
+    """Enviar un DM en segundo plano (ver DMOutbox.submit)."""
+    return dm_outbox.submit(user, report_to=report_to, **message)
+
+# =============================================
+# CAMBIOS DE ROLES Y APODO
+# =============================================
+# Member.edit(roles=...) reemplaza la lista completa de roles: se calcula el conjunto
+# final a partir del estado del miembro en caché (actualizado por el gateway) y se
+# aplica junto con el apodo en una sola petición, en lugar de una por rol.
+NICKNAME_MAX_LENGTH = 32
+
+def can_change_nick(member: discord.Member) -> bool:
+    """El bot solo puede cambiar el apodo de miembros por debajo de su rol más alto."""
+    me = member.guild.me
+    return member.id != member.guild.owner_id and member.top_role < me.top_role
+
+async def apply_member_changes(member: discord.Member, add_roles: list = (), remove_roles: list = (), nick: str = None, reason: str = None) -> list:
+    """Agregar/quitar roles y cambiar el apodo con un único Member.edit.
+
+    Los roles que el bot no puede asignar por jerarquía (o gestionados por
+    integraciones) se omiten en lugar de hacer fallar todo el cambio. Devuelve la
+    lista de cambios omitidos, legible para mostrarla al staff.
+    """
+    member = member.guild.get_member(member.id) or member
+    current = [role for role in member.roles if not role.is_default()]
+    add_roles = [role for role in add_roles if role is not None and role not in current]
+    remove_roles = [role for role in remove_roles if role is not None and role in current]
+
+    blocked = [role for role in add_roles + remove_roles if not role.is_assignable()]
+    skipped = [f"rol {role.name}" for role in blocked]
+    final_roles = [role for role in current if role not in remove_roles or role in blocked]
+    final_roles += [role for role in add_roles if role not in blocked]
+
+    changes = {}
+    if set(final_roles) != set(current):
+        changes["roles"] = final_roles
+    if nick is not None:
+        nick = nick[:NICKNAME_MAX_LENGTH]
+        if nick != member.nick:
+            if can_change_nick(member):
+                changes["nick"] = nick
+            else:
+                skipped.append("apodo")
+    if not changes:
+        return skipped
+
+    try:
+        await member.edit(reason=reason, **changes)
+    except discord.Forbidden as e:
+        # La jerarquía cambió desde el último evento del gateway: aplicar solo los roles
+        print(f"⚠️ No se pudo editar a {member} en una sola llamada: {e}")
+        if "nick" not in changes or "roles" not in changes:
+            skipped.extend(["roles"] if "roles" in changes else ["apodo"])
+            return skipped
+        skipped.append("apodo")
+        try:
+            await member.edit(reason=reason, roles=changes["roles"])
+        except discord.Forbidden as e:
+            print(f"⚠️ No se pudieron editar los roles de {member}: {e}")
+            skipped.append("roles")
+    return skipped
+
+# =============================================
+# ÍNDICE DE NOMBRES DE MIEMBROS
+# =============================================
+# Buscar miembros por nombre recorriendo guild.members es lineal en el tamaño del
+# servidor. Cada servidor mantiene un índice casefold de usuario/nombre visible/nombre
+# global: un dict para coincidencias exactas y una lista ordenada para prefijos con
+# bisect. Se construye al iniciar y lo actualizan los eventos de miembros.
+MEMBER_SEARCH_LIMIT = 25  # máximo de opciones que admite un Select de Discord
+MEMBER_MENTION_RE = re.compile(r"^<@!?(\d+)>$")
+
+def normalize_member_query(text: str) -> str:
+    return text.strip().lstrip("@").casefold()
+
+def member_name_keys(member: discord.Member) -> set:
+    names = (member.name, member.display_name, getattr(member, "global_name", None))
+    return {name.casefold() for name in names if name}
+
+class MemberNameIndex:
+    """Nombres casefold -> IDs de miembros de un servidor."""
+    def __init__(self):
+        self._exact = {}
+        self._sorted = []
+        self._keys = {}
+
+    def rebuild(self, members):
+        self._exact.clear()
+        self._keys.clear()
+        entries = []
+        for member in members:
+            keys = member_name_keys(member)
+            self._keys[member.id] = keys
+            for key in keys:
+                self._exact.setdefault(key, set()).add(member.id)
+                entries.append((key, member.id))
+        entries.sort()
+        self._sorted = entries
+
+    def add(self, member: discord.Member):
+        """Indexar (o reindexar tras un cambio de nombre) a un miembro."""
+        keys = member_name_keys(member)
+        if self._keys.get(member.id) == keys:
+            return
+        self.remove(member.id)
+        self._keys[member.id] = keys
+        for key in keys:
+            self._exact.setdefault(key, set()).add(member.id)
+            bisect.insort(self._sorted, (key, member.id))
+
+    def remove(self, member_id: int):
+        for key in self._keys.pop(member_id, ()):
+            ids = self._exact.get(key)
+            if ids is not None:
+                ids.discard(member_id)
+                if not ids:
+                    del self._exact[key]
+            i = bisect.bisect_left(self._sorted, (key, member_id))
+            if i < len(self._sorted) and self._sorted[i] == (key, member_id):
+                del self._sorted[i]
+
+    def exact(self, query: str) -> list:
+        return sorted(self._exact.get(normalize_member_query(query), ()))
+
+    def prefix(self, query: str, limit: int = MEMBER_SEARCH_LIMIT) -> list:
+        """IDs cuyos nombres empiezan por `query`, sin repetir, en orden alfabético."""
+        key = normalize_member_query(query)
+        ids = []
+        for i in range(bisect.bisect_left(self._sorted, (key,)), len(self._sorted)):
+            name, member_id = self._sorted[i]
+            if not name.startswith(key) or len(ids) >= limit:
+                break
+            if member_id not in ids:
+                ids.append(member_id)
+        return ids
+
+member_name_indexes = {}
+
+def build_member_name_index(guild: discord.Guild) -> MemberNameIndex:
+    """Indexar todos los miembros del servidor (recorrido completo, solo al iniciar)."""
+    index = member_name_indexes[guild.id] = MemberNameIndex()
+    index.rebuild(guild.members)
+    return index
+
+def get_member_name_index(guild: discord.Guild) -> MemberNameIndex:
+    return member_name_indexes.get(guild.id) or build_member_name_index(guild)
+
+async def get_or_fetch_member(guild: discord.Guild, user_id: int):
+    """Miembro desde la caché del gateway; solo se consulta la API si no está."""
+    member = guild.get_member(user_id)
+    if member is not None:
+        return member
+    try:
+        return await guild.fetch_member(user_id)
+    except (discord.NotFound, discord.HTTPException):
+        return None
+
+async def lookup_member(guild: discord.Guild, query: str):
+    """Resolver un ID, mención o nombre exacto (sin mayúsculas) a un único miembro.
+
+    Devuelve None si no hay coincidencia o si el nombre es ambiguo.
+    """
+    query = query.strip()
+    match = MEMBER_MENTION_RE.match(query)
+    if match or query.isdigit():
+        return await get_or_fetch_member(guild, int(match.group(1) if match else query))
+    ids = get_member_name_index(guild).exact(query)
+    return guild.get_member(ids[0]) if len(ids) == 1 else None
+
+def search_members(guild: discord.Guild, query: str, limit: int = MEMBER_SEARCH_LIMIT) -> list:
+    """Miembros cuyo usuario o nombre visible empieza por `query`."""
+    ids = get_member_name_index(guild).prefix(query, limit)
+    return [member for member in map(guild.get_member, ids) if member is not None]
+
+# =============================================
+# CACHÉ DE PERFILES DE MODERACIÓN
+# =============================================
+class ModerationProfileCache:
+    """Caché LRU en memoria con el perfil de moderación de cada usuario.
+
+    El perfil guarda las sanciones activas y el número de advertencias verbales. Se
+    actualiza por escritura directa (write-through) desde save_sanction,
+    delete_user_sanctions y save_warning, por lo que las consultas repetidas de un
+    mismo jugador no vuelven a tocar la base de datos.
+    """
+    def __init__(self, max_users: int = 1024):
+        self.max_users = max_users
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._profiles = OrderedDict()
+        self._lock = threading.Lock()
+        self._write_seq = 0
+
+    def get(self, user_id: int):
+        """Obtener el perfil en caché de un usuario o None si no está cargado."""
+        with self._lock:
+            profile = self._profiles.get(user_id)
+            if profile is None:
+                self.misses += 1
+                return None
+            self._profiles.move_to_end(user_id)
+            self.hits += 1
+            return profile
+
+    def load_token(self) -> int:
+        """Marca a pasar a put(): descarta cargas que compitieron con una escritura."""
+        with self._lock:
+            return self._write_seq
+
+    def put(self, user_id: int, profile: dict, token: int):
+        """Guardar el perfil leído de la base si no hubo escrituras desde `token`."""
+        with self._lock:
+            if token != self._write_seq:
+                return
+            self._store(user_id, profile)
+
+    def add_sanction(self, user_id: int, sanction: tuple):
+        """Agregar una sanción recién confirmada al perfil en caché."""
+        with self._lock:
+            self._write_seq += 1
+            profile = self._profiles.get(user_id)
+            if profile is not None:
+                profile["sanctions"] = [sanction] + profile["sanctions"]
+
+    def clear_sanctions(self, user_id: int):
+        """Registrar que el usuario ya no tiene sanciones activas."""
+        with self._lock:
+            self._write_seq += 1
+            profile = self._profiles.get(user_id)
+            if profile is not None:
+                profile["sanctions"] = []
+
+    def add_warning(self, user_id: int):
+        """Sumar una advertencia recién confirmada al perfil en caché."""
+        with self._lock:
+            self._write_seq += 1
+            profile = self._profiles.get(user_id)
+            if profile is not None:
+                profile["warnings"] += 1
+
+    def invalidate(self, user_ids):
+        """Descartar los perfiles de usuarios modificados fuera de las funciones anteriores."""
+        with self._lock:
+            self._write_seq += 1
+            for user_id in user_ids:
+                self._profiles.pop(user_id, None)
+
+    def _store(self, user_id: int, profile: dict):
+        self._profiles[user_id] = profile
+        self._profiles.move_to_end(user_id)
+        while len(self._profiles) > self.max_users:
+            self._profiles.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        """Contadores de aciertos, fallos y desalojos de la caché."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions, "size": len(self._profiles)}
+
+    def render_prometheus(self) -> str:
+        """Contadores de la caché en el formato de texto de Prometheus."""
+        stats = self.stats()
+        lines = []
+        for key, help_text in (
+            ("hits", "Consultas servidas desde la caché de perfiles."),
+            ("misses", "Consultas que tuvieron que leer la base de datos."),
+            ("evictions", "Perfiles desalojados por superar el tamaño máximo."),
+        ):
+            metric = f"santiago_profile_cache_{key}_total"
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric} {stats[key]}")
+        lines.append("# HELP santiago_profile_cache_size Perfiles cargados en la caché.")
+        lines.append("# TYPE santiago_profile_cache_size gauge")
+        lines.append(f"santiago_profile_cache_size {stats['size']}")
+        return "\n".join(lines) + "\n"
+
+profile_cache = ModerationProfileCache(max_users=int(os.getenv('PROFILE_CACHE_SIZE', 1024)))
+
 # =============================================
 # FUNCIONES DE SANCIONES
 # =============================================
-def save_sanction(user_id: int, username: str, reason: str, sanction_type: str, proof_url: str, admin_id: int, admin_name: str):
-    """Guardar una sanción en la base de datos."""
-    sanction_id = str(uuid.uuid4())
-    date = datetime.now()
+def build_sanction_row(user_id: int, username: str, reason: str, sanction_type: str, proof_url: str, admin_id: int, admin_name: str) -> tuple:
+    """Construir la fila de una nueva sanción con su ID ya generado."""
+    sanction_id = record_ids.next_id()
+    date = datetime.now(timezone.utc)
+    return (sanction_id, user_id, username, reason, sanction_type, proof_url, admin_id, admin_name, date, 1)
+
+def insert_sanctions(rows: list):
+    """Insertar un lote de sanciones en una sola transacción."""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        # Insertar la sanción
-        cursor.execute('''
-            INSERT INTO sanciones (sanction_id, user_id, username, reason, sanction_type, proof_url, admin_id, admin_name, date, active)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (sanction_id, user_id, username, reason, sanction_type, proof_url, admin_id, admin_name, date, 1))
-        conn.commit()
-        print(f"Sanción {sanction_id} guardada correctamente.")
-        return sanction_id
-    except sqlite3.Error as e:
+        storage.insert_sanctions(rows)
+        for row in rows:
+            sanction_id, user_id, _, reason, sanction_type, proof_url, _, admin_name, date, _ = row
+            profile_cache.add_sanction(user_id, (sanction_id, reason, sanction_type, proof_url, admin_name, date))
+            print(f"Sanción {format_public_id(sanction_id)} guardada correctamente.")
+    except DB_ERRORS as e:
         print(f"Error al guardar sanción: {e}")
         raise
-    finally:
-        if conn:
-            conn.close()
+
+def save_sanction(user_id: int, username: str, reason: str, sanction_type: str, proof_url: str, admin_id: int, admin_name: str):
+    """Guardar una sanción en la base de datos y devolver su código público."""
+    row = build_sanction_row(user_id, username, reason, sanction_type, proof_url, admin_id, admin_name)
+    insert_sanctions([row])
+    return format_public_id(row[0])
 
 def count_active_sanctions(user_id: int) -> int:
     """Contar sanciones activas de un usuario."""
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT COUNT(*) as count FROM sanciones WHERE user_id = ? AND active = ?', (user_id, 1))
-        result = cursor.fetchone()
-        count = result['count']
-        return count
-    except sqlite3.Error as e:
-        print(f"Error al contar sanciones: {e}")
-        raise
-    finally:
-        if conn:
-            conn.close()
+    return len(get_user_sanctions(user_id))
 
 def get_user_sanctions(user_id: int) -> list:
     """Obtener todas las sanciones activas de un usuario."""
+    return list(get_moderation_profile(user_id)["sanctions"])
+
+def load_user_sanctions(user_id: int) -> list:
+    """Leer de la base las sanciones activas de un usuario y guardarlas en caché."""
+    return list(load_moderation_profile(user_id)["sanctions"])
+
+def get_moderation_profile(user_id: int) -> dict:
+    """Obtener el perfil de moderación (sanciones activas y advertencias) de un usuario."""
+    profile = profile_cache.get(user_id)
+    if profile is not None:
+        return dict(profile)
+    return load_moderation_profile(user_id)
+
+def load_moderation_profile(user_id: int) -> dict:
+    """Leer de la base el perfil de moderación de un usuario y guardarlo en caché."""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT sanction_id, reason, sanction_type, proof_url, admin_name, date
-            FROM sanciones
-            WHERE user_id = ? AND active = ?
-            ORDER BY date DESC
-        ''', (user_id, 1))
-        sanctions = cursor.fetchall()
-        # Convertir a formato de tupla para mantener compatibilidad
-        result = [(s['sanction_id'], s['reason'], s['sanction_type'], s['proof_url'], s['admin_name'], s['date']) for s in sanctions]
-        return result
-    except sqlite3.Error as e:
+        token = profile_cache.load_token()
+        profile = {
+            "sanctions": storage.load_active_sanctions(user_id),
+            "warnings": storage.count_warnings(user_id),
+        }
+        profile_cache.put(user_id, profile, token)
+        return dict(profile)
+    except DB_ERRORS as e:
         print(f"Error al obtener sanciones: {e}")
         raise
-    finally:
-        if conn:
-            conn.close()
+
+def save_warning(user_id: int, username: str, reason: str, proof_url: str, admin_id: int, admin_name: str) -> str:
+    """Registrar una advertencia verbal y devolver su código público."""
+    warning_id = record_ids.next_id()
+    row = (warning_id, user_id, username, reason, proof_url, admin_id, admin_name, datetime.now(timezone.utc))
+    try:
+        storage.insert_warning(row)
+        profile_cache.add_warning(user_id)
+        return format_public_id(warning_id)
+    except DB_ERRORS as e:
+        print(f"Error al guardar advertencia: {e}")
+        raise
 
 def delete_user_sanctions(user_id: int) -> int:
-    """Marcar todas las sanciones activas de un usuario como inactivas."""
+    """Marcar todas las sanciones activas de un usuario como inactivas.
+
+    Se ejecuta en una sola transacción y devuelve cuántas sanciones se desactivaron,
+    por lo que no hace falta contarlas antes por separado.
+    """
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('UPDATE sanciones SET active = ? WHERE user_id = ? AND active = ?', (0, user_id, 1))
-        conn.commit()
-        affected_rows = cursor.rowcount
+        affected_rows = storage.deactivate_sanctions(user_id)
+        profile_cache.clear_sanctions(user_id)
         return affected_rows
-    except sqlite3.Error as e:
+    except DB_ERRORS as e:
         print(f"Error al borrar sanciones: {e}")
         raise
-    finally:
-        if conn:
-            conn.close()
+
+SANCTIONS_PAGE_SIZE = 5
+# Cursor inicial: mayor que cualquier (fecha, id) posible
+FIRST_PAGE_CURSOR = (1 << 62, 1 << 62)
+
+def get_user_sanctions_page(user_id: int, active: bool, before: tuple = None, limit: int = SANCTIONS_PAGE_SIZE) -> tuple:
+    """Obtener una página de sanciones anteriores al cursor (fecha, id).
+
+    Devuelve (sanciones, cursor de la página siguiente o None si no hay más).
+    """
+    before = before or FIRST_PAGE_CURSOR
+    try:
+        sanctions = storage.sanctions_page(user_id, active, before, limit + 1)
+    except DB_ERRORS as e:
+        print(f"Error al obtener página de sanciones: {e}")
+        raise
+    return paginate_sanctions(sanctions, limit)
+
+def paginate_sanctions(sanctions: list, limit: int) -> tuple:
+    """Cortar una lista ordenada de sanciones en una página y su cursor siguiente."""
+    page = sanctions[:limit]
+    if len(sanctions) > limit:
+        last = page[-1]
+        return page, (to_epoch_ms(last[5]), last[0])
+    return page, None
+
+def get_sanction_by_code(code: str):
+    """Buscar una sanción por su código público o por su UUID antiguo (citados en apelaciones)."""
+    try:
+        try:
+            return storage.find_sanction(legacy_id=str(uuid.UUID(code.strip())))
+        except ValueError:
+            return storage.find_sanction(sanction_id=parse_public_id(code))
+    except DB_ERRORS as e:
+        print(f"Error al buscar sanción: {e}")
+        raise
 
 # =============================================
-# AUTOCOMPLETE PARA SANCIONES
+# FUNCIONES DE CALIFICACIONES
 # =============================================
-async def sanction_type_autocomplete(interaction: discord.Interaction, current: str) -> list[app_commands.Choice[str]]:
-    """Autocompletar tipos de sanción."""
-    sanction_types = [
-        {"name": "Advertencia 1", "role_id": Roles.WARN_1},
-        {"name": "Advertencia 2", "role_id": Roles.WARN_2},
-        {"name": "Advertencia 3", "role_id": Roles.WARN_3}
-    ]
-    return [
-        app_commands.Choice(name=sanction["name"], value=sanction["name"])
-        for sanction in sanction_types
-        if current.lower() in sanction["name"].lower()
+# Las calificaciones se particionan por semana ISO (columna week_key). El reinicio
+# semanal solo cambia la semana activa; las semanas anteriores siguen consultables
+# hasta que la política de retención las elimina.
+RATING_RETENTION_WEEKS = int(os.getenv('RATING_RETENTION_WEEKS', 52))
+active_rating_week = None
+
+def load_active_rating_week() -> int:
+    """Cargar la semana activa de calificaciones desde bot_state."""
+    global active_rating_week
+    active_rating_week = storage.get_state('active_rating_week') or week_key_for(datetime.now(timezone.utc))
+    return active_rating_week
+
+def build_rating_row(staff_id: int, staff_name: str, rating: int, comment: str, user_id: int, user_name: str) -> tuple:
+    """Construir la fila de una nueva calificación con su ID ya generado."""
+    rating_id = record_ids.next_id()
+    date = datetime.now(timezone.utc)
+    return (rating_id, staff_id, staff_name, rating, comment, user_id, user_name, date, active_rating_week)
+
+def insert_ratings(rows: list):
+    """Insertar un lote de calificaciones y actualizar los agregados por staff en la misma transacción."""
+    try:
+        storage.insert_ratings(rows)
+    except DB_ERRORS as e:
+        print(f"Error al guardar calificación: {e}")
+        raise
+
+def save_rating(staff_id: int, staff_name: str, rating: int, comment: str, user_id: int, user_name: str):
+    """Guardar una calificación en la base de datos y devolver su código público."""
+    row = build_rating_row(staff_id, staff_name, rating, comment, user_id, user_name)
+    insert_ratings([row])
+    return format_public_id(row[0])
+
+def get_top_staff_list(limit: int = 10, min_ratings: int = 3, week_key: int = None) -> list:
+    """Obtener los staff con mejor promedio de una semana (por defecto la activa) a partir de los agregados."""
+    week_key = week_key or active_rating_week
+    try:
+        return storage.top_staff(week_key, min_ratings, limit)
+    except DB_ERRORS as e:
+        print(f"Error al obtener top staff: {e}")
+        raise
+
+def get_top_staff() -> tuple:
+    """Obtener el staff con mejor promedio de calificación (mínimo 3 calificaciones)."""
+    top = get_top_staff_list(limit=1)
+    return top[0] if top else None
+
+def get_staff_rating_stats(staff_id: int, week_key: int = None) -> dict:
+    """Obtener promedio, total e histograma de estrellas de un staff en una semana (por defecto la activa)."""
+    week_key = week_key or active_rating_week
+    try:
+        result = storage.staff_stats(week_key, staff_id)
+        if not result or not result['rating_count']:
+            return None
+        return {
+            "staff_name": result['staff_name'],
+            "average": result['rating_sum'] / result['rating_count'],
+            "count": result['rating_count'],
+            "histogram": {stars: result[f'stars_{stars}'] for stars in range(1, 6)}
+        }
+    except DB_ERRORS as e:
+        print(f"Error al obtener estadísticas del staff: {e}")
+        raise
+
+def get_staff_rating_trend(staff_id: int, weeks: int = 8) -> list:
+    """Obtener (semana, promedio, total) de un staff en las últimas `weeks` semanas."""
+    try:
+        return storage.staff_trend(staff_id, shift_week_key(active_rating_week, -(weeks - 1)))
+    except DB_ERRORS as e:
+        print(f"Error al obtener tendencia del staff: {e}")
+        raise
+
+def purge_rating_weeks(keep_weeks: int = RATING_RETENTION_WEEKS) -> int:
+    """Eliminar las semanas de calificaciones más antiguas que la retención configurada."""
+    cutoff = shift_week_key(active_rating_week, -keep_weeks)
+    try:
+        return storage.purge_ratings_before(cutoff)
+    except DB_ERRORS as e:
+        print(f"Error al purgar calificaciones antiguas: {e}")
+        raise
+
+def rotate_rating_week(expected_week: int):
+    """Reiniciar las calificaciones semanales cambiando la semana activa (sin borrar filas).
+
+    El cambio es un compare-and-set sobre `expected_week`: si la semana activa ya no es
+    esa (otra tarea o instancia ya la rotó) no se cambia nada y se devuelve None.
+    """
+    global active_rating_week
+    new_week = max(shift_week_key(expected_week, 1), week_key_for(datetime.now(timezone.utc)))
+    try:
+        rotated = storage.compare_and_set_state('active_rating_week', expected_week, new_week)
+        current_week = new_week if rotated else storage.get_state('active_rating_week')
+    except DB_ERRORS as e:
+        print(f"Error al cambiar la semana de calificaciones: {e}")
+        raise
+    active_rating_week = current_week or active_rating_week
+    if not rotated:
+        print(f"La semana {format_week_key(expected_week)} ya había sido rotada; se omite.")
+        return None
+    print(f"Semana de calificaciones activa: {format_week_key(new_week)}")
+    purge_rating_weeks()
+    return new_week
+
+# =============================================
+# BÚSQUEDA DE TEXTO COMPLETO
+# =============================================
+SEARCH_PAGE_SIZE = 5
+SEARCH_MAX_CANDIDATES = int(os.getenv('SEARCH_MAX_CANDIDATES', 1000))
+def search_words(text: str) -> list:
+    """Palabras de una búsqueda libre; una palabra terminada en * busca por prefijo (metag*)."""
+    words = re.findall(r"\w+\*?", text)
+    if not words:
+        raise ValueError("La búsqueda no contiene palabras")
+    return words
+
+def build_fts_query(text: str) -> str:
+    """Consulta FTS5 segura (SQLite) que exige todas las palabras."""
+    return " ".join(f'"{word[:-1]}"*' if word.endswith("*") else f'"{word}"' for word in search_words(text))
+
+def build_boolean_query(text: str) -> str:
+    """Consulta FULLTEXT en modo booleano (MySQL) que exige todas las palabras."""
+    return " ".join(f'+{word}' if word.endswith("*") else f'+"{word}"' for word in search_words(text))
+
+def search_records(table: str, text: str, since: datetime = None, page: int = 0, limit: int = SEARCH_PAGE_SIZE) -> tuple:
+    """Buscar sanciones o calificaciones por texto, ordenadas por relevancia.
+
+    Devuelve (filas de la página, hay página siguiente).
+    """
+    min_id = record_id_floor(since) if since else 0
+    try:
+        rows = storage.search(table, text, min_id, SEARCH_MAX_CANDIDATES, limit + 1, page * limit)
+    except DB_ERRORS as e:
+        print(f"Error al buscar en {table}: {e}")
+        raise
+    return rows[:limit], len(rows) > limit
+
+# =============================================
+# FUNCIONES DE TICKETS
+# =============================================
+# Cada ticket queda registrado con su número correlativo por categoría. El estado
+# (atendido, cerrado, participantes) se guarda en la tabla y no en los embeds.
+def open_ticket(category: str, opener_id: int, opener_name: str, data: dict) -> tuple:
+    """Registrar un ticket nuevo y devolver (ticket_id, número en su categoría)."""
+    ticket_id = record_ids.next_id()
+    try:
+        number = storage.open_ticket(
+            ticket_id, category, opener_id, opener_name,
+            json.dumps(data, ensure_ascii=False), datetime.now(timezone.utc)
+        )
+        return ticket_id, number
+    except DB_ERRORS as e:
+        print(f"Error al registrar ticket: {e}")
+        raise
+
+def set_ticket_channel(ticket_id: int, channel_id: int):
+    """Asociar el canal de Discord a un ticket ya registrado."""
+    try:
+        storage.set_ticket_channel(ticket_id, channel_id)
+    except DB_ERRORS as e:
+        print(f"Error al asociar canal al ticket: {e}")
+        raise
+
+def get_ticket(channel_id: int):
+    """Obtener el ticket de un canal (None para tickets anteriores al registro)."""
+    try:
+        return storage.get_ticket(channel_id)
+    except DB_ERRORS as e:
+        print(f"Error al obtener ticket: {e}")
+        raise
+
+def claim_ticket(channel_id: int, staff_id: int) -> str:
+    """Reclamar un ticket: devuelve 'claimed', 'taken' (ya atendido o cerrado) o 'unknown'."""
+    try:
+        if storage.claim_ticket(channel_id, staff_id, datetime.now(timezone.utc)):
+            return "claimed"
+        return "taken" if storage.get_ticket(channel_id) is not None else "unknown"
+    except DB_ERRORS as e:
+        print(f"Error al reclamar ticket: {e}")
+        raise
+
+def close_ticket(channel_id: int, closed_by: int, reason: str) -> bool:
+    """Marcar como cerrado el ticket de un canal; False si el canal no tiene ticket registrado."""
+    try:
+        ticket = storage.get_ticket(channel_id)
+        if ticket is None:
+            return False
+        storage.close_ticket(ticket['ticket_id'], "closed", closed_by, reason, datetime.now(timezone.utc))
+        return True
+    except DB_ERRORS as e:
+        print(f"Error al cerrar ticket: {e}")
+        raise
+
+def fail_ticket(ticket_id: int, reason: str):
+    """Marcar como fallido un ticket cuyo canal no se pudo crear (su número no se reutiliza)."""
+    try:
+        storage.close_ticket(ticket_id, "failed", None, reason, datetime.now(timezone.utc))
+    except DB_ERRORS as e:
+        print(f"Error al marcar ticket fallido: {e}")
+        raise
+
+def add_ticket_participant(channel_id: int, user_id: int):
+    """Registrar un usuario agregado al ticket."""
+    try:
+        storage.add_ticket_participant(channel_id, user_id)
+    except DB_ERRORS as e:
+        print(f"Error al agregar participante al ticket: {e}")
+        raise
+
+def ticket_numbers_in_guild(guild: discord.Guild) -> dict:
+    """Mayor número de ticket abierto por categoría según los nombres de los canales.
+
+    Los tickets creados antes del registro en la base solo existen como canales
+    `{categoría}-{número}-{usuario}`; sus números no deben volver a asignarse.
+    """
+    numbers = {}
+    for category, info in TICKET_CATEGORIES.items():
+        category_channel = guild.get_channel(info["id"])
+        if category_channel is None:
+            continue
+        pattern = re.compile(rf"^{re.escape(category)}-(\d+)-")
+        for channel in category_channel.channels:
+            match = pattern.match(channel.name)
+            if match:
+                numbers[category] = max(numbers.get(category, 0), int(match.group(1)))
+    return numbers
+
+def seed_ticket_counters(numbers: dict):
+    """Asegurar que los contadores de tickets no reutilicen números ya en uso."""
+    if not numbers:
+        return
+    try:
+        storage.seed_ticket_counters(numbers)
+    except DB_ERRORS as e:
+        print(f"Error al sembrar los contadores de tickets: {e}")
+        raise
+
+# =============================================
+# REGISTRO DE AUDITORÍA
+# =============================================
+# Cada acción del staff agrega un evento que nunca se modifica ni se borra. Los eventos
+# se escriben en lotes desde una cola diferida, así los comandos no esperan al disco.
+AUDIT_QUERY_LIMIT = 20
+AUDIT_ACTIONS = {
+    "sancion": "⚠️ Sanción",
+    "ban": "🔨 Baneo",
+    "borrar_sanciones": "🗑️ Sanciones borradas",
+    "advertencia": "📢 Advertencia verbal",
+    "ticket_reclamado": "🎟️ Ticket reclamado",
+    "ticket_cerrado": "🔒 Ticket cerrado",
+    "ticket_usuario_agregado": "➕ Usuario agregado a ticket",
+    "postulacion_aceptada": "✅ Postulación aceptada",
+    "postulacion_denegada": "❌ Postulación denegada",
+    "verificacion_aceptada": "✅ Verificación aceptada",
+    "verificacion_denegada": "❌ Verificación denegada",
+    "servidor_abierto": "🟢 Servidor abierto",
+    "servidor_cerrado": "🔴 Servidor cerrado",
+    "votacion_iniciada": "🗳️ Votación iniciada",
+}
+
+def build_audit_row(action: str, actor_id: int, target_id: int, payload: dict) -> tuple:
+    """Construir la fila de un evento con su payload en JSON compacto."""
+    payload_json = json.dumps(payload, ensure_ascii=False, separators=(',', ':'), default=str) if payload else None
+    return (record_ids.next_id(), datetime.now(timezone.utc), actor_id, target_id, action, payload_json)
+
+def insert_audit_events(rows: list):
+    """Insertar un lote de eventos de auditoría en una sola transacción."""
+    try:
+        storage.insert_audit_events(rows)
+    except DB_ERRORS as e:
+        print(f"Error al guardar eventos de auditoría: {e}")
+        raise
+
+def get_audit_events(role: str, user_id: int, since: datetime, limit: int = AUDIT_QUERY_LIMIT) -> tuple:
+    """Eventos de un usuario como autor ('actor') u objetivo ('target'); devuelve (eventos, hay_más)."""
+    try:
+        rows = storage.audit_events(role, user_id, since, limit + 1)
+    except DB_ERRORS as e:
+        print(f"Error al consultar auditoría: {e}")
+        raise
+    events = [
+        (event_id, ts, actor_id, target_id, action, json.loads(payload) if payload else {})
+        for event_id, ts, actor_id, target_id, action, payload in rows[:limit]
     ]
+    return events, len(rows) > limit
+
+def format_audit_event(event: tuple) -> str:
+    """Línea legible de un evento para el embed de /auditoria."""
+    _, ts, actor_id, target_id, action, payload = event
+    line = f"`{format_santiago(ts)}` {AUDIT_ACTIONS.get(action, action)} · <@{actor_id}>"
+    if target_id is not None:
+        line += f" → <@{target_id}>"
+    details = ", ".join(f"{key}: {value}" for key, value in payload.items())
+    if details:
+        line += f"\n└ {details[:120]}{'…' if len(details) > 120 else ''}"
+    return line
+
+# =============================================
+# ACCESO ASÍNCRONO A LA BASE DE DATOS
+# =============================================
+# Las funciones de sqlite3 son bloqueantes: se ejecutan en hilos dedicados para no
+# detener el loop del gateway. Un único hilo escritor serializa las escrituras y un
+# grupo acotado de hilos lectores atiende las consultas.
+db_write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+db_read_executor = ThreadPoolExecutor(max_workers=DB_READ_WORKERS, thread_name_prefix="db-reader")
+
+async def run_db_write(func, *args, **kwargs):
+    """Ejecutar una función de escritura en el hilo escritor de la base de datos."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(db_write_executor, functools.partial(func, *args, **kwargs))
+
+async def run_db_read(func, *args, **kwargs):
+    """Ejecutar una función de lectura en los hilos lectores de la base de datos."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(db_read_executor, functools.partial(func, *args, **kwargs))
+
+class WriteBehindQueue:
+    """Cola de escritura diferida con group commit.
+
+    Acumula filas durante `linger` segundos o hasta `max_batch` filas y las escribe con
+    una única llamada a `flush_func` (executemany en una transacción) en el hilo
+    escritor. Quien llama a submit() espera hasta que su lote está confirmado en disco;
+    submit_nowait() encola sin esperar y solo registra los errores en consola.
+    """
+    def __init__(self, name: str, flush_func, max_batch: int = 50, linger: float = 0.005):
+        self.name = name
+        self.flush_func = flush_func
+        self.max_batch = max_batch
+        self.linger = linger
+        self._pending = []
+        self._timer = None
+        self._tasks = set()
+
+    async def submit(self, row: tuple):
+        """Encolar una fila y esperar a que su transacción se confirme."""
+        await self._enqueue(row)
+
+    def submit_nowait(self, row: tuple):
+        """Encolar una fila sin esperar su confirmación."""
+        self._enqueue(row).add_done_callback(self._report_failure)
+
+    def _enqueue(self, row: tuple) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((row, future))
+        if len(self._pending) >= self.max_batch:
+            self._start_flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.linger, self._start_flush)
+        return future
+
+    def _report_failure(self, future: asyncio.Future):
+        if not future.cancelled() and future.exception() is not None:
+            print(f"Error al guardar en {self.name}: {future.exception()}")
+
+    def _start_flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        task = asyncio.create_task(self._flush(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _flush(self, batch: list):
+        try:
+            await run_db_write(self.flush_func, [row for row, _ in batch])
+            results = [None] * len(batch)
+        except Exception as e:
+            if len(batch) == 1:
+                results = [e]
+            else:
+                # Reintentar fila por fila para que un registro inválido no arrastre al lote
+                print(f"⚠️ Falló el lote de {self.name} ({len(batch)} filas), reintentando individualmente: {e}")
+                results = []
+                for row, _ in batch:
+                    try:
+                        await run_db_write(self.flush_func, [row])
+                        results.append(None)
+                    except Exception as row_error:
+                        results.append(row_error)
+        for (_, future), error in zip(batch, results):
+            if future.done():
+                continue
+            if error is None:
+                future.set_result(None)
+            else:
+                future.set_exception(error)
+
+    async def flush(self):
+        """Escribir inmediatamente las filas pendientes y esperar los lotes en curso."""
+        self._start_flush()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+sanction_write_queue = WriteBehindQueue("sanciones", insert_sanctions)
+rating_write_queue = WriteBehindQueue("calificaciones", insert_ratings)
+# Nadie espera los eventos de auditoría: una espera más larga agrupa más filas por transacción
+audit_write_queue = WriteBehindQueue("auditoria", insert_audit_events, max_batch=100, linger=0.25)
+WRITE_BEHIND_QUEUES = [sanction_write_queue, rating_write_queue, audit_write_queue]
+
+async def flush_write_queues():
+    """Vaciar todas las colas de escritura diferida (usado al apagar el bot)."""
+    for write_queue in WRITE_BEHIND_QUEUES:
+        await write_queue.flush()
+
+def shutdown_db():
+    """Detener los hilos de la base de datos y cerrar el pool de conexiones."""
+    db_write_executor.shutdown(wait=True)
+    db_read_executor.shutdown(wait=True)
+    backup_executor.shutdown(wait=True)
+    storage.close()
+
+async def save_sanction_async(*args, **kwargs) -> str:
+    """Guardar una sanción mediante la cola de escritura diferida y devolver su código público."""
+    row = build_sanction_row(*args, **kwargs)
+    await sanction_write_queue.submit(row)
+    return format_public_id(row[0])
+
+async def count_active_sanctions_async(user_id: int) -> int:
+    """Versión awaitable de count_active_sanctions."""
+    return len(await get_user_sanctions_async(user_id))
+
+async def get_user_sanctions_async(user_id: int) -> list:
+    """Versión awaitable de get_user_sanctions (sin salir del loop si está en caché)."""
+    profile = profile_cache.get(user_id)
+    if profile is not None:
+        return list(profile["sanctions"])
+    return await run_db_read(load_user_sanctions, user_id)
+
+async def get_moderation_profile_async(user_id: int) -> dict:
+    """Versión awaitable de get_moderation_profile (sin salir del loop si está en caché)."""
+    profile = profile_cache.get(user_id)
+    if profile is not None:
+        return dict(profile)
+    return await run_db_read(load_moderation_profile, user_id)
+
+async def save_warning_async(*args, **kwargs) -> str:
+    """Versión awaitable de save_warning."""
+    return await run_db_write(save_warning, *args, **kwargs)
+
+async def get_user_sanctions_page_async(user_id: int, active: bool, before: tuple = None) -> tuple:
+    """Versión awaitable de get_user_sanctions_page.
+
+    Las sanciones activas se sirven desde el perfil en caché cuando está cargado.
+    """
+    if active:
+        profile = profile_cache.get(user_id)
+        if profile is not None:
+            before = before or FIRST_PAGE_CURSOR
+            remaining = sorted(
+                (s for s in profile["sanctions"] if (to_epoch_ms(s[5]), s[0]) < before),
+                key=lambda s: (s[5], s[0]),
+                reverse=True
+            )
+            return paginate_sanctions(remaining, SANCTIONS_PAGE_SIZE)
+    return await run_db_read(get_user_sanctions_page, user_id, active, before)
+
+async def get_sanction_by_code_async(code: str):
+    """Versión awaitable de get_sanction_by_code."""
+    return await run_db_read(get_sanction_by_code, code)
+
+async def delete_user_sanctions_async(user_id: int) -> int:
+    """Versión awaitable de delete_user_sanctions."""
+    return await run_db_write(delete_user_sanctions, user_id)
+
+async def save_rating_async(*args, **kwargs) -> str:
+    """Guardar una calificación mediante la cola de escritura diferida y devolver su código público."""
+    row = build_rating_row(*args, **kwargs)
+    await rating_write_queue.submit(row)
+    return format_public_id(row[0])
+
+async def get_top_staff_async() -> tuple:
+    """Versión awaitable de get_top_staff."""
+    return await run_db_read(get_top_staff)
+
+async def get_staff_rating_stats_async(staff_id: int, week_key: int = None) -> dict:
+    """Versión awaitable de get_staff_rating_stats."""
+    return await run_db_read(get_staff_rating_stats, staff_id, week_key)
+
+async def get_staff_rating_trend_async(staff_id: int, weeks: int = 8) -> list:
+    """Versión awaitable de get_staff_rating_trend."""
+    return await run_db_read(get_staff_rating_trend, staff_id, weeks)
+
+async def search_records_async(table: str, text: str, since: datetime = None, page: int = 0) -> tuple:
+    """Versión awaitable de search_records."""
+    return await run_db_read(search_records, table, text, since, page)
+
+async def open_ticket_async(*args, **kwargs) -> tuple:
+    """Versión awaitable de open_ticket."""
+    return await run_db_write(open_ticket, *args, **kwargs)
+
+async def set_ticket_channel_async(ticket_id: int, channel_id: int):
+    """Versión awaitable de set_ticket_channel."""
+    return await run_db_write(set_ticket_channel, ticket_id, channel_id)
+
+async def claim_ticket_async(channel_id: int, staff_id: int) -> str:
+    """Versión awaitable de claim_ticket."""
+    return await run_db_write(claim_ticket, channel_id, staff_id)
+
+async def close_ticket_async(channel_id: int, closed_by: int, reason: str) -> bool:
+    """Versión awaitable de close_ticket."""
+    return await run_db_write(close_ticket, channel_id, closed_by, reason)
+
+async def fail_ticket_async(ticket_id: int, reason: str):
+    """Versión awaitable de fail_ticket."""
+    return await run_db_write(fail_ticket, ticket_id, reason)
+
+async def add_ticket_participant_async(channel_id: int, user_id: int):
+    """Versión awaitable de add_ticket_participant."""
+    return await run_db_write(add_ticket_participant, channel_id, user_id)
+
+async def seed_ticket_counters_async(guild: discord.Guild):
+    """Sembrar los contadores de tickets con los canales abiertos del servidor."""
+    return await run_db_write(seed_ticket_counters, ticket_numbers_in_guild(guild))
+
+def record_audit_event(action: str, actor, target=None, **payload):
+    """Registrar una acción del staff en la auditoría sin bloquear el comando.
+
+    `actor` y `target` son usuarios de Discord (o None si la acción no tiene objetivo);
+    los argumentos con nombre se guardan como payload JSON.
+    """
+    target_id = target.id if target is not None else None
+    audit_write_queue.submit_nowait(build_audit_row(action, actor.id, target_id, payload))
+
+async def get_audit_events_async(role: str, user_id: int, since: datetime) -> tuple:
+    """Versión awaitable de get_audit_events que incluye los eventos aún en cola."""
+    await audit_write_queue.flush()
+    return await run_db_read(get_audit_events, role, user_id, since)
+
+async def rotate_rating_week_async(expected_week: int):
+    """Versión awaitable de rotate_rating_week."""
+    return await run_db_write(rotate_rating_week, expected_week)
+
+# =============================================
+# IMPORTACIÓN Y EXPORTACIÓN MASIVA
+# =============================================
+# Los volcados se leen con un cursor y fetchmany() sobre una conexión propia (para no
+# ocupar una del pool durante minutos) y se escriben con aiofiles, lote a lote, por lo
+# que la memoria no crece con el tamaño de la tabla. La importación inserta bloques con
+# executemany, cada uno en su propia transacción del hilo escritor.
+EXPORT_DIR = os.getenv('EXPORT_DIR', 'exports')
+EXPORT_BATCH_SIZE = 1000
+IMPORT_BATCH_SIZE = 500
+EXPORT_ATTACH_LIMIT = 8 * 1024 * 1024  # Tamaño máximo para adjuntar el volcado en Discord
+
+EXPORT_COLUMNS = {
+    "sanciones": ("sanction_id", "user_id", "username", "reason", "sanction_type", "proof_url",
+                  "admin_id", "admin_name", "date", "active", "legacy_id"),
+    "calificaciones": ("rating_id", "staff_id", "staff_name", "rating", "comment", "user_id",
+                       "user_name", "date", "week_key", "legacy_id"),
+}
+EXPORT_INTEGER_COLUMNS = {"sanction_id", "rating_id", "user_id", "admin_id", "staff_id", "rating", "active", "week_key"}
+IMPORT_OPTIONAL_COLUMNS = {"week_key", "legacy_id"}
+
+def export_format(path: str) -> str:
+    """Formato del volcado según la extensión del archivo (.csv o .jsonl)."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in (".csv", ".jsonl"):
+        raise ValueError(f"Formato no soportado: {extension or path} (usa .csv o .jsonl)")
+    return extension[1:]
+
+def check_export_table(table: str) -> tuple:
+    """Columnas exportables de una tabla; rechaza tablas desconocidas."""
+    if table not in EXPORT_COLUMNS:
+        raise ValueError(f"Tabla no exportable: {table} (usa {' o '.join(EXPORT_COLUMNS)})")
+    return EXPORT_COLUMNS[table]
+
+def iter_table_batches(table: str, batch_size: int = EXPORT_BATCH_SIZE):
+    """Generador de lotes de filas de una tabla en orden de ID."""
+    return storage.iter_table_batches(table, check_export_table(table), batch_size)
+
+def serialize_rows(rows: list, columns: tuple, fmt: str) -> str:
+    """Convertir un lote de filas a texto CSV o JSONL (fechas en ISO 8601 UTC)."""
+    values = [[v.isoformat() if isinstance(v, datetime) else v for v in row] for row in rows]
+    if fmt == "jsonl":
+        return "".join(json.dumps(dict(zip(columns, row)), ensure_ascii=False) + "\n" for row in values)
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(values)
+    return buffer.getvalue()
+
+def parse_export_date(value) -> datetime:
+    """Leer una fecha de un volcado: ISO 8601 o epoch en milisegundos."""
+    if isinstance(value, int) or str(value).isdigit():
+        return from_epoch_ms(int(value))
+    parsed = datetime.fromisoformat(value)
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+def build_import_row(columns: tuple, record: dict) -> tuple:
+    """Convertir un registro leído de CSV/JSONL a una fila con los tipos de la tabla."""
+    row = []
+    for column in columns:
+        value = record.get(column)
+        if value == "":
+            value = None
+        if value is None:
+            if column not in IMPORT_OPTIONAL_COLUMNS:
+                raise ValueError(f"Falta la columna {column}")
+        elif column == "date":
+            value = parse_export_date(value)
+        elif column in EXPORT_INTEGER_COLUMNS:
+            value = int(value)
+        row.append(value)
+    if "week_key" in columns and row[columns.index("week_key")] is None:
+        row[columns.index("week_key")] = week_key_for(row[columns.index("date")])
+    return tuple(row)
+
+def import_rows(table: str, records: list) -> int:
+    """Insertar un bloque de registros importados en una transacción y devolver cuántos eran nuevos.
+
+    Los registros cuyo ID o legacy_id ya existen se omiten, así que reimportar un
+    volcado no duplica filas ni altera los agregados de calificaciones.
+    """
+    columns = check_export_table(table)
+    rows = {}
+    for record in records:
+        row = build_import_row(columns, record)
+        rows.setdefault(row[0], row)
+    try:
+        new_rows = storage.insert_missing_rows(table, columns, list(rows.values()))
+    except DB_ERRORS as e:
+        print(f"Error al importar {table}: {e}")
+        raise
+    for row in new_rows:
+        record_ids.observe(row[0])
+    if table == "sanciones":
+        profile_cache.invalidate({row[1] for row in new_rows})
+    return len(new_rows)
+
+async def export_table_async(table: str, path: str) -> int:
+    """Volcar una tabla a CSV/JSONL sin bloquear el loop y devolver cuántas filas se escribieron."""
+    columns = check_export_table(table)
+    fmt = export_format(path)
+    batches = iter_table_batches(table)
+    total = 0
+    try:
+        async with aiofiles.open(path, "w", encoding="utf-8", newline="") as f:
+            if fmt == "csv":
+                await f.write(serialize_rows([columns], columns, fmt))
+            while True:
+                rows = await run_db_read(next, batches, None)
+                if rows is None:
+                    break
+                await f.write(serialize_rows(rows, columns, fmt))
+                total += len(rows)
+    finally:
+        batches.close()
+    return total
+
+async def read_import_batches(path: str, batch_size: int = IMPORT_BATCH_SIZE):
+    """Leer un volcado CSV/JSONL en bloques de registros (dict por fila)."""
+    fmt = export_format(path)
+    async with aiofiles.open(path, "r", encoding="utf-8", newline="") as f:
+        header = next(csv.reader([await f.readline()])) if fmt == "csv" else None
+        lines, records, quotes = [], 0, 0
+        async for line in f:
+            if not line.strip() and not quotes % 2:
+                continue
+            lines.append(line)
+            if fmt == "csv":
+                # Un registro CSV termina en un salto de línea fuera de comillas
+                quotes += line.count('"')
+                if quotes % 2:
+                    continue
+            records += 1
+            if records >= batch_size:
+                yield parse_import_lines(lines, header)
+                lines, records, quotes = [], 0, 0
+        if lines:
+            yield parse_import_lines(lines, header)
+
+def parse_import_lines(lines: list, header: list) -> list:
+    """Parsear líneas completas de CSV (con cabecera) o JSONL a una lista de dicts."""
+    if header is None:
+        return [json.loads(line) for line in lines]
+    return list(csv.DictReader(lines, fieldnames=header))
+
+async def import_table_async(table: str, path: str) -> tuple:
+    """Importar un volcado CSV/JSONL por bloques; devuelve (filas leídas, filas nuevas)."""
+    check_export_table(table)
+    read, inserted = 0, 0
+    async for records in read_import_batches(path):
+        inserted += await run_db_write(import_rows, table, records)
+        read += len(records)
+    return read, inserted
 
 # =============================================
-# FUNCIONES DE CALIFICACIONES
+# COPIAS DE SEGURIDAD
 # =============================================
-def save_rating(staff_id: int, staff_name: str, rating: int, comment: str, user_id: int, user_name: str):
-    """Guardar una calificación en la base de datos."""
-    rating_id = str(uuid.uuid4())
-    date = datetime.now()
+# Copias en caliente con la API de backup de SQLite, por pasos de pocas páginas en un
+# hilo propio. La conexión de origen mantiene abierta una transacción de lectura: en
+# modo WAL eso fija una instantánea consistente sin bloquear al escritor y evita que
+# cada escritura concurrente reinicie la copia desde cero.
+BACKUP_DIR = os.getenv('BACKUP_DIR', 'backups')
+BACKUP_INTERVAL_HOURS = float(os.getenv('BACKUP_INTERVAL_HOURS', 6))
+BACKUP_KEEP = int(os.getenv('BACKUP_KEEP', 14))
+BACKUP_PAGES_PER_STEP = 256
+BACKUP_STEP_SLEEP = 0.005
+
+backup_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-backup")
+BACKUP_STATUS = {
+    "running": False,
+    "last_backup_at": None,
+    "last_duration_seconds": None,
+    "last_file": None,
+    "last_size_bytes": None,
+    "last_error": None,
+}
+
+def backup_database() -> str:
+    """Crear una copia comprimida de la base de datos y devolver su ruta."""
+    if DB_BACKEND != 'sqlite':
+        raise RuntimeError("Las copias con la API de backup solo aplican a SQLite; en MySQL usa mysqldump.")
+    os.makedirs(BACKUP_DIR, exist_ok=True)
+    started = time.monotonic()
+    BACKUP_STATUS["running"] = True
+    name = f"santiago_rp_{datetime.now(timezone.utc):%Y%m%d_%H%M%S}.db"
+    raw_path = os.path.join(BACKUP_DIR, name + ".tmp")
+    path = os.path.join(BACKUP_DIR, name + ".gz")
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO calificaciones (rating_id, staff_id, staff_name, rating, comment, user_id, user_name, date)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (rating_id, staff_id, staff_name, rating, comment, user_id, user_name, date))
-        conn.commit()
-        return rating_id
-    except sqlite3.Error as e:
-        print(f"Error al guardar calificación: {e}")
+        source = get_db_connection(db_pool.path)
+        target = sqlite3.connect(raw_path)
+        try:
+            source.execute("BEGIN")
+            source.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+            source.backup(target, pages=BACKUP_PAGES_PER_STEP, sleep=BACKUP_STEP_SLEEP)
+            source.execute("COMMIT")
+        finally:
+            target.close()
+            source.close()
+        with open(raw_path, "rb") as raw, gzip.open(path, "wb", compresslevel=6) as compressed:
+            shutil.copyfileobj(raw, compressed)
+        BACKUP_STATUS.update(
+            last_backup_at=datetime.now(timezone.utc).isoformat(),
+            last_duration_seconds=round(time.monotonic() - started, 3),
+            last_file=path,
+            last_size_bytes=os.path.getsize(path),
+            last_error=None,
+        )
+        rotate_backups()
+        print(f"💾 Copia de seguridad creada: {path}")
+        return path
+    except (sqlite3.Error, OSError) as e:
+        BACKUP_STATUS["last_error"] = str(e)
+        print(f"Error al crear la copia de seguridad: {e}")
         raise
     finally:
-        if conn:
-            conn.close()
+        BACKUP_STATUS["running"] = False
+        if os.path.exists(raw_path):
+            os.remove(raw_path)
+
+def rotate_backups(keep: int = BACKUP_KEEP) -> int:
+    """Eliminar las copias más antiguas y conservar solo las `keep` más recientes."""
+    backups = sorted(glob.glob(os.path.join(BACKUP_DIR, "santiago_rp_*.db.gz")))
+    old_backups = backups[:-keep] if keep > 0 else backups
+    for old_backup in old_backups:
+        os.remove(old_backup)
+    return len(old_backups)
+
+async def backup_database_async() -> str:
+    """Versión awaitable de backup_database (se ejecuta en el hilo de copias)."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(backup_executor, backup_database)
+
+backup_task = None
+
+async def scheduled_backups():
+    """Tarea de fondo que crea una copia cada BACKUP_INTERVAL_HOURS horas."""
+    if DB_BACKEND != 'sqlite':
+        print("ℹ️ Copias programadas desactivadas: el backend no es SQLite.")
+        return
+    await bot.wait_until_ready()
+    while not bot.is_closed():
+        try:
+            await backup_database_async()
+        except Exception as e:
+            print(f"❌ Falló la copia de seguridad programada: {e}")
+        await asyncio.sleep(BACKUP_INTERVAL_HOURS * 3600)
 
-def get_top_staff() -> tuple:
-    """Obtener el staff con mejor promedio de calificación (mínimo 3 calificaciones)."""
+# =============================================
+# ACCIONES PROGRAMADAS
+# =============================================
+# Acciones diferidas (p. ej. borrar las menciones @everyone de un anuncio) guardadas en
+# la tabla scheduled_actions para que sobrevivan a un reinicio. Una sola tarea espera
+# a la más próxima de un heap en memoria; programar una acción más cercana la despierta.
+ANNOUNCEMENT_PING_SECONDS = 30
+SCHEDULED_ACTION_HANDLERS = {}
+
+def scheduled_action(name: str):
+    """Registrar la corrutina que ejecuta las acciones programadas de tipo `name`."""
+    def decorator(func):
+        SCHEDULED_ACTION_HANDLERS[name] = func
+        return func
+    return decorator
+
+@scheduled_action("borrar_mensaje")
+async def delete_message_action(channel_id: int, message_id: int):
+    channel = bot.get_channel(channel_id)
+    if channel is None:
+        print(f"⚠️ Canal {channel_id} no encontrado; no se borró el mensaje {message_id}.")
+        return
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT staff_id, staff_name, AVG(rating) as avg_rating, COUNT(rating) as count_rating
-            FROM calificaciones
-            GROUP BY staff_id
-            HAVING COUNT(rating) >= 3
-            ORDER BY AVG(rating) DESC
-            LIMIT 1
-        ''')
-        result = cursor.fetchone()
-        if result:
-            return (result['staff_id'], result['staff_name'], result['avg_rating'], result['count_rating'])
-        return None
-    except sqlite3.Error as e:
-        print(f"Error al obtener top staff: {e}")
+        await channel.get_partial_message(message_id).delete()
+    except discord.NotFound:
+        pass
+
+def insert_scheduled_actions(rows: list):
+    """Guardar un lote de acciones programadas en una sola transacción."""
+    try:
+        storage.insert_scheduled_actions(rows)
+    except DB_ERRORS as e:
+        print(f"Error al guardar acciones programadas: {e}")
         raise
-    finally:
-        if conn:
-            conn.close()
 
-def clear_ratings():
-    """Borrar todas las calificaciones de la base de datos."""
+def delete_scheduled_action(action_id: int):
+    """Quitar una acción ya ejecutada."""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('DELETE FROM calificaciones')
-        conn.commit()
-    except sqlite3.Error as e:
-        print(f"Error al borrar calificaciones: {e}")
+        storage.delete_scheduled_action(action_id)
+    except DB_ERRORS as e:
+        print(f"Error al borrar acción programada: {e}")
         raise
-    finally:
-        if conn:
-            conn.close()
+
+def get_pending_scheduled_actions() -> list:
+    """Acciones pendientes (incluidas las vencidas mientras el bot estaba apagado)."""
+    try:
+        return storage.pending_scheduled_actions()
+    except DB_ERRORS as e:
+        print(f"Error al cargar acciones programadas: {e}")
+        raise
+
+class ActionScheduler:
+    """Temporizador único sobre un heap de (run_at, action_id, acción, payload)."""
+    def __init__(self):
+        self._heap = []
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._running = set()
+
+    async def start(self):
+        """Cargar las acciones pendientes y arrancar la tarea (una sola vez)."""
+        if self._task is not None and not self._task.done():
+            return
+        rows = await run_db_read(get_pending_scheduled_actions)
+        self._heap = [(to_epoch_ms(run_at), action_id, action, payload) for action_id, run_at, action, payload in rows]
+        heapq.heapify(self._heap)
+        if self._heap:
+            print(f"⏰ {len(self._heap)} acciones programadas pendientes.")
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    async def schedule(self, entries: list):
+        """Programar [(acción, run_at, payload)]: se guardan y luego se cargan al heap.
+
+        Si no se pueden guardar se programan solo en memoria (no sobrevivirán a un reinicio).
+        """
+        rows = [(record_ids.next_id(), run_at, action, json.dumps(payload)) for action, run_at, payload in entries]
+        try:
+            await run_db_write(insert_scheduled_actions, rows)
+        except DB_ERRORS:
+            print(f"⚠️ {len(rows)} acciones se programarán solo en memoria.")
+        for action_id, run_at, action, payload in rows:
+            heapq.heappush(self._heap, (to_epoch_ms(run_at), action_id, action, payload))
+        self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            now_ms = int(time.time() * 1000)
+            while self._heap and self._heap[0][0] <= now_ms:
+                _, action_id, action, payload = heapq.heappop(self._heap)
+                task = asyncio.create_task(self._execute(action_id, action, payload))
+                self._running.add(task)
+                task.add_done_callback(self._running.discard)
+            timeout = (self._heap[0][0] - now_ms) / 1000 if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _execute(self, action_id: int, action: str, payload: str):
+        handler = SCHEDULED_ACTION_HANDLERS.get(action)
+        try:
+            if handler is None:
+                print(f"⚠️ Acción programada desconocida: {action}")
+            else:
+                await handler(**json.loads(payload))
+        except Exception as e:
+            print(f"Error al ejecutar la acción programada {action} ({action_id}): {e}")
+        try:
+            await run_db_write(delete_scheduled_action, action_id)
+        except DB_ERRORS:
+            pass
+
+action_scheduler = ActionScheduler()
+
+async def schedule_message_deletions(messages: list, delay: float):
+    """Borrar los mensajes dentro de `delay` segundos sin ocupar al comando que los envió."""
+    run_at = datetime.now(timezone.utc) + timedelta(seconds=delay)
+    await action_scheduler.schedule([
+        ("borrar_mensaje", run_at, {"channel_id": message.channel.id, "message_id": message.id})
+        for message in messages
+    ])
 
 # =============================================
 # AUTOCOMPLETE
@@ -897,8 +4162,8 @@ class CKRequestModal(ui.Modal, title="💀 Solicitud de CK"):
 
 class AddUserModal(ui.Modal, title="➕ Agregar Usuario al Ticket"):
     username = ui.TextInput(
-        label="Nombre de usuario de Discord",
-        placeholder="Ejemplo: Jrsmile22 (sin @)",
+        label="Usuario, nombre visible o ID de Discord",
+        placeholder="Ejemplo: Jrsmile22 (o solo el comienzo del nombre)",
         style=discord.TextStyle.short,
         required=True
     )
@@ -1047,6 +4312,44 @@ class TicketCreationView(ui.View):
         data = {child.label: child.value for child in modal.children if isinstance(child, ui.TextInput)}
         await create_ticket_channel(interaction=modal.interaction, category=category, data=data)
 
+class MemberSelectView(ui.View):
+    """Elegir un miembro entre las coincidencias de una búsqueda por nombre."""
+    def __init__(self, owner_id: int, members: list):
+        super().__init__(timeout=120)
+        self.owner_id = owner_id
+        self.members = {member.id: member for member in members}
+        self.selected = None
+        self.select = ui.Select(
+            placeholder="👤 Selecciona al usuario...",
+            min_values=1,
+            max_values=1,
+            options=[
+                discord.SelectOption(
+                    label=member.display_name[:100],
+                    value=str(member.id),
+                    description=f"@{member.name}"[:100]
+                )
+                for member in members[:MEMBER_SEARCH_LIMIT]
+            ]
+        )
+        self.select.callback = self.on_select
+        self.add_item(self.select)
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if interaction.user.id != self.owner_id:
+            await interaction.response.send_message("❌ Solo quien inició la acción puede elegir.", ephemeral=True)
+            return False
+        return True
+
+    async def on_select(self, interaction: discord.Interaction):
+        self.selected = self.members.get(int(self.select.values[0]))
+        await interaction.response.edit_message(embed=create_embed(
+            title="👤 Usuario Seleccionado",
+            description=f"Seleccionaste a {self.selected.mention}.",
+            color=Colors.INFO
+        ), view=None)
+        self.stop()
+
 # =============================================
 # FUNCIONES PRINCIPALES
 # =============================================
@@ -1068,19 +4371,24 @@ async def create_ticket_channel(interaction: discord.Interaction, category: str,
                     manage_messages=True
                 )
         
-        ticket_num = len([c for c in interaction.guild.get_channel(category_info["id"]).channels 
-                         if c.name.startswith(f"{category}-")]) + 1
+        # Número correlativo reservado de forma atómica en la base de datos
+        ticket_id, ticket_num = await open_ticket_async(category, interaction.user.id, interaction.user.name, data)
         channel_name = f"{category}-{ticket_num:03d}-{interaction.user.name}"[:100]
         
-        ticket_channel = await interaction.guild.create_text_channel(
-            name=channel_name,
-            category=discord.Object(id=category_info["id"]),
-            overwrites=overwrites
-        )
+        try:
+            ticket_channel = await interaction.guild.create_text_channel(
+                name=channel_name,
+                category=discord.Object(id=category_info["id"]),
+                overwrites=overwrites
+            )
+        except Exception as e:
+            await fail_ticket_async(ticket_id, f"No se pudo crear el canal: {e}")
+            raise
+        await set_ticket_channel_async(ticket_id, ticket_channel.id)
         
         embed = create_embed(
             title=f"{category_info['emoji']} Ticket: {category_info['title']}",
-            description=f"**Usuario:** {interaction.user.mention}\n**Categoría:** {category_info['title']}\n\nPor favor, espera la atención de nuestro equipo.",
+            description=f"**Usuario:** {interaction.user.mention}\n**Categoría:** {category_info['title']}\n**Ticket:** #{ticket_num:03d}\n\nPor favor, espera la atención de nuestro equipo.",
             color=category_info["color"],
             user=interaction.user
         )
@@ -1107,14 +4415,12 @@ async def create_ticket_channel(interaction: discord.Interaction, category: str,
         )
         await interaction.followup.send(embed=confirm_embed, ephemeral=True)
         
-        log_channel = bot.get_channel(Channels.TICKET_LOGS)
-        if log_channel:
-            log_embed = create_embed(
-                title=f"{category_info['emoji']} Nuevo Ticket",
-                description=f"**Tipo:** {category_info['title']}\n**Usuario:** {interaction.user.mention}\n**Canal:** {ticket_channel.mention}",
-                color=category_info["color"]
-            )
-            await log_channel.send(embed=log_embed)
+        log_embed = create_embed(
+            title=f"{category_info['emoji']} Nuevo Ticket",
+            description=f"**Tipo:** {category_info['title']}\n**Usuario:** {interaction.user.mention}\n**Canal:** {ticket_channel.mention}",
+            color=category_info["color"]
+        )
+        send_log(Channels.TICKET_LOGS, log_embed)
         
     except Exception as e:
         print(f"Error al crear ticket: {e}")
@@ -1133,16 +4439,29 @@ async def handle_ticket_claim(interaction: discord.Interaction):
             color=Colors.DANGER
         ), ephemeral=True)
     
+    try:
+        claim_status = await claim_ticket_async(interaction.channel_id, interaction.user.id)
+    except Exception as e:
+        print(f"Error al registrar la atención del ticket: {e}")
+        return await interaction.response.send_message(embed=create_embed(
+            title="❌ Error",
+            description="No se pudo registrar la atención del ticket. Por favor, intenta de nuevo.",
+            color=Colors.DANGER
+        ), ephemeral=True)
     embed = interaction.message.embeds[0]
-    for field in embed.fields:
-        if field.name == "🛎️ Atendido por":
-            return await interaction.response.send_message(embed=create_embed(
-                title="❌ Ticket Ya Atendido",
-                description="Este ticket ya ha sido reclamado por otro miembro del staff.",
-                color=Colors.DANGER
-            ), ephemeral=True)
+    if claim_status == "unknown":
+        # Ticket abierto antes del registro en la base: su estado solo está en el embed
+        if any(field.name == "🛎️ Atendido por" for field in embed.fields):
+            claim_status = "taken"
+    if claim_status == "taken":
+        return await interaction.response.send_message(embed=create_embed(
+            title="❌ Ticket Ya Atendido",
+            description="Este ticket ya ha sido reclamado por otro miembro del staff.",
+            color=Colors.DANGER
+        ), ephemeral=True)
     
     embed.add_field(name="🛎️ Atendido por", value=interaction.user.mention, inline=False)
+    record_audit_event("ticket_reclamado", interaction.user, channel=interaction.channel_id)
     
     new_view = TicketActionsView()
     for child in new_view.children:
@@ -1176,6 +4495,12 @@ async def handle_ticket_close(interaction: discord.Interaction):
     if timed_out:
         return
     
+    try:
+        await close_ticket_async(interaction.channel_id, interaction.user.id, modal.reason.value)
+    except Exception as e:
+        print(f"Error al registrar el cierre del ticket: {e}")
+    record_audit_event("ticket_cerrado", interaction.user, channel=interaction.channel_id, reason=modal.reason.value)
+    
     view = TicketActionsView()
     for child in view.children:
         child.disabled = True
@@ -1192,15 +4517,13 @@ async def handle_ticket_close(interaction: discord.Interaction):
     )
     await modal.interaction.followup.send(embed=closing_embed)
     
-    log_channel = bot.get_channel(Channels.TICKET_LOGS)
-    if log_channel:
-        log_embed = create_embed(
-            title="📌 Ticket Cerrado",
-            description=f"**Canal:** {interaction.channel.name}\n**Cerrado por:** {interaction.user.mention}\n**Razón:** {modal.reason.value}",
-            color=Colors.DANGER,
-            user=interaction.user
-        )
-        await log_channel.send(embed=log_embed)
+    log_embed = create_embed(
+        title="📌 Ticket Cerrado",
+        description=f"**Canal:** {interaction.channel.name}\n**Cerrado por:** {interaction.user.mention}\n**Razón:** {modal.reason.value}",
+        color=Colors.DANGER,
+        user=interaction.user
+    )
+    send_log(Channels.TICKET_LOGS, log_embed)
     
     await asyncio.sleep(5)
     try:
@@ -1225,19 +4548,27 @@ async def handle_ticket_add_user(interaction: discord.Interaction):
         return
     
     username = modal.username.value
-    member = None
-    
-    for guild_member in interaction.guild.members:
-        if guild_member.name.lower() == username.lower():
-            member = guild_member
-            break
+    member = await lookup_member(interaction.guild, username)
     
     if not member:
-        return await modal.interaction.followup.send(embed=create_embed(
-            title="❌ Usuario no Encontrado",
-            description=f"No se encontró al usuario '{username}' en el servidor.",
-            color=Colors.DANGER
-        ), ephemeral=True)
+        # Sin coincidencia exacta única: ofrecer los miembros cuyo nombre empieza así
+        candidates = search_members(interaction.guild, username)
+        if not candidates:
+            return await modal.interaction.followup.send(embed=create_embed(
+                title="❌ Usuario no Encontrado",
+                description=f"No se encontró al usuario '{username}' en el servidor.",
+                color=Colors.DANGER
+            ), ephemeral=True)
+        view = MemberSelectView(interaction.user.id, candidates)
+        await modal.interaction.followup.send(embed=create_embed(
+            title="🔎 Coincidencias Encontradas",
+            description=f"Elige a qué usuario agregar (búsqueda: '{username}').",
+            color=Colors.INFO
+        ), view=view, ephemeral=True)
+        await view.wait()
+        member = view.selected
+        if not member:
+            return
     
     try:
         await interaction.channel.set_permissions(
@@ -1255,6 +4586,12 @@ async def handle_ticket_add_user(interaction: discord.Interaction):
         ), ephemeral=True)
         return
     
+    try:
+        await add_ticket_participant_async(interaction.channel_id, member.id)
+    except Exception as e:
+        print(f"Error al registrar usuario agregado al ticket: {e}")
+    record_audit_event("ticket_usuario_agregado", interaction.user, member, channel=interaction.channel_id)
+    
     await modal.interaction.followup.send(embed=create_embed(
         title="✅ Usuario Agregado",
         description=f"Se ha agregado a {member.mention} al ticket.",
@@ -1282,7 +4619,10 @@ async def handle_server_start(interaction: discord.Interaction):
             color=Colors.DANGER
         ), ephemeral=True)
     
+    # Limpiar el canal y anunciar puede tardar más de los 3 s que da Discord para responder
+    await interaction.response.defer(ephemeral=True)
     server_status = "abierto"
+    record_audit_event("servidor_abierto", interaction.user)
     
     embed = create_embed(
         title="🚀 ¡Santiago RP Abierto! 🎉",
@@ -1311,10 +4651,8 @@ async def handle_server_start(interaction: discord.Interaction):
         mention1 = await channel.send("@everyone")
         mention2 = await channel.send("@everyone")
         
-        # Programar eliminación de los mensajes de mención después de 30 segundos
-        await asyncio.sleep(30)
-        await mention1.delete()
-        await mention2.delete()
+        # Programar eliminación de los mensajes de mención (sin retener la interacción)
+        await schedule_message_deletions([mention1, mention2], ANNOUNCEMENT_PING_SECONDS)
         
         print(f"✅ Anuncio enviado al canal {Channels.ANNOUNCEMENTS}")
     except discord.errors.Forbidden:
@@ -1342,7 +4680,7 @@ async def handle_server_start(interaction: discord.Interaction):
         ), ephemeral=True)
         return
     
-    await interaction.response.send_message(embed=create_embed(
+    await interaction.followup.send(embed=create_embed(
         title="✅ Éxito",
         description="El servidor ha sido abierto correctamente.",
         color=Colors.SUCCESS
@@ -1369,6 +4707,7 @@ async def handle_server_close(interaction: discord.Interaction):
     
     server_status = "cerrado"
     reason = modal.reason.value
+    record_audit_event("servidor_cerrado", interaction.user, reason=reason)
     
     # Crear embed moderno y atractivo
     embed = create_embed(
@@ -1400,10 +4739,8 @@ async def handle_server_close(interaction: discord.Interaction):
         mention1 = await channel.send("@everyone")
         mention2 = await channel.send("@everyone")
         
-        # Programar eliminación de los mensajes de mención después de 30 segundos
-        await asyncio.sleep(30)
-        await mention1.delete()
-        await mention2.delete()
+        # Programar eliminación de los mensajes de mención (sin retener la interacción)
+        await schedule_message_deletions([mention1, mention2], ANNOUNCEMENT_PING_SECONDS)
         
         print(f"✅ Anuncio enviado al canal {Channels.ANNOUNCEMENTS}")
     except discord.errors.Forbidden:
@@ -1462,18 +4799,18 @@ async def handle_vote_start(interaction: discord.Interaction):
     
     if modal.authorized_by_id.value:
         try:
-            authorized_user = await interaction.guild.fetch_member(int(modal.authorized_by_id.value))
-            if authorized_user:
-                authorized_mention = authorized_user.mention
-        except:
+            authorized_user = await get_or_fetch_member(interaction.guild, int(modal.authorized_by_id.value))
+        except ValueError:
             pass
     
     if not authorized_user:
-        for member in interaction.guild.members:
-            if member.name.lower() == modal.authorized_by.value.lower():
-                authorized_user = member
-                authorized_mention = member.mention
-                break
+        authorized_user = await lookup_member(interaction.guild, modal.authorized_by.value)
+    if authorized_user:
+        authorized_mention = authorized_user.mention
+    record_audit_event(
+        "votacion_iniciada", interaction.user, authorized_user,
+        votes=modal.votes_required.value, authorized_by=modal.authorized_by.value
+    )
     
     embed = create_embed(
         title="🗳️ ¡Encuesta Iniciada! 📢",
@@ -1506,10 +4843,8 @@ async def handle_vote_start(interaction: discord.Interaction):
         mention1 = await channel.send("@everyone")
         mention2 = await channel.send("@everyone")
         
-        # Programar eliminación de los mensajes de mención después de 30 segundos
-        await asyncio.sleep(30)
-        await mention1.delete()
-        await mention2.delete()
+        # Programar eliminación de los mensajes de mención (sin retener la interacción)
+        await schedule_message_deletions([mention1, mention2], ANNOUNCEMENT_PING_SECONDS)
         
         print(f"✅ Anuncio enviado al canal {Channels.ANNOUNCEMENTS}")
     except discord.errors.Forbidden:
@@ -1780,58 +5115,58 @@ class RazonStaffModal(ui.Modal, title="Motivo de la Decisión"):
         self.aceptar = aceptar
 
     async def on_submit(self, interaction: discord.Interaction):
-        try:
-            miembro = await interaction.guild.fetch_member(self.usuario.id)
-        except Exception:
-            await interaction.response.send_message("🚫 No se pudo encontrar al usuario.", ephemeral=True)
-            return
+        # El miembro en caché ya tiene sus roles al día; solo se consulta la API si no está
+        miembro = interaction.guild.get_member(self.usuario.id)
+        if miembro is None:
+            try:
+                miembro = await interaction.guild.fetch_member(self.usuario.id)
+            except Exception:
+                await interaction.response.send_message("🚫 No se pudo encontrar al usuario.", ephemeral=True)
+                return
 
         if self.aceptar:
-            # Add roles
+            # Roles de verificado, quitar el de no verificado y apodo en una sola llamada
             roles_a_agregar = [
                 1339386615189209153, 1339386615189209150, 1339386615176630297,
                 1360333071571878231, 1339386615159722121, 1339386615159722120
             ]
-            for role_id in roles_a_agregar:
-                rol = interaction.guild.get_role(role_id)
-                if rol:
-                    await miembro.add_roles(rol)
-            # Remove unverified role
-            rol_noverificado = interaction.guild.get_role(1339386615159722119)
-            if rol_noverificado:
-                await miembro.remove_roles(rol_noverificado)
-            # Change nickname
-            try:
-                await miembro.edit(nick=f"{miembro.display_name} ({self.roblox_name})")
-            except Exception:
-                pass
-            # Send DM
-            try:
-                await miembro.send(
-                    embed=discord.Embed(
-                        title="✅ ¡Verificación Aceptada!",
-                        description=f"¡Felicidades! Has sido verificado para rolear en SantiagoRP.\n\n**Motivo del staff:** {self.razon.value}",
-                        color=Colors.SUCCESS,
-                        timestamp=datetime.now()
-                    ).set_footer(text="Santiago RP | Verificación")
-                )
-            except Exception:
-                pass
-            await interaction.response.send_message("✅ Usuario verificado y notificado por DM.", ephemeral=True)
+            skipped = await apply_member_changes(
+                miembro,
+                add_roles=[interaction.guild.get_role(role_id) for role_id in roles_a_agregar],
+                remove_roles=[interaction.guild.get_role(1339386615159722119)],
+                nick=f"{miembro.display_name} ({self.roblox_name})",
+                reason=f"Verificación aceptada por {interaction.user.name}"
+            )
+            message = "✅ Usuario verificado; se le notificará por DM."
+            if skipped:
+                message += f"\n⚠️ No se pudo aplicar (jerarquía de roles): {', '.join(skipped)}."
+            await interaction.response.send_message(message, ephemeral=True)
+            # DM en segundo plano (después de responder, para poder avisar si no se entrega)
+            queue_dm(
+                miembro,
+                report_to=interaction.followup,
+                embed=discord.Embed(
+                    title="✅ ¡Verificación Aceptada!",
+                    description=f"¡Felicidades! Has sido verificado para rolear en SantiagoRP.\n\n**Motivo del staff:** {self.razon.value}",
+                    color=Colors.SUCCESS,
+                    timestamp=datetime.now()
+                ).set_footer(text="Santiago RP | Verificación")
+            )
+            record_audit_event("verificacion_aceptada", interaction.user, miembro, roblox=self.roblox_name, reason=self.razon.value)
         else:
             # Denied
-            try:
-                await self.usuario.send(
-                    embed=discord.Embed(
-                        title="❌ Verificación Denegada",
-                        description=f"Tu verificación fue denegada por el staff.\n\n**Motivo:** {self.razon.value}",
-                        color=Colors.DANGER,
-                        timestamp=datetime.now()
-                    ).set_footer(text="Santiago RP | Verificación")
-                )
-            except Exception:
-                pass
-            await interaction.response.send_message("❌ Usuario notificado de la denegación por DM.", ephemeral=True)
+            await interaction.response.send_message("❌ Verificación denegada; se le notificará por DM.", ephemeral=True)
+            queue_dm(
+                self.usuario,
+                report_to=interaction.followup,
+                embed=discord.Embed(
+                    title="❌ Verificación Denegada",
+                    description=f"Tu verificación fue denegada por el staff.\n\n**Motivo:** {self.razon.value}",
+                    color=Colors.DANGER,
+                    timestamp=datetime.now()
+                ).set_footer(text="Santiago RP | Verificación")
+            )
+            record_audit_event("verificacion_denegada", interaction.user, self.usuario, roblox=self.roblox_name, reason=self.razon.value)
 
 # Command to send verification panel
 @bot.tree.command(name="panel-verificacion", description="Enviar panel de verificación (solo staff).")
@@ -1898,6 +5233,18 @@ async def advertir_a(interaction: discord.Interaction, usuario: discord.Member,
     await interaction.response.defer(ephemeral=True)
     admin = interaction.user
 
+    # Registrar la advertencia; el perfil en caché da el total sin recorrer el historial
+    warning_code = await save_warning_async(
+        user_id=usuario.id,
+        username=usuario.name,
+        reason=razon,
+        proof_url=prueba,
+        admin_id=admin.id,
+        admin_name=admin.name
+    )
+    record_audit_event("advertencia", admin, usuario, warning_id=warning_code, reason=razon)
+    profile = await get_moderation_profile_async(usuario.id)
+
     # Crear embed llamativo para el usuario advertido
     advertencia_embed = discord.Embed(
         title="⚠️ ¡Advertencia emitida!",
@@ -1906,6 +5253,7 @@ async def advertir_a(interaction: discord.Interaction, usuario: discord.Member,
             f"**🛡️ Staff:** {admin.mention} ({admin.id})\n"
             f"**📄 Razón:** {razon}\n"
             + (f"**📎 Prueba:** {prueba}\n" if prueba else "")
+            + f"**📊 Advertencias registradas:** {profile['warnings']}\n"
             + "\n🔔 **Recuerda:** Puedes recibir una sanción de los grados existentes (**Advertencia 1, 2, 3**), aislamiento o incluso un **baneo** si reincides o la falta es grave.\n"
             "Por favor, toma en serio esta advertencia y mejora tu comportamiento en el servidor."
         ),
@@ -1915,50 +5263,58 @@ async def advertir_a(interaction: discord.Interaction, usuario: discord.Member,
     advertencia_embed.set_footer(text="Santiago RP | Sistema de Advertencias")
     advertencia_embed.set_thumbnail(url="https://cdn-icons-png.flaticon.com/512/564/564619.png")
 
-    dm_ok = True
-    try:
-        await usuario.send(embed=advertencia_embed)
-    except Exception as e:
-        dm_ok = False
+    # El DM sale por la bandeja de salida; si no se entrega, se avisa al staff
+    dm_delivery = queue_dm(usuario, report_to=interaction.followup, embed=advertencia_embed)
 
     # Enviar embed público en el canal donde se ejecutó el comando (NO efímero)
     await interaction.channel.send(embed=advertencia_embed)
 
-    # Log en canal específico
-    log_channel_id = 1367389708597858314
-    log_channel = interaction.guild.get_channel(log_channel_id)
-    if log_channel:
-        await log_channel.send(embed=create_embed(
+    # Log en canal específico, publicado cuando se conoce el resultado del DM
+    def send_warning_log(delivery: asyncio.Future):
+        if delivery.cancelled() or delivery.exception() is not None:
+            dm_status = "Desconocido (el envío se interrumpió)"
+        else:
+            dm_status = "Sí" if delivery.result() == DM_SENT else "No (no se pudo enviar)"
+        send_log(Channels.WARNING_LOGS, create_embed(
             title="Usuario Advertido",
             description=(
                 f"**Usuario:** {usuario.mention} ({usuario.id})\n"
                 f"**Staff:** {admin.mention} ({admin.id})\n"
                 f"**Razón:** {razon}\n"
                 f"{f'**Prueba:** {prueba}' if prueba else ''}\n"
-                f"**DM enviado:** {'Sí' if dm_ok else 'No (no se pudo enviar)'}"
+                f"**ID de Advertencia:** {warning_code}\n"
+                f"**Advertencias registradas:** {profile['warnings']}\n"
+                f"**Sanciones activas:** {len(profile['sanctions'])}\n"
+                f"**DM enviado:** {dm_status}"
             ),
             color=Colors.WARNING,
             user=admin
         ))
 
+    dm_delivery.add_done_callback(send_warning_log)
+
     # Respuesta al staff (efímera)
     await interaction.followup.send(
         embed=create_embed(
             title="Usuario Advertido",
-            description=f"El usuario {usuario.mention} ha sido advertido correctamente." if dm_ok else f"No se pudo enviar DM a {usuario.mention}, pero la advertencia fue registrada.",
-            color=Colors.SUCCESS if dm_ok else Colors.DANGER,
+            description=f"El usuario {usuario.mention} ha sido advertido correctamente.",
+            color=Colors.SUCCESS,
             user=admin
         ),
         ephemeral=True
     )
 
+weekly_top_staff_task = None
+
 async def weekly_top_staff_announcement():
     await bot.wait_until_ready()
     while not bot.is_closed():
-        now = datetime.now(pytz.timezone("America/Santiago"))
+        now = datetime.now(SANTIAGO_TZ)
         # Ejecutar solo el domingo a las 23:59
         if now.weekday() == 6 and now.hour == 23 and now.minute == 59:
-            top_staff = get_top_staff()
+            # Semana que se cierra, leída antes de cualquier espera para el compare-and-set
+            closing_week = active_rating_week
+            top_staff = await get_top_staff_async()
             channel = bot.get_channel(Channels.RATINGS)  # Cambia por el canal que prefieras
             if top_staff and channel:
                 staff_id, staff_name, avg_rating, count_rating = top_staff
@@ -1972,6 +5328,20 @@ async def weekly_top_staff_announcement():
                     ),
                     color=Colors.SUCCESS
                 )
+                stats = await get_staff_rating_stats_async(staff_id, closing_week)
+                if stats:
+                    embed.add_field(
+                        name="⭐ Distribución de Calificaciones",
+                        value="\n".join(f"{'⭐' * stars} — {stats['histogram'][stars]}" for stars in range(5, 0, -1)),
+                        inline=True
+                    )
+                trend = await get_staff_rating_trend_async(staff_id, weeks=4)
+                if len(trend) > 1:
+                    embed.add_field(
+                        name="📈 Tendencia",
+                        value="\n".join(f"{format_week_key(week)}: {average:.2f} ⭐ ({count})" for week, average, count in trend),
+                        inline=True
+                    )
                 await channel.send(embed=embed)
             elif channel:
                 await channel.send(embed=create_embed(
@@ -1979,7 +5349,7 @@ async def weekly_top_staff_announcement():
                     description="No hubo suficientes calificaciones esta semana para destacar a un staff.\n🔄 **Las calificaciones han sido reiniciadas para la próxima semana.**",
                     color=Colors.WARNING
                 ))
-            clear_ratings()
+            await rotate_rating_week_async(closing_week)
             # Esperar 61 segundos para evitar múltiples ejecuciones en el mismo minuto
             await asyncio.sleep(61)
         else:
@@ -1995,8 +5365,12 @@ async def on_ready():
         print(f"🔁 Comandos sincronizados: {', '.join([cmd.name for cmd in synced])}")
         # Calcular el número de miembros sin bots
         guild = bot.get_guild(1339386615147266108)  # Reemplaza con el ID de tu servidor
+        # Contar e indexar los miembros una sola vez; luego lo mantienen los eventos
+        for g in bot.guilds:
+            member_counter.seed(g)
+            build_member_name_index(g)
         if guild:
-            member_count = sum(1 for member in guild.members if not member.bot)
+            member_count = member_counter.get(guild.id)
             # Establecer actividad personalizada
             activity = discord.Activity(
                 type=discord.ActivityType.playing,
@@ -2008,11 +5382,26 @@ async def on_ready():
             print("❌ No se encontró el servidor. Verifica el ID del servidor.")
         # Actualizar canal de conteo de miembros al iniciar
         for guild in bot.guilds:
-            await actualizar_canal_conteo_miembros(guild)
+            actualizar_canal_conteo_miembros(guild)
     except Exception as e:
         print(f"❌ Error en on_ready: {e}")
-    # Inicia la tarea de fondo para el staff destacado semanal
-    bot.loop.create_task(weekly_top_staff_announcement())
+    # Inician las tareas de fondo (una sola vez aunque on_ready se repita al reconectar)
+    global weekly_top_staff_task, backup_task
+    if weekly_top_staff_task is None or weekly_top_staff_task.done():
+        weekly_top_staff_task = bot.loop.create_task(weekly_top_staff_announcement())
+    if backup_task is None or backup_task.done():
+        backup_task = bot.loop.create_task(scheduled_backups())
+    # Retomar las acciones programadas (las vencidas durante un reinicio se ejecutan ya)
+    try:
+        await action_scheduler.start()
+    except DB_ERRORS as e:
+        print(f"❌ No se pudieron cargar las acciones programadas: {e}")
+    # Los tickets abiertos antes del registro en la base reservan sus números
+    for guild in bot.guilds:
+        try:
+            await seed_ticket_counters_async(guild)
+        except DB_ERRORS as e:
+            print(f"❌ No se pudieron sembrar los contadores de tickets: {e}")
 
 @bot.tree.command(name="panel", description="Despliega el panel de control administrativo")
 @app_commands.checks.has_any_role(*Roles.STAFF)
@@ -2145,7 +5534,7 @@ async def sancionar_a(interaction: discord.Interaction, usuario: discord.Member,
         ))
 
     # Guardar sanción en la base de datos
-    sanction_id = save_sanction(
+    sanction_id = await save_sanction_async(
         user_id=usuario.id,
         username=usuario.name,
         reason=motivo,
@@ -2154,6 +5543,7 @@ async def sancionar_a(interaction: discord.Interaction, usuario: discord.Member,
         admin_id=interaction.user.id,
         admin_name=interaction.user.name
     )
+    record_audit_event("sancion", interaction.user, usuario, sanction_id=sanction_id, sanction_type=tipo_sancion, reason=motivo)
 
     # Asignar rol correspondiente
     role_id = sanction_roles[tipo_sancion]
@@ -2182,10 +5572,14 @@ async def sancionar_a(interaction: discord.Interaction, usuario: discord.Member,
     sanction_embed.add_field(name="⚠️ Tipo de Sanción", value=tipo_sancion, inline=True)
     sanction_embed.add_field(name="📸 Pruebas", value=pruebas, inline=False)
     sanction_embed.add_field(name="👮 Aplicada por", value=interaction.user.mention, inline=True)
+    profile = await get_moderation_profile_async(usuario.id)
+    sanction_embed.add_field(
+        name="📊 Historial",
+        value=f"**Advertencias verbales:** {profile['warnings']}\n**Sanciones activas:** {len(profile['sanctions'])}",
+        inline=False
+    )
 
-    await interaction.followup.send(embed=sanction_embed)
-
-    # Enviar notificación al usuario sancionado
+    # Notificación al usuario sancionado
     dm_embed = create_embed(
         title="⚖️ Has Recibido una Sanción",
         description=(
@@ -2207,32 +5601,30 @@ async def sancionar_a(interaction: discord.Interaction, usuario: discord.Member,
         inline=False
     )
 
-    try:
-        await usuario.send(embed=dm_embed)
-    except discord.errors.Forbidden:
-        await interaction.followup.send(embed=create_embed(
-            title="⚠️ Advertencia",
-            description=f"No se pudo enviar el mensaje directo a {usuario.mention}. Es posible que tenga los DMs cerrados.",
-            color=Colors.WARNING
-        ))
+    # El DM sale por la bandeja de salida; si no se entrega, se avisa al staff
+    queue_dm(usuario, report_to=interaction.followup, embed=dm_embed)
+    await interaction.followup.send(embed=sanction_embed)
 
     # Enviar log al canal de sanciones
-    log_channel = bot.get_channel(Channels.SANCTION_LOGS)
-    if log_channel:
-        log_embed = create_embed(
-            title="📜 Registro de Sanción",
-            description=f"Se ha registrado una nueva sanción en el servidor.",
-            color=Colors.DANGER,
-            user=interaction.user
-        )
-        log_embed.add_field(name="🆔 ID de Sanción", value=sanction_id, inline=False)
-        log_embed.add_field(name="👤 Usuario", value=usuario.mention, inline=True)
-        log_embed.add_field(name="📝 Motivo", value=motivo, inline=True)
-        log_embed.add_field(name="⚠️ Tipo de Sanción", value=tipo_sancion, inline=True)
-        log_embed.add_field(name="📸 Pruebas", value=pruebas, inline=False)
-        log_embed.add_field(name="👮 Aplicada por", value=interaction.user.mention, inline=True)
+    log_embed = create_embed(
+        title="📜 Registro de Sanción",
+        description=f"Se ha registrado una nueva sanción en el servidor.",
+        color=Colors.DANGER,
+        user=interaction.user
+    )
+    log_embed.add_field(name="🆔 ID de Sanción", value=sanction_id, inline=False)
+    log_embed.add_field(name="👤 Usuario", value=usuario.mention, inline=True)
+    log_embed.add_field(name="📝 Motivo", value=motivo, inline=True)
+    log_embed.add_field(name="⚠️ Tipo de Sanción", value=tipo_sancion, inline=True)
+    log_embed.add_field(name="📸 Pruebas", value=pruebas, inline=False)
+    log_embed.add_field(name="👮 Aplicada por", value=interaction.user.mention, inline=True)
+    log_embed.add_field(
+        name="📊 Historial",
+        value=f"**Advertencias verbales:** {profile['warnings']}\n**Sanciones activas:** {len(profile['sanctions'])}",
+        inline=False
+    )
         
-        await log_channel.send(embed=log_embed)
+    send_log(Channels.SANCTION_LOGS, log_embed)
 
 def is_view_sanctions_channel():
     async def predicate(interaction: discord.Interaction) -> bool:
@@ -2246,84 +5638,273 @@ def is_view_sanctions_channel():
         return True
     return app_commands.check(predicate)
 
+class SanctionsPageView(ui.View):
+    """Vista paginada de sanciones: cada página se consulta al pulsar los botones."""
+    def __init__(self, owner_id: int, target_user: discord.abc.User):
+        super().__init__(timeout=300)
+        self.owner_id = owner_id
+        self.target_user = target_user
+        self.active = True
+        self.cursors = [None]  # Cursor de inicio de cada página visitada
+        self.next_cursor = None
+        self.sanctions = []
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if interaction.user.id != self.owner_id:
+            await interaction.response.send_message("❌ Solo quien ejecutó el comando puede cambiar de página.", ephemeral=True)
+            return False
+        return True
+
+    async def load_page(self):
+        """Cargar la página actual desde la base de datos (o la caché de perfiles)."""
+        self.sanctions, self.next_cursor = await get_user_sanctions_page_async(
+            self.target_user.id, self.active, self.cursors[-1]
+        )
+        self.previous_page.disabled = len(self.cursors) == 1
+        self.next_page.disabled = self.next_cursor is None
+        self.toggle_history.label = "Ver historial" if self.active else "Ver activas"
+
+    def build_embed(self) -> discord.Embed:
+        """Construir el embed de la página actual."""
+        page_number = len(self.cursors)
+        if self.active:
+            title = "📜 Sanciones Activas"
+            description = f"Lista de sanciones activas para {self.target_user.mention}."
+        else:
+            title = "🗂️ Historial de Sanciones"
+            description = f"Sanciones ya borradas de {self.target_user.mention}."
+        embed = create_embed(
+            title=title,
+            description=f"{description}\n**Página:** {page_number}",
+            color=Colors.INFO,
+            user=self.target_user
+        )
+
+        if not self.sanctions:
+            embed.add_field(
+                name="✅ Sin Sanciones",
+                value="Este usuario no tiene sanciones activas actualmente." if self.active else "Este usuario no tiene sanciones en su historial.",
+                inline=False
+            )
+        for sanction_id, reason, sanction_type, proof_url, admin_name, date in self.sanctions:
+            embed.add_field(
+                name=f"🆔 Sanción {format_public_id(sanction_id)}",
+                value=(
+                    f"**Motivo:** {reason[:300]}\n"
+                    f"**Tipo:** {sanction_type}\n"
+                    f"**Pruebas:** {proof_url[:200]}\n"
+                    f"**Aplicada por:** {admin_name}\n"
+                    f"**Fecha:** {format_santiago(date)}"
+                ),
+                inline=False
+            )
+
+        embed.add_field(
+            name="📝 ¿Tienes una sanción injusta?",
+            value=(
+                f"Si crees que alguna sanción es injusta, abre un ticket en <#{Channels.TICKETS}> "
+                "seleccionando la categoría **Apelaciones**. Incluye el **ID de Sanción** y pruebas que respalden tu caso."
+            ),
+            inline=False
+        )
+        return embed
+
+    async def refresh(self, interaction: discord.Interaction):
+        await self.load_page()
+        await interaction.response.edit_message(embed=self.build_embed(), view=self)
+
+    @ui.button(label="Anterior", style=discord.ButtonStyle.secondary, emoji="◀️")
+    async def previous_page(self, interaction: discord.Interaction, button: ui.Button):
+        if len(self.cursors) > 1:
+            self.cursors.pop()
+        await self.refresh(interaction)
+
+    @ui.button(label="Siguiente", style=discord.ButtonStyle.secondary, emoji="▶️")
+    async def next_page(self, interaction: discord.Interaction, button: ui.Button):
+        if self.next_cursor is not None:
+            self.cursors.append(self.next_cursor)
+        await self.refresh(interaction)
+
+    @ui.button(label="Ver historial", style=discord.ButtonStyle.primary, emoji="🗂️")
+    async def toggle_history(self, interaction: discord.Interaction, button: ui.Button):
+        self.active = not self.active
+        self.cursors = [None]
+        await self.refresh(interaction)
+
 @bot.tree.command(name="ver-sanciones", description="Muestra las sanciones activas de un usuario")
 @is_view_sanctions_channel()
 @app_commands.describe(
-    usuario="Selecciona un usuario para ver sus sanciones (opcional, por defecto muestra las tuyas)"
+    usuario="Selecciona un usuario para ver sus sanciones (opcional, por defecto muestra las tuyas)",
+    codigo="Código de una sanción concreta, como se cita en las apelaciones (opcional)"
 )
-async def ver_sanciones(interaction: discord.Interaction, usuario: discord.Member = None):
+async def ver_sanciones(interaction: discord.Interaction, usuario: discord.Member = None, codigo: str = None):
     """Comando para ver las sanciones activas de un usuario."""
     await interaction.response.defer(ephemeral=True)
 
+    if codigo:
+        await show_sanction_by_code(interaction, codigo)
+        return
+
     # Si no se especifica un usuario, usar el que ejecuta el comando
     target_user = usuario if usuario else interaction.user
 
-    # Obtener sanciones del usuario
-    sanctions = get_user_sanctions(target_user.id)
+    # Cargar solo la primera página; el resto se consulta al navegar
+    view = SanctionsPageView(owner_id=interaction.user.id, target_user=target_user)
+    await view.load_page()
+
+    await interaction.followup.send(embed=view.build_embed(), view=view, ephemeral=True)
+
+async def show_sanction_by_code(interaction: discord.Interaction, code: str):
+    """Responder /ver-sanciones con una única sanción buscada por su código o UUID antiguo."""
+    try:
+        sanction = await get_sanction_by_code_async(code)
+    except ValueError:
+        sanction = None
+    if sanction is None:
+        await interaction.followup.send(embed=create_embed(
+            title="❌ Sanción no encontrada",
+            description=f"No existe ninguna sanción con el código `{code[:40]}`.",
+            color=Colors.DANGER,
+            user=interaction.user
+        ), ephemeral=True)
+        return
 
-    # Crear embed para mostrar sanciones
     embed = create_embed(
-        title="📜 Sanciones Activas",
-        description=f"Lista de sanciones activas para {target_user.mention}.",
+        title=f"🆔 Sanción {format_public_id(sanction['sanction_id'])}",
+        description=f"Sanción de <@{sanction['user_id']}> ({'activa' if sanction['active'] else 'borrada'}).",
         color=Colors.INFO,
-        user=target_user
+        user=interaction.user
     )
+    embed.add_field(name="📝 Motivo", value=sanction['reason'][:1000], inline=False)
+    embed.add_field(name="⚠️ Tipo", value=sanction['sanction_type'], inline=True)
+    embed.add_field(name="👮 Aplicada por", value=sanction['admin_name'], inline=True)
+    embed.add_field(name="📅 Fecha", value=format_santiago(sanction['date']), inline=True)
+    embed.add_field(name="📎 Pruebas", value=sanction['proof_url'][:1000], inline=False)
+    await interaction.followup.send(embed=embed, ephemeral=True)
 
-    if not sanctions:
-        embed.add_field(
-            name="✅ Sin Sanciones",
-            value="Este usuario no tiene sanciones activas actualmente.",
-            inline=False
+DATA_TABLE_CHOICES = [
+    app_commands.Choice(name="Sanciones", value="sanciones"),
+    app_commands.Choice(name="Calificaciones", value="calificaciones"),
+]
+
+class SearchResultsView(ui.View):
+    """Resultados de /buscar-sanciones paginados por relevancia."""
+    def __init__(self, owner_id: int, table: str, text: str, since: datetime = None):
+        super().__init__(timeout=300)
+        self.owner_id = owner_id
+        self.table = table
+        self.text = text
+        self.since = since
+        self.page = 0
+        self.rows = []
+        self.has_next = False
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if interaction.user.id != self.owner_id:
+            await interaction.response.send_message("❌ Solo quien ejecutó el comando puede cambiar de página.", ephemeral=True)
+            return False
+        return True
+
+    async def load_page(self):
+        """Consultar la página actual de resultados."""
+        self.rows, self.has_next = await search_records_async(self.table, self.text, self.since, self.page)
+        self.previous_page.disabled = self.page == 0
+        self.next_page.disabled = not self.has_next
+
+    def build_embed(self) -> discord.Embed:
+        """Construir el embed de la página actual."""
+        embed = create_embed(
+            title="🔎 Resultados de Búsqueda",
+            description=(
+                f"**Búsqueda:** {self.text[:200]}\n"
+                f"**En:** {'Sanciones' if self.table == 'sanciones' else 'Calificaciones'}\n"
+                f"**Página:** {self.page + 1}"
+            ),
+            color=Colors.INFO
         )
-    else:
-        for sanction in sanctions:
-            sanction_id, reason, sanction_type, proof_url, admin_name, date = sanction
-            embed.add_field(
-                name=f"🆔 Sanción {sanction_id[:8]}...",
-                value=(
-                    f"**Motivo:** {reason}\n"
-                    f"**Tipo:** {sanction_type}\n"
-                    f"**Pruebas:** {proof_url}\n"
-                    f"**Aplicada por:** {admin_name}\n"
-                    f"**Fecha:** {datetime.fromisoformat(date).strftime('%d/%m/%Y %H:%M')}"
-                ),
-                inline=False
-            )
+        if not self.rows:
+            embed.add_field(name="📭 Sin Resultados", value="No se encontraron coincidencias.", inline=False)
+        for row in self.rows:
+            if self.table == "sanciones":
+                embed.add_field(
+                    name=f"🆔 {format_public_id(row['sanction_id'])} · {row['username']}",
+                    value=(
+                        f"**Motivo:** {row['reason'][:300]}\n"
+                        f"**Tipo:** {row['sanction_type']}\n"
+                        f"**Aplicada por:** {row['admin_name']}\n"
+                        f"**Fecha:** {format_santiago(row['date'])}\n"
+                        f"**Estado:** {'Activa' if row['active'] else 'Borrada'}"
+                    ),
+                    inline=False
+                )
+            else:
+                embed.add_field(
+                    name=f"🆔 {format_public_id(row['rating_id'])} · {row['staff_name']}",
+                    value=(
+                        f"**Calificación:** {'⭐' * row['rating']}\n"
+                        f"**Comentario:** {row['comment'][:300]}\n"
+                        f"**Calificado por:** {row['user_name']}\n"
+                        f"**Fecha:** {format_santiago(row['date'])}"
+                    ),
+                    inline=False
+                )
+        return embed
 
-    embed.add_field(
-        name="📝 ¿Tienes una sanción injusta?",
-        value=(
-            f"Si crees que alguna sanción es injusta, abre un ticket en <#{Channels.TICKETS}> "
-            "seleccionando la categoría **Apelaciones**. Incluye el **ID de Sanción** y pruebas que respalden tu caso."
-        ),
-        inline=False
-    )
+    async def refresh(self, interaction: discord.Interaction):
+        await self.load_page()
+        await interaction.response.edit_message(embed=self.build_embed(), view=self)
 
-    await interaction.followup.send(embed=embed, ephemeral=True)
+    @ui.button(label="Anterior", style=discord.ButtonStyle.secondary, emoji="◀️")
+    async def previous_page(self, interaction: discord.Interaction, button: ui.Button):
+        self.page = max(self.page - 1, 0)
+        await self.refresh(interaction)
 
-@bot.tree.command(name="borrar-sanciones", description="Borra todas las sanciones activas de un usuario")
-@app_commands.checks.has_permissions(administrator=True)
+    @ui.button(label="Siguiente", style=discord.ButtonStyle.secondary, emoji="▶️")
+    async def next_page(self, interaction: discord.Interaction, button: ui.Button):
+        if self.has_next:
+            self.page += 1
+        await self.refresh(interaction)
+
+@bot.tree.command(name="buscar-sanciones", description="Busca sanciones o calificaciones por texto")
+@app_commands.checks.has_any_role(*Roles.STAFF)
 @app_commands.describe(
-    usuario="Selecciona el usuario cuyas sanciones quieres borrar"
+    consulta="Palabras a buscar (por ejemplo: vdm, rdm, grosero); termina una palabra con * para buscar por prefijo",
+    buscar_en="Buscar en sanciones (motivo, tipo, usuario) o en calificaciones (comentario, staff)",
+    dias="Limitar a los últimos N días (opcional)"
 )
-async def borrar_sanciones(interaction: discord.Interaction, usuario: discord.Member):
-    """Comando para borrar todas las sanciones activas de un usuario."""
+@app_commands.choices(buscar_en=DATA_TABLE_CHOICES)
+async def buscar_sanciones(interaction: discord.Interaction, consulta: str, buscar_en: app_commands.Choice[str] = None, dias: app_commands.Range[int, 1, 3650] = None):
+    """Comando para buscar en los motivos de sanciones y comentarios de calificaciones."""
     await interaction.response.defer(ephemeral=True)
 
-    # Contar sanciones activas antes de borrar
-    sanction_count = count_active_sanctions(usuario.id)
-    if sanction_count == 0:
+    table = buscar_en.value if buscar_en else "sanciones"
+    since = datetime.now(timezone.utc) - timedelta(days=dias) if dias else None
+    view = SearchResultsView(owner_id=interaction.user.id, table=table, text=consulta, since=since)
+    try:
+        await view.load_page()
+    except ValueError:
         await interaction.followup.send(embed=create_embed(
-            title="ℹ️ Sin Sanciones",
-            description=f"{usuario.mention} no tiene sanciones activas para borrar.",
-            color=Colors.INFO,
+            title="❌ Búsqueda Inválida",
+            description="Escribe al menos una palabra para buscar.",
+            color=Colors.DANGER,
             user=interaction.user
         ), ephemeral=True)
         return
 
-    # Marcar sanciones como inactivas
+    await interaction.followup.send(embed=view.build_embed(), view=view, ephemeral=True)
+
+@bot.tree.command(name="borrar-sanciones", description="Borra todas las sanciones activas de un usuario")
+@app_commands.checks.has_permissions(administrator=True)
+@app_commands.describe(
+    usuario="Selecciona el usuario cuyas sanciones quieres borrar"
+)
+async def borrar_sanciones(interaction: discord.Interaction, usuario: discord.Member):
+    """Comando para borrar todas las sanciones activas de un usuario."""
+    await interaction.response.defer(ephemeral=True)
+
+    # Marcar sanciones como inactivas (una sola transacción devuelve cuántas había)
     try:
-        affected_rows = delete_user_sanctions(usuario.id)
+        affected_rows = await delete_user_sanctions_async(usuario.id)
     except Exception as e:
         print(f"Error al borrar sanciones: {e}")
         await interaction.followup.send(embed=create_embed(
@@ -2337,13 +5918,15 @@ async def borrar_sanciones(interaction: discord.Interaction, usuario: discord.Me
     # Verificar si se borraron sanciones
     if affected_rows == 0:
         await interaction.followup.send(embed=create_embed(
-            title="ℹ️ Sin Cambios",
-            description=f"No se encontraron sanciones activas para {usuario.mention}.",
+            title="ℹ️ Sin Sanciones",
+            description=f"{usuario.mention} no tiene sanciones activas para borrar.",
             color=Colors.INFO,
             user=interaction.user
         ), ephemeral=True)
         return
 
+    record_audit_event("borrar_sanciones", interaction.user, usuario, count=affected_rows)
+
     # Remover roles de advertencia del usuario
     sanction_roles = [Roles.WARN_1, Roles.WARN_2, Roles.WARN_3]
     roles_to_remove = [interaction.guild.get_role(role_id) for role_id in sanction_roles if interaction.guild.get_role(role_id)]
@@ -2381,29 +5964,156 @@ async def borrar_sanciones(interaction: discord.Interaction, usuario: discord.Me
         ),
         color=Colors.SUCCESS
     )
-    try:
-        await usuario.send(embed=dm_embed)
-    except discord.errors.Forbidden:
-        response_embed.add_field(
-            name="⚠️ Advertencia",
-            value=f"No se pudo enviar un mensaje directo a {usuario.mention}. Es posible que tenga los DMs cerrados.",
-            inline=False
-        )
-        await interaction.followup.send(embed=response_embed, ephemeral=True)
+    queue_dm(usuario, report_to=interaction.followup, embed=dm_embed)
 
     # Enviar log al canal de sanciones
-    log_channel = bot.get_channel(Channels.SANCTION_LOGS)
-    if log_channel:
-        log_embed = create_embed(
-            title="🗑️ Sanciones Borradas",
-            description=f"Se han eliminado sanciones activas del servidor.",
-            color=Colors.SUCCESS,
+    log_embed = create_embed(
+        title="🗑️ Sanciones Borradas",
+        description=f"Se han eliminado sanciones activas del servidor.",
+        color=Colors.SUCCESS,
+        user=interaction.user
+    )
+    log_embed.add_field(name="👤 Usuario", value=usuario.mention, inline=True)
+    log_embed.add_field(name="📉 Sanciones eliminadas", value=str(affected_rows), inline=True)
+    log_embed.add_field(name="👮 Borradas por", value=interaction.user.mention, inline=True)
+    send_log(Channels.SANCTION_LOGS, log_embed)
+
+@bot.tree.command(name="exportar-datos", description="Exporta sanciones o calificaciones a CSV/JSONL")
+@app_commands.checks.has_permissions(administrator=True)
+@app_commands.describe(
+    tabla="Datos a exportar",
+    formato="Formato del archivo"
+)
+@app_commands.choices(
+    tabla=DATA_TABLE_CHOICES,
+    formato=[
+        app_commands.Choice(name="CSV", value="csv"),
+        app_commands.Choice(name="JSONL", value="jsonl"),
+    ]
+)
+async def exportar_datos(interaction: discord.Interaction, tabla: app_commands.Choice[str], formato: app_commands.Choice[str]):
+    """Comando para volcar una tabla completa a un archivo en el servidor."""
+    await interaction.response.defer(ephemeral=True)
+
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    path = os.path.join(EXPORT_DIR, f"{tabla.value}_{datetime.now(timezone.utc):%Y%m%d_%H%M%S}.{formato.value}")
+    try:
+        total = await export_table_async(tabla.value, path)
+    except Exception as e:
+        print(f"Error al exportar {tabla.value}: {e}")
+        await interaction.followup.send(embed=create_embed(
+            title="❌ Error",
+            description="No se pudo completar la exportación. Revisa los registros del bot.",
+            color=Colors.DANGER,
             user=interaction.user
-        )
-        log_embed.add_field(name="👤 Usuario", value=usuario.mention, inline=True)
-        log_embed.add_field(name="📉 Sanciones eliminadas", value=str(affected_rows), inline=True)
-        log_embed.add_field(name="👮 Borradas por", value=interaction.user.mention, inline=True)
-        await log_channel.send(embed=log_embed)
+        ), ephemeral=True)
+        return
+
+    embed = create_embed(
+        title="📦 Exportación Completada",
+        description=f"Se exportaron **{total}** filas de **{tabla.name}**.",
+        color=Colors.SUCCESS,
+        user=interaction.user
+    )
+    embed.add_field(name="📁 Archivo", value=f"`{path}`", inline=False)
+    if os.path.getsize(path) <= EXPORT_ATTACH_LIMIT:
+        await interaction.followup.send(embed=embed, file=discord.File(path), ephemeral=True)
+    else:
+        embed.add_field(name="ℹ️ Nota", value="El archivo es demasiado grande para adjuntarlo; quedó guardado en el servidor.", inline=False)
+        await interaction.followup.send(embed=embed, ephemeral=True)
+
+@bot.tree.command(name="importar-datos", description="Importa sanciones o calificaciones desde un archivo CSV/JSONL")
+@app_commands.checks.has_permissions(administrator=True)
+@app_commands.describe(
+    tabla="Datos a importar",
+    archivo="Archivo .csv o .jsonl generado por /exportar-datos"
+)
+@app_commands.choices(tabla=DATA_TABLE_CHOICES)
+async def importar_datos(interaction: discord.Interaction, tabla: app_commands.Choice[str], archivo: discord.Attachment):
+    """Comando para importar un volcado; las filas ya existentes se omiten."""
+    await interaction.response.defer(ephemeral=True)
+
+    try:
+        export_format(archivo.filename)
+    except ValueError as e:
+        await interaction.followup.send(embed=create_embed(
+            title="❌ Formato no soportado",
+            description=str(e),
+            color=Colors.DANGER,
+            user=interaction.user
+        ), ephemeral=True)
+        return
+
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    path = os.path.join(EXPORT_DIR, f"import_{datetime.now(timezone.utc):%Y%m%d_%H%M%S}_{os.path.basename(archivo.filename)}")
+    try:
+        await archivo.save(path)
+        read, inserted = await import_table_async(tabla.value, path)
+    except Exception as e:
+        print(f"Error al importar {tabla.value}: {e}")
+        await interaction.followup.send(embed=create_embed(
+            title="❌ Error",
+            description=(
+                f"La importación se detuvo: {str(e)[:200]}\n"
+                "Los bloques anteriores al error ya quedaron guardados; puedes reimportar el archivo corregido."
+            ),
+            color=Colors.DANGER,
+            user=interaction.user
+        ), ephemeral=True)
+        return
+
+    embed = create_embed(
+        title="📥 Importación Completada",
+        description=f"Se leyeron **{read}** filas de **{tabla.name}**.",
+        color=Colors.SUCCESS,
+        user=interaction.user
+    )
+    embed.add_field(name="✅ Nuevas", value=str(inserted), inline=True)
+    embed.add_field(name="⏭️ Omitidas (ya existían)", value=str(read - inserted), inline=True)
+    await interaction.followup.send(embed=embed, ephemeral=True)
+
+@bot.tree.command(name="auditoria", description="Muestra las acciones registradas de un miembro del staff o sobre un usuario")
+@app_commands.checks.has_permissions(administrator=True)
+@app_commands.describe(
+    usuario="Usuario a consultar (puede no estar ya en el servidor)",
+    rol="Acciones realizadas por el usuario o recibidas por él",
+    dias="Días hacia atrás (por defecto 7)"
+)
+@app_commands.choices(rol=[
+    app_commands.Choice(name="Realizadas por el usuario", value="actor"),
+    app_commands.Choice(name="Sobre el usuario", value="target"),
+])
+async def auditoria(interaction: discord.Interaction, usuario: discord.User, rol: app_commands.Choice[str] = None, dias: app_commands.Range[int, 1, 365] = 7):
+    """Comando para consultar el registro de auditoría (un solo rango sobre el índice)."""
+    await interaction.response.defer(ephemeral=True)
+
+    role = rol.value if rol else "actor"
+    since = datetime.now(timezone.utc) - timedelta(days=dias)
+    try:
+        events, has_more = await get_audit_events_async(role, usuario.id, since)
+    except Exception as e:
+        print(f"Error al consultar auditoría: {e}")
+        await interaction.followup.send(embed=create_embed(
+            title="❌ Error",
+            description="No se pudo consultar el registro de auditoría. Revisa los registros del bot.",
+            color=Colors.DANGER,
+            user=interaction.user
+        ), ephemeral=True)
+        return
+
+    subject = "realizadas por" if role == "actor" else "sobre"
+    if not events:
+        description = f"No hay acciones {subject} {usuario.mention} en los últimos {dias} días."
+    else:
+        description = "\n".join(format_audit_event(event) for event in events)
+        if has_more:
+            description += f"\n\n*Se muestran solo las {AUDIT_QUERY_LIMIT} acciones más recientes.*"
+    await interaction.followup.send(embed=create_embed(
+        title=f"🧾 Acciones {subject} {usuario.name} ({dias} días)",
+        description=description,
+        color=Colors.INFO,
+        user=interaction.user
+    ), ephemeral=True)
 
 @bot.tree.command(name="banear-a", description="Aplica un baneo a un usuario")
 @app_commands.checks.has_any_role(*Roles.STAFF)
@@ -2426,7 +6136,7 @@ async def banear_a(interaction: discord.Interaction, usuario: discord.Member, mo
     await interaction.response.defer()
 
     # Guardar baneo en la base de datos
-    sanction_id = save_sanction(
+    sanction_id = await save_sanction_async(
         user_id=usuario.id,
         username=usuario.name,
         reason=motivo,
@@ -2451,6 +6161,7 @@ async def banear_a(interaction: discord.Interaction, usuario: discord.Member, mo
             color=Colors.DANGER
         ))
         return
+    record_audit_event("ban", interaction.user, usuario, sanction_id=sanction_id, reason=motivo)
 
     # Crear embed para respuesta en el canal
     ban_embed = create_embed(
@@ -2465,9 +6176,7 @@ async def banear_a(interaction: discord.Interaction, usuario: discord.Member, mo
     ban_embed.add_field(name="📸 Pruebas", value=pruebas, inline=False)
     ban_embed.add_field(name="👮 Aplicado por", value=interaction.user.mention, inline=True)
 
-    await interaction.followup.send(embed=ban_embed)
-
-    # Enviar notificación al usuario baneado
+    # Notificación al usuario baneado
     dm_embed = create_embed(
         title="🚫 Has Sido Baneado",
         description=(
@@ -2488,31 +6197,24 @@ async def banear_a(interaction: discord.Interaction, usuario: discord.Member, mo
         inline=False
     )
 
-    try:
-        await usuario.send(embed=dm_embed)
-    except discord.errors.Forbidden:
-        await interaction.followup.send(embed=create_embed(
-            title="⚠️ Advertencia",
-            description=f"No se pudo enviar el mensaje directo a {usuario.mention}. Es posible que tenga los DMs cerrados.",
-            color=Colors.WARNING
-        ))
+    # El DM sale por la bandeja de salida; si no se entrega, se avisa al staff
+    queue_dm(usuario, report_to=interaction.followup, embed=dm_embed)
+    await interaction.followup.send(embed=ban_embed)
 
     # Enviar log al canal de sanciones
-    log_channel = bot.get_channel(Channels.SANCTION_LOGS)
-    if log_channel:
-        log_embed = create_embed(
-            title="📜 Registro de Baneo",
-            description=f"Se ha registrado un nuevo baneo en el servidor.",
-            color=Colors.DANGER,
-            user=interaction.user
-        )
-        log_embed.add_field(name="🆔 ID de Baneo", value=sanction_id, inline=False)
-        log_embed.add_field(name="👤 Usuario", value=usuario.mention, inline=True)
-        log_embed.add_field(name="📝 Motivo", value=motivo, inline=True)
-        log_embed.add_field(name="📸 Pruebas", value=pruebas, inline=False)
-        log_embed.add_field(name="👮 Aplicado por", value=interaction.user.mention, inline=True)
+    log_embed = create_embed(
+        title="📜 Registro de Baneo",
+        description=f"Se ha registrado un nuevo baneo en el servidor.",
+        color=Colors.DANGER,
+        user=interaction.user
+    )
+    log_embed.add_field(name="🆔 ID de Baneo", value=sanction_id, inline=False)
+    log_embed.add_field(name="👤 Usuario", value=usuario.mention, inline=True)
+    log_embed.add_field(name="📝 Motivo", value=motivo, inline=True)
+    log_embed.add_field(name="📸 Pruebas", value=pruebas, inline=False)
+    log_embed.add_field(name="👮 Aplicado por", value=interaction.user.mention, inline=True)
         
-        await log_channel.send(embed=log_embed)
+    send_log(Channels.SANCTION_LOGS, log_embed)
 
 async def weekly_top_staff():
     """Tarea semanal para anunciar el mejor staff y reiniciar calificaciones."""
@@ -2525,13 +6227,14 @@ async def weekly_top_staff():
         seconds_until_monday = (next_monday - now).total_seconds()
 
         await asyncio.sleep(seconds_until_monday)
+        closing_week = active_rating_week
 
         channel = bot.get_channel(Channels.RATINGS)
         if not channel:
             print("⚠️ Canal de calificaciones no encontrado.")
             continue
 
-        top_staff = get_top_staff()
+        top_staff = await get_top_staff_async()
         if top_staff:
             staff_id, staff_name, avg_rating, count = top_staff
             embed = create_embed(
@@ -2573,20 +6276,18 @@ async def weekly_top_staff():
             )
             await channel.send(embed=embed)
 
-        # Borrar calificaciones
-        clear_ratings()
+        # Reiniciar calificaciones (cambio de semana activa)
+        await rotate_rating_week_async(closing_week)
 
         # Log en SANCTION_LOGS
-        log_channel = bot.get_channel(Channels.SANCTION_LOGS)
-        if log_channel:
-            log_embed = create_embed(
-                title="🔄 Reinicio de Calificaciones",
-                description="Se han reiniciado las calificaciones semanales.",
-                color=Colors.INFO
-            )
-            if top_staff:
-                log_embed.add_field(name="🏆 Staff de la Semana", value=f"<@{staff_id}> ({avg_rating:.2f}/5)", inline=True)
-            await log_channel.send(embed=log_embed)
+        log_embed = create_embed(
+            title="🔄 Reinicio de Calificaciones",
+            description="Se han reiniciado las calificaciones semanales.",
+            color=Colors.INFO
+        )
+        if top_staff:
+            log_embed.add_field(name="🏆 Staff de la Semana", value=f"<@{staff_id}> ({avg_rating:.2f}/5)", inline=True)
+        send_log(Channels.SANCTION_LOGS, log_embed)
 
 @bot.tree.command(name="calificar-staff", description="Califica a un miembro del staff")
 @is_ratings_channel()
@@ -2623,7 +6324,7 @@ async def calificar_staff(interaction: discord.Interaction, usuario: discord.Mem
     await interaction.response.defer()
 
     # Guardar calificación en la base de datos
-    rating_id = save_rating(
+    rating_id = await save_rating_async(
         staff_id=usuario.id,
         staff_name=usuario.name,
         rating=rating,
@@ -2645,9 +6346,7 @@ async def calificar_staff(interaction: discord.Interaction, usuario: discord.Mem
     rating_embed.add_field(name="💬 Comentario", value=comentario, inline=False)
     rating_embed.add_field(name="👥 Calificado por", value=interaction.user.mention, inline=True)
 
-    await interaction.followup.send(embed=rating_embed)
-
-    # Enviar notificación al staff calificado
+    # Notificación al staff calificado
     dm_embed = create_embed(
         title="🌟 Nueva Calificación Recibida",
         description=(
@@ -2660,31 +6359,24 @@ async def calificar_staff(interaction: discord.Interaction, usuario: discord.Mem
         color=Colors.SUCCESS
     )
 
-    try:
-        await usuario.send(embed=dm_embed)
-    except discord.errors.Forbidden:
-        await interaction.followup.send(embed=create_embed(
-            title="⚠️ Advertencia",
-            description=f"No se pudo enviar el mensaje directo a {usuario.mention}. Es posible que tenga los DMs cerrados.",
-            color=Colors.WARNING
-        ))
+    # El DM sale por la bandeja de salida; si no se entrega, se avisa a quien calificó
+    queue_dm(usuario, report_to=interaction.followup, embed=dm_embed)
+    await interaction.followup.send(embed=rating_embed)
 
     # Enviar log al canal de sanciones
-    log_channel = bot.get_channel(Channels.SANCTION_LOGS)
-    if log_channel:
-        log_embed = create_embed(
-            title="📜 Registro de Calificación",
-            description=f"Se ha registrado una nueva calificación para un miembro del staff.",
-            color=Colors.SUCCESS,
-            user=interaction.user
-        )
-        log_embed.add_field(name="🆔 ID de Calificación", value=rating_id, inline=False)
-        log_embed.add_field(name="👤 Staff", value=usuario.mention, inline=True)
-        log_embed.add_field(name="🌟 Calificación", value=f"{'🌟' * rating} ({rating}/5)", inline=True)
-        log_embed.add_field(name="💬 Comentario", value=comentario, inline=False)
-        log_embed.add_field(name="👥 Calificado por", value=interaction.user.mention, inline=True)
+    log_embed = create_embed(
+        title="📜 Registro de Calificación",
+        description=f"Se ha registrado una nueva calificación para un miembro del staff.",
+        color=Colors.SUCCESS,
+        user=interaction.user
+    )
+    log_embed.add_field(name="🆔 ID de Calificación", value=rating_id, inline=False)
+    log_embed.add_field(name="👤 Staff", value=usuario.mention, inline=True)
+    log_embed.add_field(name="🌟 Calificación", value=f"{'🌟' * rating} ({rating}/5)", inline=True)
+    log_embed.add_field(name="💬 Comentario", value=comentario, inline=False)
+    log_embed.add_field(name="👥 Calificado por", value=interaction.user.mention, inline=True)
         
-        await log_channel.send(embed=log_embed)
+    send_log(Channels.SANCTION_LOGS, log_embed)
 
 def is_view_sanctions_channel():
     async def predicate(interaction: discord.Interaction) -> bool:
@@ -2750,6 +6442,34 @@ async def ayuda(interaction: discord.Interaction):
             "channel": "Cualquier canal",
             "permissions": "Administradores (permiso: Administrador)"
         },
+        {
+            "name": "buscar-sanciones",
+            "emoji": "🔎",
+            "description": "Busca sanciones por motivo o calificaciones por comentario, ordenadas por relevancia.",
+            "channel": "Cualquier canal",
+            "permissions": "Staff (roles: <@&1357151555916271624>, <@&1357151555916271622>, etc.)"
+        },
+        {
+            "name": "exportar-datos",
+            "emoji": "📦",
+            "description": "Exporta todas las sanciones o calificaciones a un archivo CSV/JSONL.",
+            "channel": "Cualquier canal",
+            "permissions": "Administradores (permiso: Administrador)"
+        },
+        {
+            "name": "importar-datos",
+            "emoji": "📥",
+            "description": "Importa sanciones o calificaciones desde un archivo exportado (omite las que ya existen).",
+            "channel": "Cualquier canal",
+            "permissions": "Administradores (permiso: Administrador)"
+        },
+        {
+            "name": "auditoria",
+            "emoji": "🧾",
+            "description": "Muestra las acciones del staff realizadas por un usuario o sobre él en los últimos días.",
+            "channel": "Cualquier canal",
+            "permissions": "Administradores (permiso: Administrador)"
+        },
         {
             "name": "banear-a",
             "emoji": "🚫",
@@ -2932,19 +6652,17 @@ class JobApplicationView(ui.View):
             ), ephemeral=True)
 
         # Send log to sanction logs
-        log_channel = bot.get_channel(Channels.SANCTION_LOGS)
-        if log_channel:
-            log_embed = create_embed(
-                title="📜 Postulación Aceptada",
-                description=f"Se ha aceptado una postulación al trabajo {JOB_ROLES[self.job_key]['name']}.",
-                color=Colors.SUCCESS,
-                user=interaction.user
-            )
-            log_embed.add_field(name="👤 Usuario", value=self.applicant.mention, inline=True)
-            log_embed.add_field(name="💼 Trabajo", value=JOB_ROLES[self.job_key]['name'], inline=True)
-            log_embed.add_field(name="📝 Razón de aceptación", value=modal.reason.value, inline=False)
-            log_embed.add_field(name="👮 Aprobado por", value=interaction.user.mention, inline=True)
-            await log_channel.send(embed=log_embed)
+        log_embed = create_embed(
+            title="📜 Postulación Aceptada",
+            description=f"Se ha aceptado una postulación al trabajo {JOB_ROLES[self.job_key]['name']}.",
+            color=Colors.SUCCESS,
+            user=interaction.user
+        )
+        log_embed.add_field(name="👤 Usuario", value=self.applicant.mention, inline=True)
+        log_embed.add_field(name="💼 Trabajo", value=JOB_ROLES[self.job_key]['name'], inline=True)
+        log_embed.add_field(name="📝 Razón de aceptación", value=modal.reason.value, inline=False)
+        log_embed.add_field(name="👮 Aprobado por", value=interaction.user.mention, inline=True)
+        send_log(Channels.SANCTION_LOGS, log_embed)
 
         await modal.interaction.followup.send(embed=create_embed(
             title="✅ Acción Completada",
@@ -3025,19 +6743,17 @@ class JobApplicationView(ui.View):
             ), ephemeral=True)
 
         # Send log to sanction logs
-        log_channel = bot.get_channel(Channels.SANCTION_LOGS)
-        if log_channel:
-            log_embed = create_embed(
-                title="📜 Postulación Denegada",
-                description=f"Se ha denegado una postulación al trabajo {JOB_ROLES[self.job_key]['name']}.",
-                color=Colors.DANGER,
-                user=interaction.user
-            )
-            log_embed.add_field(name="👤 Usuario", value=self.applicant.mention, inline=True)
-            log_embed.add_field(name="💼 Trabajo", value=JOB_ROLES[self.job_key]['name'], inline=True)
-            log_embed.add_field(name="📝 Razón de denegación", value=modal.reason.value, inline=False)
-            log_embed.add_field(name="👮 Denegado por", value=interaction.user.mention, inline=True)
-            await log_channel.send(embed=log_embed)
+        log_embed = create_embed(
+            title="📜 Postulación Denegada",
+            description=f"Se ha denegado una postulación al trabajo {JOB_ROLES[self.job_key]['name']}.",
+            color=Colors.DANGER,
+            user=interaction.user
+        )
+        log_embed.add_field(name="👤 Usuario", value=self.applicant.mention, inline=True)
+        log_embed.add_field(name="💼 Trabajo", value=JOB_ROLES[self.job_key]['name'], inline=True)
+        log_embed.add_field(name="📝 Razón de denegación", value=modal.reason.value, inline=False)
+        log_embed.add_field(name="👮 Denegado por", value=interaction.user.mention, inline=True)
+        send_log(Channels.SANCTION_LOGS, log_embed)
 
         await modal.interaction.followup.send(embed=create_embed(
             title="✅ Acción Completada",
@@ -3115,35 +6831,44 @@ class JobApplicationView(ui.View):
         job_role = interaction.guild.get_role(JOB_ROLES[self.job_key]["role_id"])
         sueldo_role = interaction.guild.get_role(Roles.SUELDO)
         try:
-            await self.applicant.add_roles(job_role, sueldo_role, reason=f"Postulación aceptada por {interaction.user.name}")
+            skipped = await apply_member_changes(
+                self.applicant,
+                add_roles=[job_role, sueldo_role],
+                reason=f"Postulación aceptada por {interaction.user.name}"
+            )
         except Exception as e:
             print(f"Error al asignar roles: {e}")
+            skipped = ["roles"]
+        if skipped:
             await modal.interaction.followup.send(embed=create_embed(
                 title="❌ Error",
-                description="No se pudieron asignar los roles. Verifica los permisos del bot.",
+                description=f"No se pudieron asignar los roles ({', '.join(skipped)}). Verifica los permisos del bot.",
                 color=Colors.DANGER
             ), ephemeral=True)
             return
+        record_audit_event("postulacion_aceptada", interaction.user, self.applicant, job=self.job_key, reason=modal.reason.value)
 
-        # Send notification to job applications channel
+        # Anuncio en el canal de postulaciones; el DM al postulante va por la bandeja de salida
         job_channel = bot.get_channel(Channels.JOB_APPLICATIONS)
         if job_channel:
-            await job_channel.send(
-                content=f"🎉 {self.applicant.mention}, ¡tu postulación al trabajo **{JOB_ROLES[self.job_key]['name']}** ha sido **aceptada**! Se te ha asignado un sueldo de **550,000 CLP**.",
-                embed=create_embed(
-                    title="✅ Postulación Aceptada",
-                    description=(
-                        f"**Usuario:** {self.applicant.mention}\n"
-                        f"**Trabajo:** {JOB_ROLES[self.job_key]['name']}\n"
-                        f"**Razón de aceptación:** {modal.reason.value}\n"
-                        f"**Aprobado por:** {interaction.user.mention}"
-                    ),
-                    color=Colors.SUCCESS,
-                    user=interaction.user
+            try:
+                await job_channel.send(
+                    content=f"🎉 {self.applicant.mention}, ¡tu postulación al trabajo **{JOB_ROLES[self.job_key]['name']}** ha sido **aceptada**! Se te ha asignado un sueldo de **550,000 CLP**.",
+                    embed=create_embed(
+                        title="✅ Postulación Aceptada",
+                        description=(
+                            f"**Usuario:** {self.applicant.mention}\n"
+                            f"**Trabajo:** {JOB_ROLES[self.job_key]['name']}\n"
+                            f"**Razón de aceptación:** {modal.reason.value}\n"
+                            f"**Aprobado por:** {interaction.user.mention}"
+                        ),
+                        color=Colors.SUCCESS,
+                        user=interaction.user
+                    )
                 )
-            )
+            except discord.HTTPException as e:
+                print(f"Error al anunciar la postulación: {e}")
 
-        # Send DM to applicant
         dm_embed = create_embed(
             title="🎉 ¡Postulación Aceptada!",
             description=(
@@ -3155,29 +6880,20 @@ class JobApplicationView(ui.View):
             ),
             color=Colors.SUCCESS
         )
-        try:
-            await self.applicant.send(embed=dm_embed)
-        except discord.errors.Forbidden:
-            await modal.interaction.followup.send(embed=create_embed(
-                title="⚠️ Advertencia",
-                description=f"No se pudo enviar el mensaje directo a {self.applicant.mention}. Es posible que tenga los DMs cerrados.",
-                color=Colors.WARNING
-            ), ephemeral=True)
+        queue_dm(self.applicant, report_to=modal.interaction.followup, embed=dm_embed)
 
         # Send log to job logs channel (changed from SANCTION_LOGS to JOB_LOGS)
-        log_channel = bot.get_channel(Channels.JOB_LOGS)
-        if log_channel:
-            log_embed = create_embed(
-                title="📜 Postulación Aceptada",
-                description=f"Se ha aceptado una postulación al trabajo {JOB_ROLES[self.job_key]['name']}.",
-                color=Colors.SUCCESS,
-                user=interaction.user
-            )
-            log_embed.add_field(name="👤 Usuario", value=self.applicant.mention, inline=True)
-            log_embed.add_field(name="💼 Trabajo", value=JOB_ROLES[self.job_key]['name'], inline=True)
-            log_embed.add_field(name="📝 Razón de aceptación", value=modal.reason.value, inline=False)
-            log_embed.add_field(name="👮 Aprobado por", value=interaction.user.mention, inline=True)
-            await log_channel.send(embed=log_embed)
+        log_embed = create_embed(
+            title="📜 Postulación Aceptada",
+            description=f"Se ha aceptado una postulación al trabajo {JOB_ROLES[self.job_key]['name']}.",
+            color=Colors.SUCCESS,
+            user=interaction.user
+        )
+        log_embed.add_field(name="👤 Usuario", value=self.applicant.mention, inline=True)
+        log_embed.add_field(name="💼 Trabajo", value=JOB_ROLES[self.job_key]['name'], inline=True)
+        log_embed.add_field(name="📝 Razón de aceptación", value=modal.reason.value, inline=False)
+        log_embed.add_field(name="👮 Aprobado por", value=interaction.user.mention, inline=True)
+        send_log(Channels.JOB_LOGS, log_embed)
 
         await modal.interaction.followup.send(embed=create_embed(
             title="✅ Acción Completada",
@@ -3218,26 +6934,29 @@ class JobApplicationView(ui.View):
         self.children[0].disabled = True
         self.children[1].disabled = True
         await interaction.message.edit(embed=embed, view=self)
+        record_audit_event("postulacion_denegada", interaction.user, self.applicant, job=self.job_key, reason=modal.reason.value)
 
-        # Send notification to job applications channel
+        # Anuncio en el canal de postulaciones; el DM al postulante va por la bandeja de salida
         job_channel = bot.get_channel(Channels.JOB_APPLICATIONS)
         if job_channel:
-            await job_channel.send(
-                content=f"😔 {self.applicant.mention}, tu postulación al trabajo **{JOB_ROLES[self.job_key]['name']}** ha sido **denegada**.",
-                embed=create_embed(
-                    title="❌ Postulación Denegada",
-                    description=(
-                        f"**Usuario:** {self.applicant.mention}\n"
-                        f"**Trabajo:** {JOB_ROLES[self.job_key]['name']}\n"
-                        f"**Razón de denegación:** {modal.reason.value}\n"
-                        f"**Denegado por:** {interaction.user.mention}"
-                    ),
-                    color=Colors.DANGER,
-                    user=interaction.user
+            try:
+                await job_channel.send(
+                    content=f"😔 {self.applicant.mention}, tu postulación al trabajo **{JOB_ROLES[self.job_key]['name']}** ha sido **denegada**.",
+                    embed=create_embed(
+                        title="❌ Postulación Denegada",
+                        description=(
+                            f"**Usuario:** {self.applicant.mention}\n"
+                            f"**Trabajo:** {JOB_ROLES[self.job_key]['name']}\n"
+                            f"**Razón de denegación:** {modal.reason.value}\n"
+                            f"**Denegado por:** {interaction.user.mention}"
+                        ),
+                        color=Colors.DANGER,
+                        user=interaction.user
+                    )
                 )
-            )
+            except discord.HTTPException as e:
+                print(f"Error al anunciar la postulación: {e}")
 
-        # Send DM to applicant
         dm_embed = create_embed(
             title="😔 Postulación Denegada",
             description=(
@@ -3248,29 +6967,20 @@ class JobApplicationView(ui.View):
             ),
             color=Colors.DANGER
         )
-        try:
-            await self.applicant.send(embed=dm_embed)
-        except discord.errors.Forbidden:
-            await modal.interaction.followup.send(embed=create_embed(
-                title="⚠️ Advertencia",
-                description=f"No se pudo enviar el mensaje directo a {self.applicant.mention}. Es posible que tenga los DMs cerrados.",
-                color=Colors.WARNING
-            ), ephemeral=True)
+        queue_dm(self.applicant, report_to=modal.interaction.followup, embed=dm_embed)
 
         # Send log to job logs channel (changed from SANCTION_LOGS to JOB_LOGS)
-        log_channel = bot.get_channel(Channels.JOB_LOGS)
-        if log_channel:
-            log_embed = create_embed(
-                title="📜 Postulación Denegada",
-                description=f"Se ha denegado una postulación al trabajo {JOB_ROLES[self.job_key]['name']}.",
-                color=Colors.DANGER,
-                user=interaction.user
-            )
-            log_embed.add_field(name="👤 Usuario", value=self.applicant.mention, inline=True)
-            log_embed.add_field(name="💼 Trabajo", value=JOB_ROLES[self.job_key]['name'], inline=True)
-            log_embed.add_field(name="📝 Razón de denegación", value=modal.reason.value, inline=False)
-            log_embed.add_field(name="👮 Denegado por", value=interaction.user.mention, inline=True)
-            await log_channel.send(embed=log_embed)
+        log_embed = create_embed(
+            title="📜 Postulación Denegada",
+            description=f"Se ha denegado una postulación al trabajo {JOB_ROLES[self.job_key]['name']}.",
+            color=Colors.DANGER,
+            user=interaction.user
+        )
+        log_embed.add_field(name="👤 Usuario", value=self.applicant.mention, inline=True)
+        log_embed.add_field(name="💼 Trabajo", value=JOB_ROLES[self.job_key]['name'], inline=True)
+        log_embed.add_field(name="📝 Razón de denegación", value=modal.reason.value, inline=False)
+        log_embed.add_field(name="👮 Denegado por", value=interaction.user.mention, inline=True)
+        send_log(Channels.JOB_LOGS, log_embed)
 
         await modal.interaction.followup.send(embed=create_embed(
             title="✅ Acción Completada",
@@ -3359,44 +7069,143 @@ async def postular_trabajo(interaction: discord.Interaction, trabajo: str, razon
         return
 
     # Log to job logs channel (changed from SANCTION_LOGS to JOB_LOGS)
-    log_channel = bot.get_channel(Channels.JOB_LOGS)
-    if log_channel:
-        log_embed = create_embed(
-            title="📜 Nueva Postulación Registrada",
-            description=f"Se ha registrado una nueva postulación al trabajo {JOB_ROLES[trabajo]['name']}.",
-            color=Colors.WARNING,
-            user=interaction.user
-        )
-        log_embed.add_field(name="👤 Postulante", value=interaction.user.mention, inline=True)
-        log_embed.add_field(name="💼 Trabajo", value=JOB_ROLES[trabajo]['name'], inline=True)
-        log_embed.add_field(name="📝 Razón", value=razon, inline=False)
-        await log_channel.send(embed=log_embed)
+    log_embed = create_embed(
+        title="📜 Nueva Postulación Registrada",
+        description=f"Se ha registrado una nueva postulación al trabajo {JOB_ROLES[trabajo]['name']}.",
+        color=Colors.WARNING,
+        user=interaction.user
+    )
+    log_embed.add_field(name="👤 Postulante", value=interaction.user.mention, inline=True)
+    log_embed.add_field(name="💼 Trabajo", value=JOB_ROLES[trabajo]['name'], inline=True)
+    log_embed.add_field(name="📝 Razón", value=razon, inline=False)
+    send_log(Channels.JOB_LOGS, log_embed)
 
 # =============================================
 # ACTUALIZAR CANAL DE CONTEO DE USUARIOS
 # =============================================
+# El conteo de humanos se calcula una sola vez al iniciar y luego se ajusta con cada
+# entrada/salida, en vez de recorrer guild.members en cada evento. Discord solo permite
+# renombrar un canal 2 veces cada 10 minutos, así que los renombres se agrupan: se
+# espera un momento tras el último cambio y, si el presupuesto está agotado, se
+# aguarda a que se libere y se aplica el conteo más reciente.
+MEMBER_COUNT_RENAME_LIMIT = 2
+MEMBER_COUNT_RENAME_WINDOW = 600  # segundos
+MEMBER_COUNT_DEBOUNCE_SECONDS = float(os.getenv('MEMBER_COUNT_DEBOUNCE_SECONDS', 5))
+
+def member_count_channel_name(count: int) -> str:
+    return f"👥 Usuarios: {count}"
+
+class MemberCounter:
+    """Conteo de miembros humanos por servidor mantenido por eventos."""
+    def __init__(self):
+        self._counts = {}
+
+    def seed(self, guild: discord.Guild) -> int:
+        """Contar los humanos del servidor (recorrido completo, solo al iniciar)."""
+        self._counts[guild.id] = sum(1 for m in guild.members if not m.bot)
+        return self._counts[guild.id]
+
+    def adjust(self, guild: discord.Guild, delta: int):
+        if guild.id not in self._counts:
+            self.seed(guild)
+        else:
+            self._counts[guild.id] = max(0, self._counts[guild.id] + delta)
+
+    def get(self, guild_id: int):
+        return self._counts.get(guild_id)
+
+member_counter = MemberCounter()
+
+class ChannelRenameDebouncer:
+    """Renombra el canal de conteo respetando el límite de Discord.
+
+    Varias solicitudes seguidas se agrupan en un único renombre; la tarea vuelve a
+    leer el conteo justo antes de cada edición, por lo que siempre converge al último
+    valor aunque haya tenido que esperar a que se libere el presupuesto.
+    """
+    def __init__(self, guild_id: int, channel_id: int, debounce: float = MEMBER_COUNT_DEBOUNCE_SECONDS):
+        self.guild_id = guild_id
+        self.channel_id = channel_id
+        self.debounce = debounce
+        self._renames = deque()
+        self._applied_name = None
+        self._task = None
+
+    def request(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def _budget_wait(self) -> float:
+        """Segundos hasta poder renombrar otra vez (0 si queda presupuesto)."""
+        now = time.monotonic()
+        while self._renames and now - self._renames[0] >= MEMBER_COUNT_RENAME_WINDOW:
+            self._renames.popleft()
+        if len(self._renames) < MEMBER_COUNT_RENAME_LIMIT:
+            return 0
+        return MEMBER_COUNT_RENAME_WINDOW - (now - self._renames[0])
+
+    async def _run(self):
+        await asyncio.sleep(self.debounce)
+        while True:
+            guild = bot.get_guild(self.guild_id)
+            channel = guild.get_channel(self.channel_id) if guild else None
+            count = member_counter.get(self.guild_id)
+            if channel is None or count is None:
+                return
+            nuevo_nombre = member_count_channel_name(count)
+            # channel.edit() no actualiza el canal en caché hasta que llega el evento del
+            # gateway: se compara con el último nombre aplicado por este debouncer
+            if (self._applied_name or channel.name) == nuevo_nombre:
+                return
+            wait = self._budget_wait()
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            self._renames.append(time.monotonic())
+            try:
+                await channel.edit(name=nuevo_nombre)
+            except discord.HTTPException as e:
+                print(f"Error al actualizar el nombre del canal: {e}")
+                return
+            self._applied_name = nuevo_nombre
+
+rename_debouncers = {}
+
+def actualizar_canal_conteo_miembros(guild: discord.Guild):
+    """Programar el renombre del canal de conteo con el valor actual del contador."""
+    debouncer = rename_debouncers.get(guild.id)
+    if debouncer is None:
+        debouncer = rename_debouncers[guild.id] = ChannelRenameDebouncer(guild.id, Channels.MEMBER_COUNT)
+    debouncer.request()
+
 @bot.event
 async def on_member_join(member):
+    get_member_name_index(member.guild).add(member)
     if member.bot:
         return
-    await actualizar_canal_conteo_miembros(member.guild)
+    member_counter.adjust(member.guild, +1)
+    actualizar_canal_conteo_miembros(member.guild)
 
 @bot.event
 async def on_member_remove(member):
+    get_member_name_index(member.guild).remove(member.id)
     if member.bot:
         return
-    await actualizar_canal_conteo_miembros(member.guild)
-
-async def actualizar_canal_conteo_miembros(guild):
-    canal_id = 1367394876479766580  # ID del canal a actualizar
-    canal = guild.get_channel(canal_id)
-    if canal:
-        conteo = sum(1 for m in guild.members if not m.bot)
-        nuevo_nombre = f"👥 Usuarios: {conteo}"
-        try:
-            await canal.edit(name=nuevo_nombre)
-        except Exception as e:
-            print(f"Error al actualizar el nombre del canal: {e}")
+    member_counter.adjust(member.guild, -1)
+    actualizar_canal_conteo_miembros(member.guild)
+
+@bot.event
+async def on_member_update(before, after):
+    # Cambios de apodo: reindexar el nombre visible
+    get_member_name_index(after.guild).add(after)
+
+@bot.event
+async def on_user_update(before, after):
+    # Cambios de usuario o nombre global: afectan a todos los servidores compartidos
+    for guild in after.mutual_guilds:
+        member = guild.get_member(after.id)
+        if member is not None:
+            get_member_name_index(guild).add(member)
 
 # =============================================
 # INICIAR BOT
@@ -3409,13 +7218,71 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Bot de Discord para Santiago RP')
     parser.add_argument('--port', type=int, default=int(os.environ.get("PORT", 8080)),
                         help='Puerto en el que escuchar (por defecto: 8080)')
+    parser.add_argument('--check-db', action='store_true',
+                        help='Aplicar migraciones, verificar los planes de consulta y salir')
+    parser.add_argument('--backup', action='store_true',
+                        help='Crear una copia de seguridad comprimida de la base de datos y salir')
+    parser.add_argument('--exportar', nargs=2, metavar=('TABLA', 'ARCHIVO'),
+                        help='Exportar sanciones o calificaciones a un archivo .csv/.jsonl y salir')
+    parser.add_argument('--importar', nargs=2, metavar=('TABLA', 'ARCHIVO'),
+                        help='Importar sanciones o calificaciones desde un archivo .csv/.jsonl y salir')
     args = parser.parse_args()
     
+    # Inicializar base de datos (migraciones pendientes) antes de arrancar
+    init_db()
+    if args.check_db:
+        if DB_BACKEND != 'sqlite':
+            print("ℹ️ La verificación de planes de consulta solo aplica a SQLite.")
+            raise SystemExit(0)
+        assert_query_plans()
+        print("✅ Las consultas frecuentes usan índices.")
+        raise SystemExit(0)
+    if args.backup:
+        try:
+            backup_database()
+        finally:
+            shutdown_db()
+        raise SystemExit(0)
+    if args.exportar:
+        try:
+            total = asyncio.run(export_table_async(*args.exportar))
+            print(f"✅ {total} filas exportadas a {args.exportar[1]}.")
+        finally:
+            shutdown_db()
+        raise SystemExit(0)
+    if args.importar:
+        try:
+            read, inserted = asyncio.run(import_table_async(*args.importar))
+            print(f"✅ {read} filas leídas, {inserted} nuevas, {read - inserted} omitidas.")
+        finally:
+            shutdown_db()
+        raise SystemExit(0)
+    
     # Configurar un servidor web simple para mantener el bot activo
     from http.server import HTTPServer, BaseHTTPRequestHandler
     
     class SimpleHandler(BaseHTTPRequestHandler):
         def do_GET(self):
+            if self.path == '/health':
+                body = json.dumps({
+                    "status": "ok",
+                    "bot_ready": bot.is_ready(),
+                    "backup": BACKUP_STATUS,
+                    "dm_outbox": dm_outbox.status(),
+                    "profile_cache": profile_cache.stats(),
+                }).encode()
+                self.send_response(200)
+                self.send_header('Content-type', 'application/json')
+                self.end_headers()
+                self.wfile.write(body)
+                return
+            if self.path == '/metrics':
+                body = (query_stats.render_prometheus() + profile_cache.render_prometheus()).encode()
+                self.send_response(200)
+                self.send_header('Content-type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.end_headers()
+                self.wfile.write(body)
+                return
             self.send_response(200)
             self.send_header('Content-type', 'text/html')
             self.end_headers()
@@ -3434,4 +7301,7 @@ if __name__ == "__main__":
     server_thread.start()
     
     # Iniciar el bot
-    bot.run(TOKEN)
+    try:
+        bot.run(TOKEN)
+    finally:
+        shutdown_db()
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# main.py crea el repositorio global al importarse: apuntarlo a una base en memoria
+# para que las pruebas nunca abran santiago_rp.db
+os.environ["DB_BACKEND"] = "sqlite"
+os.environ["DB_PATH"] = "file:santiago_rp_pruebas?mode=memory&cache=shared"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
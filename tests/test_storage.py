@@ -0,0 +1,232 @@
+"""Contrato de StorageRepository: las mismas pruebas se ejecutan contra cada backend.
+
+SQLite usa una base en memoria compartida por las conexiones del pool. MySQL solo se
+prueba si MYSQL_TEST_DATABASE apunta a una base desechable (se borran sus tablas).
+"""
+import json
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import main
+
+BASE_DATE = datetime(2025, 3, 10, 12, 0, tzinfo=timezone.utc)
+
+@pytest.fixture(params=["sqlite", "mysql"])
+def repo(request, monkeypatch):
+    if request.param == "sqlite":
+        pool = main.SQLiteConnectionPool(size=3, path=f"file:prueba_{uuid.uuid4().hex}?mode=memory&cache=shared")
+        monkeypatch.setattr(main, "db_pool", pool)
+        repository = main.SQLiteRepository()
+    else:
+        database = os.getenv("MYSQL_TEST_DATABASE")
+        if not database:
+            pytest.skip("MYSQL_TEST_DATABASE no está definido")
+        repository = main.MySQLRepository(main.MySQLConnectionPool(
+            size=2,
+            host=main.MYSQL_HOST,
+            port=main.MYSQL_PORT,
+            user=main.MYSQL_USER,
+            password=main.MYSQL_PASSWORD,
+            database=database
+        ))
+        with repository.transaction() as cursor:
+            cursor.execute("SHOW TABLES")
+            for row in cursor.fetchall():
+                cursor.execute(f"DROP TABLE `{next(iter(row.values()))}`")
+    repository.initialize()
+    yield repository
+    repository.close()
+
+def sanction_row(user_id: int, minutes: int, active: int = 1, reason: str = "VDM en la plaza") -> tuple:
+    return (main.record_ids.next_id(), user_id, "usuario", reason, "Advertencia 1", "https://prueba",
+            99, "admin", BASE_DATE + timedelta(minutes=minutes), active)
+
+def rating_row(staff_id: int, rating: int, week_key: int, comment: str = "Muy buena atención") -> tuple:
+    return (main.record_ids.next_id(), staff_id, f"staff{staff_id}", rating, comment, 7, "usuario", BASE_DATE, week_key)
+
+def test_incomplete_backend_fails_on_instantiation():
+    class Incompleto(main.StorageRepository):
+        def initialize(self):
+            pass
+
+    with pytest.raises(TypeError):
+        Incompleto()
+
+def test_count_result_rows():
+    assert main.count_result_rows((1,), [("a",), ("b",)]) == 2
+    assert main.count_result_rows((1,), 7) == 7
+    assert main.count_result_rows((1,), 0) == 0
+    assert main.count_result_rows(([(1,), (2,), (3,)],), None) == 3
+    assert main.count_result_rows((1,), {"total": 4}) == 1
+    assert main.count_result_rows((1,), None) == 0
+
+def test_profile_cache_counts_evictions():
+    cache = main.ModerationProfileCache(max_users=1)
+    for user_id in (1, 2):
+        cache.put(user_id, {"sanctions": [], "warnings": 0}, cache.load_token())
+    assert cache.get(1) is None and cache.get(2) is not None
+    assert cache.stats() == {"hits": 1, "misses": 1, "evictions": 1, "size": 1}
+    assert "santiago_profile_cache_evictions_total 1\n" in cache.render_prometheus()
+
+def test_state_roundtrip_and_compare_and_set(repo):
+    repo.set_state("clave", 5)
+    assert repo.get_state("clave") == 5
+    assert repo.get_state("inexistente") is None
+    assert repo.compare_and_set_state("clave", 5, 6)
+    assert not repo.compare_and_set_state("clave", 5, 7)
+    assert repo.get_state("clave") == 6
+    assert repo.get_state("active_rating_week") is not None
+
+def test_sanctions_active_pages_and_deactivate(repo):
+    rows = [sanction_row(1, minutes) for minutes in range(5)] + [sanction_row(2, 0)]
+    repo.insert_sanctions(rows)
+
+    active = repo.load_active_sanctions(1)
+    assert [s[0] for s in active] == [row[0] for row in reversed(rows[:5])]
+    assert active[0][5] == BASE_DATE + timedelta(minutes=4)
+
+    first = repo.sanctions_page(1, True, main.FIRST_PAGE_CURSOR, 2)
+    second = repo.sanctions_page(1, True, (main.to_epoch_ms(first[-1][5]), first[-1][0]), 2)
+    assert [s[0] for s in first + second] == [s[0] for s in active[:4]]
+
+    assert repo.deactivate_sanctions(1) == 5
+    assert repo.load_active_sanctions(1) == []
+    assert len(repo.sanctions_page(1, False, main.FIRST_PAGE_CURSOR, 10)) == 5
+    assert repo.max_record_id("sanciones", "sanction_id") == rows[-1][0]
+
+def test_find_sanction_by_id_and_legacy_id(repo):
+    row = sanction_row(3, 0)
+    repo.insert_sanctions([row])
+    found = repo.find_sanction(sanction_id=row[0])
+    assert found["user_id"] == 3
+    assert found["date"] == row[8]
+    assert repo.find_sanction(sanction_id=row[0] + 1) is None
+
+    legacy = sanction_row(3, 1) + (str(uuid.uuid4()),)
+    columns = main.EXPORT_COLUMNS["sanciones"]
+    assert repo.insert_missing_rows("sanciones", columns, [legacy]) == [legacy]
+    assert repo.insert_missing_rows("sanciones", columns, [legacy]) == []
+    assert repo.find_sanction(legacy_id=legacy[-1])["sanction_id"] == legacy[0]
+
+def test_get_sanction_by_public_code_and_legacy_uuid(repo, monkeypatch):
+    monkeypatch.setattr(main, "storage", repo)
+    row = sanction_row(8, 0)
+    legacy = sanction_row(8, 1) + (str(uuid.uuid4()),)
+    repo.insert_sanctions([row])
+    repo.insert_missing_rows("sanciones", main.EXPORT_COLUMNS["sanciones"], [legacy])
+
+    code = main.format_public_id(row[0])
+    assert main.get_sanction_by_code(code)["sanction_id"] == row[0]
+    assert main.get_sanction_by_code(f" {code.lower()} ")["sanction_id"] == row[0]
+    assert main.get_sanction_by_code(legacy[-1].upper())["sanction_id"] == legacy[0]
+    assert main.get_sanction_by_code(main.format_public_id(legacy[0] + 1)) is None
+    with pytest.raises(ValueError):
+        main.get_sanction_by_code("no-es-un-código")
+
+def test_warnings(repo):
+    for _ in range(3):
+        repo.insert_warning((main.record_ids.next_id(), 4, "usuario", "spam", None, 99, "admin", BASE_DATE))
+    assert repo.count_warnings(4) == 3
+    assert repo.count_warnings(5) == 0
+
+def test_ratings_aggregates_trend_and_purge(repo):
+    repo.insert_ratings([rating_row(10, 5, 202510), rating_row(10, 4, 202510), rating_row(10, 3, 202510),
+                         rating_row(11, 2, 202510), rating_row(10, 1, 202509)])
+
+    assert repo.top_staff(202510, 3, 5) == [(10, "staff10", 4.0, 3)]
+    assert repo.top_staff(202510, 1, 5)[1] == (11, "staff11", 2.0, 1)
+    stats = repo.staff_stats(202510, 10)
+    assert (stats["rating_sum"], stats["rating_count"], stats["stars_5"], stats["stars_1"]) == (12, 3, 1, 0)
+    assert repo.staff_trend(10, 202509) == [(202509, 1.0, 1), (202510, 4.0, 3)]
+
+    assert repo.purge_ratings_before(202510) == 1
+    assert repo.staff_trend(10, 202509) == [(202510, 4.0, 3)]
+
+def test_imported_ratings_update_aggregates(repo):
+    row = rating_row(12, 4, 202511) + (None,)
+    columns = main.EXPORT_COLUMNS["calificaciones"]
+    assert repo.insert_missing_rows("calificaciones", columns, [row]) == [row]
+    assert repo.staff_stats(202511, 12)["rating_count"] == 1
+    batches = list(repo.iter_table_batches("calificaciones", columns, 10))
+    assert [tuple(r)[0] for batch in batches for r in batch] == [row[0]]
+    assert tuple(batches[0][0])[7] == BASE_DATE
+
+def test_search_ranks_matches(repo):
+    repo.insert_sanctions([sanction_row(6, 0, reason="Robo sin rol"), sanction_row(6, 1, reason="VDM reiterado")])
+    rows = repo.search("sanciones", "vdm", 0, 100, 10, 0)
+    assert [row["reason"] for row in rows] == ["VDM reiterado"]
+    assert repo.search("sanciones", "inexistente", 0, 100, 10, 0) == []
+
+def test_ticket_lifecycle(repo):
+    first_id, second_id = main.record_ids.next_id(), main.record_ids.next_id()
+    assert repo.open_ticket(first_id, "reports", 20, "usuario", "{}", BASE_DATE) == 1
+    assert repo.open_ticket(second_id, "reports", 21, "usuario", "{}", BASE_DATE) == 2
+    assert repo.open_ticket(main.record_ids.next_id(), "appeals", 22, "usuario", "{}", BASE_DATE) == 1
+
+    repo.set_ticket_channel(first_id, 500)
+    assert repo.get_ticket(500)["created_at"] == BASE_DATE
+    assert repo.get_ticket(501) is None
+
+    assert repo.claim_ticket(500, 30, BASE_DATE)
+    assert not repo.claim_ticket(500, 31, BASE_DATE)
+    repo.add_ticket_participant(500, 40)
+    repo.add_ticket_participant(500, 40)
+    assert json.loads(repo.get_ticket(500)["participants"]) == [40]
+
+    repo.close_ticket(first_id, "closed", 30, "resuelto", BASE_DATE + timedelta(hours=1))
+    ticket = repo.get_ticket(500)
+    assert (ticket["status"], ticket["claimed_by"], ticket["closed_at"]) == ("closed", 30, BASE_DATE + timedelta(hours=1))
+
+def test_audit_events_by_actor_and_target(repo):
+    rows = [(main.record_ids.next_id(), BASE_DATE + timedelta(minutes=i), 50, 60 + i % 2, "sancion", "{}") for i in range(4)]
+    repo.insert_audit_events(rows)
+    by_actor = repo.audit_events("actor", 50, BASE_DATE + timedelta(minutes=1), 10)
+    assert [event[0] for event in by_actor] == [row[0] for row in reversed(rows[1:])]
+    assert by_actor[0][1] == rows[-1][1]
+    by_target = repo.audit_events("target", 61, BASE_DATE, 1)
+    assert [event[0] for event in by_target] == [rows[3][0]]
+
+def test_scheduled_actions(repo):
+    later = (main.record_ids.next_id(), BASE_DATE + timedelta(seconds=30), "borrar_mensaje", '{"message_id": 2}')
+    sooner = (main.record_ids.next_id(), BASE_DATE, "borrar_mensaje", '{"message_id": 1}')
+    repo.insert_scheduled_actions([later, sooner])
+    assert repo.pending_scheduled_actions() == [sooner, later]
+    repo.delete_scheduled_action(sooner[0])
+    assert repo.pending_scheduled_actions() == [later]
+
+def test_seed_ticket_counters_never_lowers(repo):
+    repo.seed_ticket_counters({"reports": 7, "appeals": 2})
+    assert repo.open_ticket(main.record_ids.next_id(), "reports", 20, "usuario", "{}", BASE_DATE) == 8
+    repo.seed_ticket_counters({"reports": 3})
+    assert repo.open_ticket(main.record_ids.next_id(), "reports", 20, "usuario", "{}", BASE_DATE) == 9
+    assert repo.open_ticket(main.record_ids.next_id(), "appeals", 20, "usuario", "{}", BASE_DATE) == 3
+
+class FakeConnection:
+    def __init__(self, alive=True):
+        self.alive = alive
+        self.closed = False
+
+    def ping(self, reconnect=False):
+        if not self.alive:
+            raise main.pymysql.err.OperationalError(2006, "MySQL server has gone away")
+
+    def close(self):
+        self.closed = True
+
+def test_mysql_pool_drops_connections_that_fail_ping():
+    pool = main.MySQLConnectionPool(size=1)
+    dead = FakeConnection(alive=False)
+    pool._idle.put(dead)
+    pool._created = 1
+    with pytest.raises(main.pymysql.err.OperationalError):
+        pool._acquire()
+    assert dead.closed and pool._created == 0
+
+def test_mysql_pool_times_out_when_exhausted():
+    pool = main.MySQLConnectionPool(size=1, acquire_timeout=0.01)
+    pool._created = 1
+    with pytest.raises(main.pymysql.err.OperationalError):
+        pool._acquire()